@@ -0,0 +1,42 @@
+'''
+Microbenchmarks of the vectorized geodesic helpers (urbanworm.utils.geo)
+against the scalar versions in urbanworm.utils.utils.
+
+    python benchmarks/bench_geo.py [n]
+'''
+import sys
+import timeit
+
+import numpy as np
+
+from urbanworm.utils import geo
+from urbanworm.utils.utils import calculate_bearing, haversine_m, is_coordinate_in_bbox
+
+
+def main(n: int = 10_000, repeat: int = 5) -> None:
+    rng = np.random.default_rng(0)
+    lat0, lon0 = 42.281, -83.743
+    lats = lat0 + rng.uniform(-0.01, 0.01, n)
+    lons = lon0 + rng.uniform(-0.01, 0.01, n)
+    bounds = (lon0 - 0.005, lat0 - 0.005, lon0 + 0.005, lat0 + 0.005)
+    lat_list, lon_list = lats.tolist(), lons.tolist()
+
+    cases = {
+        'haversine': (lambda: [haversine_m(lat0, lon0, a, b) for a, b in zip(lat_list, lon_list)],
+                      lambda: geo.haversine(lat0, lon0, lats, lons)),
+        'bearing': (lambda: [calculate_bearing(a, b, lat0, lon0) for a, b in zip(lat_list, lon_list)],
+                    lambda: geo.bearing(lats, lons, lat0, lon0)),
+        'in_bbox': (lambda: [is_coordinate_in_bbox(b, a, bounds) for a, b in zip(lat_list, lon_list)],
+                    lambda: geo.in_bbox(lons, lats, bounds)),
+    }
+    print(f'{n} points, best of {repeat}')
+    print(f'{"":<10}{"scalar (ms)":>14}{"vectorized (ms)":>18}{"speedup":>10}')
+    for name, (scalar, vectorized) in cases.items():
+        assert np.allclose(np.asarray(scalar(), dtype=float), vectorized())
+        t_scalar = min(timeit.repeat(scalar, number=1, repeat=repeat)) * 1000
+        t_vector = min(timeit.repeat(vectorized, number=1, repeat=repeat)) * 1000
+        print(f'{name:<10}{t_scalar:>14.2f}{t_vector:>18.3f}{t_scalar / t_vector:>9.0f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,81 @@
+import base64
+import os
+
+import cv2
+import numpy as np
+
+from urbanworm.utils.blob_store import BlobRef, BlobStore
+
+
+def test_blob_store_handles_and_index(tmp_path):
+    path = str(tmp_path / 'svi.pack')
+    store = BlobStore(path)
+    a = store.put(b'first image', key='a')
+    b = store.put(b'second')
+    assert store.put(b'ignored, same key', key='a').offset == a.offset
+    assert a.read() == b'first image' and b.read() == b'second'
+    assert b.key == b.digest and len(store) == 2
+    store.close()
+
+    # the next run finds the images through the index
+    other = BlobStore(path)
+    assert other.ref('a').read() == b'first image'
+    assert other.ref('missing') is None
+    other.close()
+
+
+def test_temporary_blob_store_is_removed():
+    store = BlobStore()
+    ref = store.put(b'x' * 10)
+    assert ref.to_base64() == base64.b64encode(b'x' * 10).decode('utf-8')
+    path = store.path
+    store.close()
+    assert not os.path.exists(path)
+
+
+def test_blob_refs_in_backends():
+    from urbanworm.inference.cache import _media_digest
+    from urbanworm.inference.checkpoint import Checkpoint
+    from urbanworm.utils.utils import image2temp
+
+    store = BlobStore()
+    raw = cv2.imencode('.jpg', np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+    ref = store.put(raw)
+    # same cache key as the base64 string of the image, and a checkpoint key stable across runs
+    assert _media_digest(ref) == _media_digest(base64.b64encode(raw).decode('utf-8'))
+    assert Checkpoint.item_key(ref) == Checkpoint.item_key(BlobRef(store, 'other', 0, 0, ref.digest))
+    tmp = image2temp(ref)
+    try:
+        assert tmp.endswith('.jpg')
+        with open(tmp, 'rb') as f:
+            assert f.read() == raw
+    finally:
+        os.remove(tmp)
+    store.close()
+
+
+def test_getsv_writes_views_to_blob_store(monkeypatch, tmp_path):
+    from urbanworm import dataset
+
+    renders = []
+
+    class Panos:
+        def get_image(self, *args):
+            renders.append(args)
+            return np.full((256, 512, 3), 100, np.uint8)
+
+    monkeypatch.setattr(dataset, 'get_pano_store', lambda: Panos())
+    candidates = [{'id': 'p1', 'sequence': 's1', 'captured_at': 1690000000000, 'computed_compass_angle': 90.0,
+                   'thumb_original_url': 'https://img/p1',
+                   'computed_geometry': {'type': 'Point', 'coordinates': [-83.7430, 42.2810]}}]
+    store = BlobStore(str(tmp_path / 'svi.pack'))
+    kwargs = dict(loc_id=1, pano=True, reoriented=True, height=32, width=48, image_format='jpeg',
+                  candidates=candidates, blob_store=store)
+    svis, df = dataset.getSV([-83.7429, 42.2811], **kwargs)
+    assert isinstance(svis[0], BlobRef) and svis[0].read()[:2] == b'\xff\xd8'
+    assert df['id'].tolist() == ['p1']
+
+    # the view is already stored: the pano is not decoded again
+    again, _ = dataset.getSV([-83.7429, 42.2811], **kwargs)
+    assert again[0].offset == svis[0].offset and len(renders) == 1
+    store.close()
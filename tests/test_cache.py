@@ -0,0 +1,17 @@
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    from urbanworm.inference.cache import ResponseCache
+
+    cache = ResponseCache(str(tmp_path / "c.sqlite"), max_size_mb=None, max_entries=2)
+    keys = [ResponseCache.make_key(model="m", prompt=p, temp=0.0) for p in ("a", "b", "c")]
+    assert len(set(keys)) == 3
+
+    cache.put(keys[0], '{"responses": []}')
+    cache.put(keys[1], '{"responses": []}')
+    assert cache.get(keys[0]) is not None  # keys[1] is now the least recently used
+    cache.put(keys[2], '{"responses": []}')
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert cache.stats()["entries"] == 2
+    assert (cache.hits, cache.misses) == (3, 1)
@@ -0,0 +1,133 @@
+import time
+
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import Point
+
+from urbanworm import dataset
+from urbanworm.dataset import GeoTaggedData
+
+
+def _units(n):
+    return gpd.GeoDataFrame({'uid': [f'u{i}' for i in range(n)]},
+                            geometry=[Point(-83.74 + i * 0.001, 42.28) for i in range(n)], crs='EPSG:4326')
+
+
+def _svi_records(loc_id, location):
+    # 0 to 2 images per location
+    n = int(round(location[0] * 1000)) % 3
+    return {'id': [f'{loc_id}_{j}' for j in range(n)], 'image_lon': [location[0]] * n,
+            'url': [f'https://img/{loc_id}_{j}' for j in range(n)], 'loc_id': [loc_id] * n}
+
+
+def test_svi_metadata_matches_per_location_frames(monkeypatch):
+    def fake_getSV(location, loc_id, *args, output_columns=False, **kwargs):
+        records = _svi_records(loc_id, location)
+        if len(records['id']) == 0:
+            return None, None
+        return records['url'], records if output_columns else pd.DataFrame(records)
+
+    monkeypatch.setattr(dataset, 'getSV', fake_getSV)
+    data = GeoTaggedData(units=_units(12))
+    data.get_svi_from_locations(id_column='uid', key='k')
+
+    # what concatenating one dataframe per location gave
+    frames = [pd.DataFrame(_svi_records(u, [p.x, p.y])) for u, p in zip(data.units['uid'], data.units.geometry)]
+    expected = pd.concat([f for f in frames if len(f) > 0]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(data.svi_metadata, expected)
+    assert data.svis['loc_id'] == expected['loc_id'].tolist()
+    assert data.svis['data'] == expected['url'].tolist()
+
+
+
+def test_svi_bboxes_are_computed_once_by_the_collector(monkeypatch):
+    from urbanworm.utils.utils import projection
+
+    bboxes = {}
+
+    def fake_getSV(location, loc_id, *args, bbox=None, **kwargs):
+        bboxes[loc_id] = ','.join(str(v) for v in bbox)
+        return None, None
+
+    def no_projection(*args, **kwargs):
+        raise AssertionError('unexpected projection')
+
+    monkeypatch.setattr(dataset, 'getSV', fake_getSV)
+    monkeypatch.setattr(dataset, 'projection', no_projection)
+    data = GeoTaggedData(units=_units(3))
+    data.get_svi_from_locations(id_column='uid', key='k', distance=40)
+    assert bboxes == {u: projection([p.x, p.y], r=40) for u, p in zip(data.units['uid'], data.units.geometry)}
+
+def test_nearest_columns_match_the_dataframe_path():
+    results = [{'loc_id': 1, 'id': str(i), 'distance_m': d, 'previews': p}
+               for i, (d, p) in enumerate([(30.0, {'preview-hq-mp3': 'a'}), (None, None), (10.0, {'preview-hq-mp3': 'b'}),
+                                           (20.0, {'preview-hq-mp3': 'c', 'preview-lq-mp3': 'd'})])]
+    df = pd.DataFrame(results).sort_values(by='distance_m', ascending=True)
+    previews = df['previews'].apply(pd.Series)
+    expected = pd.concat([df.drop('previews', axis=1), previews], axis=1).head(3).reset_index(drop=True)
+    got = pd.DataFrame(dataset._nearest_columns(results, 3, expand='previews'))
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+    assert dataset._nearest_columns([], 3) is None
+
+
+def test_columns_fill_missing_fields():
+    metadata = dataset._Columns()
+    metadata.extend({'id': [1, 2], 'a': ['x', 'y']})
+    metadata.extend({'id': [3], 'b': [True]})
+    expected = pd.concat([pd.DataFrame({'id': [1, 2], 'a': ['x', 'y']}), pd.DataFrame({'id': [3], 'b': [True]})])
+    pd.testing.assert_frame_equal(metadata.to_frame(), expected.reset_index(drop=True), check_dtype=False)
+    assert dataset._Columns().to_frame() is None
+
+
+def _flaky(loc_id):
+    # later units finish first; some locations have no data, some fail
+    i = int(loc_id[1:])
+    time.sleep(0.002 * (12 - i))
+    if i % 5 == 3:
+        raise RuntimeError('request failed')
+    return i % 4 == 1
+
+
+def _collect(monkeypatch, workers, capsys):
+    def fake_getSV(location, loc_id, *args, output_columns=False, **kwargs):
+        if _flaky(loc_id):
+            return None, None
+        records = {'id': [f'{loc_id}_a', f'{loc_id}_b'], 'loc_id': [loc_id] * 2}
+        return [f'img_{loc_id}_a', f'img_{loc_id}_b'], records
+
+    def fake_getPhoto(location, loc_id, *args, **kwargs):
+        if _flaky(loc_id):
+            return None
+        return {'id': [f'p_{loc_id}'], 'url': [f'https://photo/{loc_id}'], 'loc_id': [loc_id]}
+
+    def fake_getSound(location, loc_id, *args, **kwargs):
+        if _flaky(loc_id):
+            return None
+        return {'id': [f's_{loc_id}'], 'preview-hq-mp3': [f'https://sound/{loc_id}'], 'loc_id': [loc_id]}
+
+    monkeypatch.setattr(dataset, 'getSV', fake_getSV)
+    monkeypatch.setattr(dataset, 'getPhoto', fake_getPhoto)
+    monkeypatch.setattr(dataset, 'getSound', fake_getSound)
+    data = GeoTaggedData(units=_units(12))
+    capsys.readouterr()
+    data.get_svi_from_locations(id_column='uid', key='k', workers=workers)
+    data.get_photo_from_location(id_column='uid', key='k', exclude_personal_photo=False, workers=workers)
+    data.get_sound_from_location(id_column='uid', key='k', workers=workers)
+    return data, capsys.readouterr().out
+
+
+def test_collectors_with_workers_keep_unit_order(monkeypatch, capsys):
+    serial, serial_out = _collect(monkeypatch, 1, capsys)
+    parallel, parallel_out = _collect(monkeypatch, 4, capsys)
+
+    kept = [f'u{i}' for i in range(12) if i % 5 != 3 and i % 4 != 1]
+    assert parallel.svis['loc_id'] == [u for u in kept for _ in range(2)]
+    assert parallel.photos['loc_id'] == kept and parallel.audios['loc_id'] == kept
+    for name in ('svis', 'photos', 'audios'):
+        for column in ('loc_id', 'id', 'data'):
+            assert getattr(parallel, name)[column] == getattr(serial, name)[column]
+    for name in ('svi_metadata', 'photo_metadata', 'audio_metadata'):
+        pd.testing.assert_frame_equal(getattr(parallel, name), getattr(serial, name))
+    # same skip counts (printed once per collector)
+    assert parallel_out == serial_out
+    assert serial_out.count(f'skipped {12 - len(kept)} locations') == 3
@@ -0,0 +1,45 @@
+import numpy as np
+from pyproj import Transformer
+
+from urbanworm.utils import geo
+from urbanworm.utils.utils import lonlat_to_utm_epsg, projection
+
+
+def _scalar_bbox(lon, lat, r):
+    # the original per-location projection, with new Transformers for every call
+    epsg = lonlat_to_utm_epsg(lon, lat)
+    x, y = Transformer.from_crs("EPSG:4326", f"EPSG:{epsg}", always_xy=True).transform(lon, lat)
+    back = Transformer.from_crs(f"EPSG:{epsg}", "EPSG:4326", always_xy=True)
+    return (*back.transform(x - r, y - r), *back.transform(x + r, y + r))
+
+
+def test_vectorized_bboxes_match_scalar_projection():
+    # points in several UTM zones and both hemispheres
+    lons = np.array([-83.743, -83.70, 2.35, 151.21, -46.63])
+    lats = np.array([42.281, 42.30, 48.86, -33.87, -23.55])
+    out = geo.bboxes(lons, lats, 50)
+    expected = np.array([_scalar_bbox(lon, lat, 50) for lon, lat in zip(lons, lats)])
+    assert np.allclose(out, expected, atol=1e-9)
+
+    assert np.array_equal(geo.utm_epsg(lons, lats), [lonlat_to_utm_epsg(a, b) for a, b in zip(lons, lats)])
+    assert projection([-83.743, 42.281], 50) == ','.join(str(v) for v in expected[0])
+
+
+def test_vectorized_geodesic_helpers_match_scalar_versions():
+    from urbanworm.utils.utils import calculate_bearing, haversine_m, is_coordinate_in_bbox
+
+    rng = np.random.default_rng(1)
+    lats = 42.28 + rng.uniform(-0.01, 0.01, 50)
+    lons = -83.74 + rng.uniform(-0.01, 0.01, 50)
+    bounds = (-83.745, 42.275, -83.735, 42.285)
+
+    assert np.allclose(geo.haversine(42.28, -83.74, lats, lons),
+                       [haversine_m(42.28, -83.74, a, b) for a, b in zip(lats, lons)])
+    assert np.allclose(geo.bearing(lats, lons, 42.28, -83.74),
+                       [calculate_bearing(a, b, 42.28, -83.74) for a, b in zip(lats, lons)])
+    assert geo.in_bbox(lons, lats, bounds).tolist() == [is_coordinate_in_bbox(b, a, bounds) for a, b in zip(lats, lons)]
+
+    # missing coordinates (e.g. photos without geotag) are neither inside nor measurable
+    values = geo.to_float_array(['42.28', None, '', 42.29])
+    assert np.isnan(values[[1, 2]]).all()
+    assert not geo.in_bbox([np.nan], [np.nan], bounds)[0]
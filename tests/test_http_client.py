@@ -0,0 +1,66 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def test_retries_honor_retry_after_and_stop_on_client_errors():
+    from urbanworm.utils import http_client
+
+    hits = {'/limited': 0, '/missing': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            hits[self.path] += 1
+            if self.path == '/limited' and hits[self.path] == 1:
+                code, headers = 429, {'Retry-After': '0'}
+            elif self.path == '/missing':
+                code, headers = 404, {}
+            else:
+                code, headers = 200, {}
+            self.send_response(code)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{httpd.server_address[1]}'
+    try:
+        assert http_client.get(f'{base}/limited', backoff=30).status_code == 200
+        assert http_client.get(f'{base}/missing').status_code == 404
+        assert http_client.get_session(f'{base}/a') is http_client.get_session(f'{base}/b')
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert hits == {'/limited': 2, '/missing': 1}
+
+
+def test_shared_token_bucket_is_shared_between_instances(tmp_path):
+    import time
+    from urbanworm.utils.rate_limit import SharedTokenBucket, limiter_name
+
+    path = str(tmp_path / 'limits.sqlite')
+    a = SharedTokenBucket('api', rate=10, burst=2, path=path)
+    b = SharedTokenBucket('api', rate=10, burst=2, path=path)
+
+    start = time.monotonic()
+    a.acquire()
+    a.acquire()
+    b.acquire()  # the burst was spent by `a`, so `b` waits for a refill
+    assert time.monotonic() - start >= 0.08
+
+    assert limiter_name('https://graph.mapillary.com/images?bbox=1,2,3,4') == 'mapillary'
+    assert limiter_name('http://127.0.0.1:8080/health') is None
+    assert limiter_name('https://freesound.org/apiv2/search/text/?query=birds') == 'freesound'
+    assert limiter_name('https://api.flickr.com/services/rest/?method=flickr.photos.search') == 'flickr'
+    # previews, photos and web pages are served outside the API quotas
+    assert limiter_name('https://cdn.freesound.org/previews/1/1_1-hq.mp3') is None
+    assert limiter_name('https://freesound.org/people/someone/sounds/1/') is None
+    assert limiter_name('https://live.staticflickr.com/65535/1_2_b.jpg') is None
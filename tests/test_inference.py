@@ -1,3 +1,67 @@
 def test_import_inference_llama():
     from urbanworm.inference.llama import InferenceLlamacpp
-    assert InferenceLlamacpp is not None
\ No newline at end of file
+    assert InferenceLlamacpp is not None
+
+def test_ensure_model_lists_once_and_pulls_only_missing(monkeypatch):
+    from types import SimpleNamespace
+    from urbanworm.inference import llama
+
+    calls = {'list': 0, 'pull': []}
+
+    class FakeClient:
+        def list(self):
+            calls['list'] += 1
+            return SimpleNamespace(models=[SimpleNamespace(model='gemma3:4b')])
+
+        def pull(self, name):
+            calls['pull'].append(name)
+
+    monkeypatch.setattr(llama, '_AVAILABLE_MODELS', {})
+    client = FakeClient()
+    for _ in range(3):
+        llama.ensure_model('gemma3:4b', client)
+        llama.ensure_model('llava', client)
+
+    assert calls['list'] == 1
+    assert calls['pull'] == ['llava']
+
+
+def test_abatch_inference_against_stand_in_ollama():
+    import asyncio
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from pathlib import Path
+    from urbanworm.inference.llama import InferenceOllama
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            assert body['options']['temperature'] == 0.0
+            content = json.dumps({'responses': [{'questions': 'q', 'answer': body['messages'][-1]['content']}]})
+            data = json.dumps({'model': body['model'], 'created_at': '2026-01-01T00:00:00Z',
+                               'message': {'role': 'assistant', 'content': content}, 'done': True}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        imgs = [str(Path(__file__).resolve().parent.parent / 'docs' / 'data' / f'img_{i}.jpg') for i in (1, 2, 3)]
+        model = InferenceOllama(llm='stand-in', preload=False, host=f'http://127.0.0.1:{httpd.server_address[1]}',
+                                images=imgs)
+        model._ensure_model = lambda: None
+        df = asyncio.run(model.abatch_inference(prompt='Is there a tree?', max_concurrency=3,
+                                                disableProgressBar=True))
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert df['answer1'].tolist() == ['Is there a tree?'] * 3
+    assert df['data'].tolist() == imgs
@@ -0,0 +1,215 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+IMG_DIR = Path(__file__).resolve().parent.parent / "docs" / "data"
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"status": "ok"})
+        else:
+            self._reply(404, {})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length))
+        type(self).requests_seen.append(body)
+        content = json.dumps({"responses": [{"questions": "is there a tree?", "answer": "yes"}]})
+        self._reply(200, {"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+
+@pytest.fixture
+def stand_in_server():
+    _StandInHandler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 3])
+def test_batch_inference_through_llama_server(stand_in_server, max_concurrency):
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    imgs = [str(IMG_DIR / "img_1.jpg"), str(IMG_DIR / "img_2.jpg"), str(IMG_DIR / "img_3.jpg")]
+    model = InferenceLlamacpp(server=stand_in_server, images=imgs)
+    df = model.batch_inference(prompt="Is there a tree?", temp=0.1, top_k=10, seed=7,
+                               max_concurrency=max_concurrency, disableProgressBar=True)
+
+    assert len(df) == 3
+    assert df["answer_1"].tolist() == ["yes", "yes", "yes"]
+    assert df["data_1"].tolist() == imgs
+
+    body = _StandInHandler.requests_seen[0]
+    assert body["temperature"] == 0.1
+    assert body["top_k"] == 10
+    assert body["seed"] == 7
+    assert "responses" in body["response_format"]["json_schema"]["schema"]["properties"]
+    parts = body["messages"][-1]["content"]
+    assert parts[0]["image_url"]["url"].startswith("data:image/jpeg;base64,")
+    assert parts[-1] == {"type": "text", "text": "Is there a tree?"}
+
+
+def test_one_inference_through_llama_server(stand_in_server):
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    model = InferenceLlamacpp(server=stand_in_server)
+    df = model.one_inference(prompt="Is there a tree?", image=str(IMG_DIR / "img_3.jpg"))
+
+    assert df.loc[0, "questions_1"] == "is there a tree?"
+    assert df.loc[0, "answer_1"] == "yes"
+
+
+def test_response_cache_skips_repeated_generations(stand_in_server, tmp_path):
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    imgs = [str(IMG_DIR / "img_1.jpg"), str(IMG_DIR / "img_2.jpg")]
+    cache = str(tmp_path / "responses.sqlite")
+    first = InferenceLlamacpp(server=stand_in_server, images=imgs, cache=cache)
+    first.batch_inference(prompt="Is there a tree?", disableProgressBar=True)
+    assert len(_StandInHandler.requests_seen) == 2
+
+    second = InferenceLlamacpp(server=stand_in_server, images=imgs, cache=cache)
+    df = second.batch_inference(prompt="Is there a tree?", disableProgressBar=True)
+    assert len(_StandInHandler.requests_seen) == 2
+    assert df["answer_1"].tolist() == ["yes", "yes"]
+    assert second.cache.stats()["hits"] == 2
+
+    second.batch_inference(prompt="Is there a tree?", temp=0.7, disableProgressBar=True)
+    assert len(_StandInHandler.requests_seen) == 4
+
+
+def test_checkpointed_batch_inference_resumes(stand_in_server, tmp_path):
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    imgs = [str(IMG_DIR / f"img_{i}.jpg") for i in (1, 2, 3)]
+    ckpt = str(tmp_path / "run.jsonl")
+
+    InferenceLlamacpp(server=stand_in_server, images=imgs[:2]).batch_inference(
+        prompt="Is there a tree?", checkpoint_path=ckpt, disableProgressBar=True)
+    assert len(_StandInHandler.requests_seen) == 2
+
+    model = InferenceLlamacpp(server=stand_in_server, images=imgs)
+    df = model.batch_inference(prompt="Is there a tree?", checkpoint_path=ckpt, disableProgressBar=True)
+    assert len(_StandInHandler.requests_seen) == 3
+    assert model.results is None
+    assert df["data_1"].tolist() == imgs
+
+
+def test_iter_inference_yields_rows_in_order(stand_in_server):
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    imgs = [str(IMG_DIR / f"img_{i}.jpg") for i in (1, 2, 3)]
+    model = InferenceLlamacpp(server=stand_in_server, images=imgs)
+    rows = list(model.iter_inference(prompt="Is there a tree?", max_concurrency=2))
+
+    assert [row["data_1"] for row in rows] == imgs
+    assert rows[0]["answer_1"] == "yes"
+    assert model.results is None
+
+
+
+def test_iter_inference_yields_the_same_error_rows_in_both_backends(stand_in_server):
+    from urbanworm.inference.llama import InferenceLlamacpp, InferenceOllama
+
+    imgs = [str(IMG_DIR / f"img_{i}.jpg") for i in (1, 2, 3)]
+
+    def fail_on_second(img):
+        if "img_2" in str(img):
+            raise RuntimeError("request failed")
+
+    llama = InferenceLlamacpp(server=stand_in_server, images=imgs)
+    mtmd = llama._mtmd
+    llama._mtmd = lambda llm, mp, system, prompt, ims, **kw: fail_on_second(ims) or mtmd(llm, mp, system, prompt, ims, **kw)
+
+    ollama = InferenceOllama(llm="stand-in", preload=False, images=imgs)
+    ollama._ensure_model = lambda: None
+
+    def generate(model_name, system, prompt, img, *args):
+        fail_on_second(img)
+        return args[3].model_validate({"responses": [{"questions": "q", "answer": "yes"}]})
+
+    ollama._generate = generate
+    for model in (llama, ollama):
+        rows = list(model.iter_inference(prompt="Is there a tree?", max_concurrency=2))
+        assert rows[1] == {"index": 1, "error": "request failed", "data": imgs[1]}
+        assert [row.get("answer_1", row.get("answer1")) for row in (rows[0], rows[2])] == ["yes", "yes"]
+
+def test_one_inference_with_image_array(stand_in_server):
+    import cv2
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    img = cv2.imread(str(IMG_DIR / "img_3.jpg"), cv2.IMREAD_COLOR)
+    model = InferenceLlamacpp(server=stand_in_server)
+    df = model.one_inference(prompt="Is there a tree?", image=img)
+
+    assert df.loc[0, "answer_1"] == "yes"
+    parts = _StandInHandler.requests_seen[-1]["messages"][-1]["content"]
+    assert parts[0]["image_url"]["url"].startswith("data:image/png;base64,")
+
+
+def test_started_server_restarts_when_slots_or_context_change(monkeypatch):
+    from urbanworm.inference import llama_server
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    launches = []
+
+    def start(self):
+        launches.append((self.ctx_size, self.n_parallel))
+        self.process, self.url = object(), "http://stand-in"
+        return self
+
+    def stop(self):
+        self.process, self.url = None, None
+
+    monkeypatch.setattr(llama_server.LlamaServer, "start", start)
+    monkeypatch.setattr(llama_server.LlamaServer, "stop", stop)
+    model = InferenceLlamacpp(llm="stand-in.gguf", mp="stand-in-mmproj.gguf", server=True)
+    server = model._get_server(4096, n_parallel=2)
+    # fewer slots and requests of one input reuse the running server
+    assert model._get_server(4096, n_parallel=1) is server and model._get_server(4096) is server
+    model._get_server(4096, n_parallel=4)
+    model._get_server(8192)
+    assert launches == [(4096, 2), (4096, 4), (8192, 4)]
+
+
+def test_checkpoint_keeps_only_the_current_inputs(stand_in_server, tmp_path):
+    import cv2
+    from urbanworm.inference.checkpoint import Checkpoint
+    from urbanworm.inference.llama import InferenceLlamacpp
+
+    imgs = [str(IMG_DIR / f"img_{i}.jpg") for i in (1, 2, 3)]
+    ckpt = str(tmp_path / "run.jsonl")
+    # a file left by an earlier run on other inputs
+    InferenceLlamacpp(server=stand_in_server, images=imgs[2:]).batch_inference(
+        prompt="Is there a tree?", checkpoint_path=ckpt, disableProgressBar=True)
+
+    model = InferenceLlamacpp(server=stand_in_server, images=imgs[:2])
+    df = model.batch_inference(prompt="Is there a tree?", checkpoint_path=ckpt, disableProgressBar=True)
+    assert df["data_1"].tolist() == imgs[:2]
+
+    # media are stored by reference, not as their payload
+    img = cv2.imread(imgs[0], cv2.IMREAD_COLOR)
+    Checkpoint(ckpt).append(3, img, [])
+    assert list(Checkpoint(ckpt).records())[-1]["data"] == Checkpoint.item_key(img)
+    assert [r["data"] for r in Checkpoint(ckpt).records()][:3] == [imgs[2], imgs[0], imgs[1]]
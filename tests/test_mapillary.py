@@ -0,0 +1,212 @@
+import pytest
+
+from urbanworm.utils.utils import select_thumb
+
+THUMBS = {'thumb_1024_url': 'https://img/1024', 'thumb_2048_url': 'https://img/2048',
+          'thumb_original_url': 'https://img/original'}
+
+
+def test_select_thumb_picks_smallest_sufficient_size():
+    # reoriented views need 360 * width / fov pano pixels
+    assert select_thumb(THUMBS, fov=90, width=256) == 'https://img/1024'
+    assert select_thumb(THUMBS, fov=120, width=640) == 'https://img/2048'
+    assert select_thumb(THUMBS, fov=80, width=700) == 'https://img/original'
+    # images used as they are only need `width` pixels
+    assert select_thumb(THUMBS, fov=80, width=700, reoriented=False) == 'https://img/1024'
+    # user override, and fallback to what is available
+    assert select_thumb(THUMBS, fov=90, width=256, resolution='original') == 'https://img/original'
+    assert select_thumb({'thumb_original_url': 'https://img/original'}, fov=90, width=256) == 'https://img/original'
+
+
+def test_bulk_search_tiles_splits_saturated_windows_and_indexes(monkeypatch):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    from urbanworm.utils import mapillary
+
+    # 40 images on a line inside one 0.01 degree window, 3 in another
+    images = [{'id': str(i), 'computed_geometry': {'type': 'Point', 'coordinates': [0.0005 + i * 0.0002, 0.005]}}
+              for i in range(40)]
+    images += [{'id': f'b{i}', 'computed_geometry': {'type': 'Point', 'coordinates': [0.025, 0.005 + i * 0.001]}}
+               for i in range(3)]
+    queries = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            q = parse_qs(urlparse(self.path).query)
+            minx, miny, maxx, maxy = map(float, q['bbox'][0].split(','))
+            limit = int(q['limit'][0])
+            queries.append((minx, miny, maxx, maxy))
+            data = [img for img in images
+                    if minx <= img['computed_geometry']['coordinates'][0] < maxx
+                    and miny <= img['computed_geometry']['coordinates'][1] < maxy][:limit]
+            body = json.dumps({'data': data}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(mapillary, 'API_URL', f"http://127.0.0.1:{httpd.server_address[1]}/images")
+    try:
+        # many overlapping unit bboxes in the first window and one in the third
+        bboxes = [(0.001 + k * 0.0005, 0.004, 0.002 + k * 0.0005, 0.006) for k in range(10)]
+        bboxes += [(0.024, 0.004, 0.026, 0.008)]
+        found = mapillary.bulk_search(bboxes, key='token', limit=30, workers=2)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert sorted(img['id'] for img in found) == sorted(img['id'] for img in images)
+    # two windows, and the saturated one is split once into four quadrants
+    assert len(queries) == 2 + 4
+
+    index = mapillary.ImageIndex(found)
+    assert [img['id'] for img in index.query((0.024, 0.004, 0.026, 0.008))] == ['b0', 'b1', 'b2']
+
+
+def test_tile_math_round_trip():
+    from urbanworm.utils.mapillary import lonlat_to_tile, tile_to_lonlat
+
+    x, y = lonlat_to_tile(-83.743, 42.281, 14)
+    west, north = tile_to_lonlat(x, y, 14)
+    east, south = tile_to_lonlat(x + 1, y + 1, 14)
+    assert west <= -83.743 < east and south < 42.281 <= north
+
+
+def test_coverage_index_without_imagery_and_failed_tiles(monkeypatch):
+    from urbanworm.utils.mapillary import CoverageIndex
+
+    coverage = CoverageIndex(key='token')
+    # an empty (404) tile means no imagery, a failed one must not hide a location
+    monkeypatch.setattr(coverage, '_read_tile', lambda x, y: b'' if x % 2 == 0 else None)
+    coverage.load([(-83.7440, 42.2800, -83.7420, 42.2820)])
+    location = [-83.743, 42.281]
+    x = coverage.tiles_for([(-83.743, 42.281, -83.743, 42.281)])[0][0]
+    assert coverage.has_coverage(location, 20) == (x % 2 == 1)
+
+
+def test_coverage_index_from_cached_fixture_tile(tmp_path):
+    mvt = pytest.importorskip('mapbox_vector_tile')
+    from urbanworm.utils.mapillary import CoverageIndex, lonlat_to_tile, tile_to_lonlat
+
+    x, y = lonlat_to_tile(-83.743, 42.281, 14)
+    west, north = tile_to_lonlat(x, y, 14)
+    east, south = tile_to_lonlat(x + 1, y + 1, 14)
+    # one pano image at the location, in tile pixel coordinates (origin top-left)
+    px = round((-83.743 - west) / (east - west) * 4096)
+    py = round((north - 42.281) / (north - south) * 4096)
+    tile = mvt.encode([{'name': 'image', 'features': [
+        {'geometry': f'POINT({px} {py})', 'properties': {'is_pano': True}}]}],
+        default_options={'y_coord_down': True})
+    path = tmp_path / '14' / str(x)
+    path.mkdir(parents=True)
+    (path / f'{y}.mvt').write_bytes(tile)
+
+    coverage = CoverageIndex(key=None, cache_dir=str(tmp_path), pano=True)
+    coverage.load([(-83.744, 42.280, -83.742, 42.282)])
+    assert coverage.has_coverage([-83.7431, 42.2811], 50)
+    assert not coverage.has_coverage([-83.748, 42.2811], 50)
+
+
+def _records(n, sequence='s1', lon0=-83.7430, step=0.0001):
+    # images of one sequence along a street, captured one second apart
+    return [{'id': f'{sequence}_{i}', 'sequence': sequence, 'captured_at': 1690000000000 + i * 1000,
+             'computed_compass_angle': 90.0, 'thumb_original_url': f'https://img/{sequence}_{i}',
+             'computed_geometry': {'type': 'Point', 'coordinates': [lon0 + i * step, 42.2810]}}
+            for i in range(n)]
+
+
+def test_closest_picks_neighbours_from_bbox_candidates(monkeypatch):
+    from urbanworm.utils import utils
+
+    def no_request(*args, **kwargs):
+        raise AssertionError('unexpected request')
+
+    monkeypatch.setattr(utils, 'get_sequence', no_request)
+    monkeypatch.setattr(utils, 'get_svis_from_ids', no_request)
+
+    out = utils.closest([-83.7425, 42.2811], {'data': _records(10)}, multi_num=3, interval=2)
+    assert out['id'].tolist() == ['s1_5', 's1_3', 's1_7']
+    assert {'coordinates', 'year', 'thumb_original_url'} <= set(out.columns)
+
+
+def test_closest_falls_back_to_one_batched_fetch(monkeypatch):
+    import pandas as pd
+    from urbanworm.utils import utils
+
+    full = _records(10)
+    calls = []
+
+    def get_svis_from_ids(ids, key):
+        calls.append(list(ids))
+        return pd.json_normalize([r for r in full if r['id'] in ids])
+
+    monkeypatch.setattr(utils, 'get_sequence', lambda sequence, key=None: [r['id'] for r in full])
+    monkeypatch.setattr(utils, 'get_svis_from_ids', get_svis_from_ids)
+
+    # only the closest image of the sequence is inside the bbox
+    out = utils.closest([-83.7425, 42.2811], {'data': full[5:6]}, multi_num=3, interval=1)
+    assert out['id'].tolist() == ['s1_5', 's1_4', 's1_6']
+    assert calls == [['s1_4', 's1_6']]
+    assert out['coordinates'].notna().all()
+
+
+
+def test_closest_uses_the_sequence_when_the_bbox_has_a_gap(monkeypatch):
+    import pandas as pd
+    from urbanworm.utils import utils
+
+    full = _records(10)
+    monkeypatch.setattr(utils, 'get_sequence', lambda sequence, key=None: [r['id'] for r in full])
+    monkeypatch.setattr(utils, 'get_svis_from_ids',
+                        lambda ids, key: pd.json_normalize([r for r in full if r['id'] in ids]))
+
+    # the sequence leaves the bbox after s1_3 and comes back at s1_7
+    out = utils.closest([-83.7427, 42.2811], {'data': full[:4] + full[7:]}, multi_num=3, interval=1)
+    assert out['id'].tolist() == ['s1_3', 's1_2', 's1_4']
+
+    # a neighbour missing from the images endpoint gives fewer views
+    monkeypatch.setattr(utils, 'get_svis_from_ids', lambda ids, key: pd.DataFrame())
+    out = utils.closest([-83.7427, 42.2811], {'data': full[:4] + full[7:]}, multi_num=3, interval=1)
+    assert out['id'].tolist() == ['s1_3', 's1_2']
+
+def test_get_svis_from_ids_chunks_and_caches(monkeypatch):
+    from urllib.parse import parse_qs, urlparse
+    from urbanworm.utils import utils
+
+    requested = []
+
+    class FakeResponse:
+        def __init__(self, ids):
+            self.ids = ids
+
+        def json(self):
+            return {'data': [{'id': i, 'computed_compass_angle': 1.0,
+                              'computed_geometry': {'type': 'Point', 'coordinates': [0.0, 0.0]}}
+                             for i in self.ids]}
+
+    def fake_request(url, retries=3):
+        ids = parse_qs(urlparse(url).query)['image_ids'][0].split(',')
+        requested.append(ids)
+        return FakeResponse(ids)
+
+    monkeypatch.setattr(utils, 'retry_request', fake_request)
+    monkeypatch.setattr(utils, 'MAX_IDS_PER_REQUEST', 2)
+    monkeypatch.setattr(utils, '_SVI_RECORDS', utils.OrderedDict())
+
+    df = utils.get_svis_from_ids(['a', 'b', 'c', 'a'], key='token')
+    assert df['id'].tolist() == ['a', 'b', 'c', 'a']
+    assert 'computed_geometry.coordinates' in df.columns
+    assert requested == [['a', 'b'], ['c']]
+
+    # repeated ids across locations are served from the LRU
+    df = utils.get_svis_from_ids(['c', 'd'], key='token')
+    assert df['id'].tolist() == ['c', 'd']
+    assert requested[-1] == ['d']
@@ -0,0 +1,101 @@
+import base64
+
+import cv2
+import numpy as np
+
+from urbanworm.utils.pano2pers import Equirectangular, _perspective_maps
+
+
+def _pano(tmp_path, h=256, w=512):
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (15, 15), 0)
+    path = str(tmp_path / 'pano.png')
+    cv2.imwrite(path, img)
+    return path, img
+
+
+def test_perspective_maps_are_cached_and_match_float_remap(tmp_path):
+    path, img = _pano(tmp_path)
+    _perspective_maps.cache_clear()
+    equ = Equirectangular(img_path=path)
+
+    first = equ.GetPerspective(80, 90, 5, 100, 140)
+    second = equ.GetPerspective(80, 90, 5, 100, 140)
+    assert first == second
+    info = _perspective_maps.cache_info()
+    assert info.hits == 1 and info.misses == 1
+
+    # the fixed-point maps give (almost) the same view as the float maps
+    map1, map2 = _perspective_maps(256, 512, 80, 90, 5, 100, 140)
+    lon, lat = cv2.convertMaps(map1, map2, cv2.CV_32FC1)
+    expected = cv2.remap(img, lon, lat, cv2.INTER_CUBIC, borderMode=cv2.BORDER_WRAP)
+    view = cv2.imdecode(np.frombuffer(base64.b64decode(first), np.uint8), cv2.IMREAD_COLOR)
+    assert view.shape == (100, 140, 3)
+    assert np.abs(view.astype(int) - expected.astype(int)).mean() < 2
+
+
+
+def test_views_at_the_same_heading_share_the_maps(tmp_path):
+    _, img = _pano(tmp_path)
+    _perspective_maps.cache_clear()
+    # two panos of the same size, with headings computed from their camera angles
+    first = Equirectangular(img=img).GetPerspective(80, 93.27181, 5, 60, 90, image_format='ndarray')
+    second = Equirectangular(img=img[:, ::-1]).GetPerspective(80, 93.26944 + 360, 5.0001, 60, 90,
+                                                              image_format='ndarray')
+    info = _perspective_maps.cache_info()
+    assert info.hits == 1 and info.misses == 1
+    assert first.shape == second.shape == (60, 90, 3)
+
+def test_get_perspectives_matches_single_views(tmp_path):
+    path, _ = _pano(tmp_path)
+    equ = Equirectangular(img_path=path)
+    views = [(80, theta, 5, 60, 90) for theta in (0, 90, 180, 270)] + [(60, 45, 0, 40, 50, 128)]
+
+    expected = [equ.GetPerspective(*v) for v in views]
+    assert equ.GetPerspectives(views) == expected
+    assert equ.GetPerspectives(views, threads=3) == expected
+
+
+def test_output_formats_are_encoded_once(tmp_path):
+    import os
+    from urbanworm.utils.utils import base64img2temp, image_suffix
+
+    path, _ = _pano(tmp_path)
+    equ = Equirectangular(img_path=path)
+
+    view = equ.GetPerspective(80, 0, 5, 60, 90, image_format='ndarray')
+    assert isinstance(view, np.ndarray) and view.shape == (60, 90, 3)
+
+    for image_format, suffix in (('png', '.png'), ('jpeg', '.jpg'), ('webp', '.webp')):
+        b64 = equ.GetPerspective(80, 0, 5, 60, 90, image_format=image_format, quality=80)
+        raw = base64.b64decode(b64)
+        assert image_suffix(raw) == suffix
+        # the temp file holds the encoded bytes as they are, without a decode/re-encode round trip
+        tmp = base64img2temp(b64)
+        try:
+            assert tmp.endswith(suffix)
+            with open(tmp, 'rb') as f:
+                assert f.read() == raw
+        finally:
+            os.remove(tmp)
+
+
+def test_reduced_resolution_decode(tmp_path):
+    from urbanworm.utils.pano2pers import decode_scale
+
+    # 700 px over 80 degrees needs a 3150 px wide pano
+    assert decode_scale(8192, 80, 700) == 2
+    assert decode_scale(2048, 80, 700) == 1
+    assert decode_scale(8192, 90, 256) == 8
+    assert decode_scale(8192) == 1
+
+    pano = cv2.resize(_pano(tmp_path)[1], (2048, 1024))
+    path = str(tmp_path / 'pano.jpg')
+    cv2.imwrite(path, pano)
+
+    equ = Equirectangular(img_path=path, fov=90, width=128)
+    assert equ._img.shape == (256, 512, 3)  # 1/4 scale: 512 px >= 360 * 128 / 90
+    view = equ.GetPerspective(90, 0, 0, 96, 128, image_format='ndarray')
+    full = Equirectangular(img_path=path).GetPerspective(90, 0, 0, 96, 128, image_format='ndarray')
+    assert view.shape == full.shape
+    assert np.abs(view.astype(int) - full.astype(int)).mean() < 10
@@ -0,0 +1,62 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import pytest
+
+from urbanworm.utils.pano_store import PanoStore
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    hits = 0
+    body = b''
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).hits += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+@pytest.fixture
+def image_server():
+    _ImageHandler.hits = 0
+    _ImageHandler.body = cv2.imencode('.jpg', np.full((64, 128, 3), 127, np.uint8))[1].tobytes()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_pano_store_memory_and_disk_layers(image_server, tmp_path):
+    store = PanoStore(path=str(tmp_path / 'panos'))
+    # signed URLs change between requests, the id and resolution do not
+    a = store.get_image(f'{image_server}/pano.jpg?sig=1', image_id=42, resolution=2048)
+    b = store.get_image(f'{image_server}/pano.jpg?sig=2', image_id=42, resolution=2048)
+    assert a is b and a.shape == (64, 128, 3)
+    assert _ImageHandler.hits == 1
+
+    # a new store (e.g. the next run) reads the bytes from disk
+    other = PanoStore(path=str(tmp_path / 'panos'))
+    assert other.get_bytes(f'{image_server}/pano.jpg?sig=3', 42, 2048) == _ImageHandler.body
+    assert _ImageHandler.hits == 1
+
+    other.get_bytes(f'{image_server}/pano.jpg', 42, 1024)
+    assert _ImageHandler.hits == 2
+
+
+def test_pano_store_disk_quota(image_server, tmp_path):
+    size = len(_ImageHandler.body)
+    store = PanoStore(path=str(tmp_path / 'panos'), max_disk_mb=2.5 * size / (1024 * 1024))
+    for i in range(5):
+        store.get_bytes(f'{image_server}/pano.jpg', image_id=i)
+    assert len(store._files()) == 2
+    assert store._disk_size <= store.max_disk
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import numpy as np
+
+from urbanworm.utils.views import PerspectiveView, prefetch_views
+
+CANDIDATES = [{'id': 'p1', 'sequence': 's1', 'captured_at': 1690000000000, 'computed_compass_angle': 90.0,
+               'thumb_original_url': 'https://img/p1',
+               'computed_geometry': {'type': 'Point', 'coordinates': [-83.7430, 42.2810]}}]
+
+
+class _Panos:
+    def __init__(self):
+        self.calls = []
+
+    def get_image(self, *args):
+        self.calls.append(args)
+        pano = np.zeros((256, 512, 3), np.uint8)
+        pano[:, :, 1] = np.arange(512, dtype=np.uint16)[None, :] % 256
+        return pano
+
+
+def test_lazy_getsv_renders_on_demand(monkeypatch):
+    from urbanworm import dataset
+    from urbanworm.utils import views
+
+    panos = _Panos()
+    monkeypatch.setattr(dataset, 'get_pano_store', lambda: panos)
+    monkeypatch.setattr(views, 'get_pano_store', lambda: panos)
+    kwargs = dict(loc_id=1, pano=True, reoriented=True, height=32, width=48, image_format='ndarray',
+                  candidates=CANDIDATES)
+
+    lazy, _ = dataset.getSV([-83.7429, 42.2811], lazy=True, **kwargs)
+    assert isinstance(lazy[0], PerspectiveView) and panos.calls == []
+    assert str(lazy[0]).startswith('view:p1_original_80_')
+
+    eager, _ = dataset.getSV([-83.7429, 42.2811], **kwargs)
+    assert np.array_equal(lazy[0].render(), eager[0])
+    # image_format='ndarray' views are encoded as PNG when bytes are needed
+    assert lazy[0].read()[:4] == b'\x89PNG'
+
+
+def test_prefetch_views_renders_ahead_with_a_bound(monkeypatch):
+    from urbanworm.utils import views
+
+    rendered = []
+    lock = threading.Lock()
+
+    def prefetch(self):
+        with lock:
+            rendered.append(self.image_id)
+        self._pixels = np.zeros((1, 1, 3), np.uint8)
+
+    monkeypatch.setattr(views.PerspectiveView, 'prefetch', prefetch)
+    items = [PerspectiveView('u', image_id=i) for i in range(20)]
+    out = []
+    for i in prefetch_views(range(len(items)), items.__getitem__, workers=2, max_pending=4):
+        time.sleep(0.01)
+        with lock:
+            # never more than max_pending views rendered ahead of the consumer
+            assert len(rendered) - len(out) <= 5
+        out.append(i)
+    assert out == list(range(20)) and sorted(rendered) == list(range(20))
+
+    # inputs without views are passed through
+    assert list(prefetch_views(['a.png', 'b.png'])) == ['a.png', 'b.png']
+
+
+def test_lazy_views_with_response_cache(monkeypatch, tmp_path):
+    from urbanworm.inference.llama import InferenceOllama
+    from urbanworm.utils import views
+
+    panos = _Panos()
+    monkeypatch.setattr(views, 'get_pano_store', lambda: panos)
+    items = [PerspectiveView('https://img/p1', 'p1', 2048, heading=h, height=16, width=24) for h in range(0, 360, 60)]
+    model = InferenceOllama(llm='stand-in', preload=False, images=items, cache=str(tmp_path / 'responses.sqlite'))
+    model._ensure_model = lambda: None
+
+    def generate(model_name, system, prompt, img, temp, top_k, top_p, schema, one_shot_lr, multiImgInput):
+        # building the messages renders the view
+        model._messages(system, prompt, img[0], [])
+        return schema.model_validate({'responses': [{'questions': 'q', 'answer': 'a'}]})
+
+    model._generate = generate
+    first = model.batch_inference(prompt='Is there a tree?', max_concurrency=2, disableProgressBar=True)
+    assert len(panos.calls) == 6 and len(first) == 6
+
+    # every response is cached: nothing is rendered, and no pixels stay attached to the views
+    second = model.batch_inference(prompt='Is there a tree?', max_concurrency=2, disableProgressBar=True)
+    assert len(panos.calls) == 6 and model.cache.hits == 6
+    assert second['answer1'].tolist() == first['answer1'].tolist()
+    assert all(v._pixels is None for v in items)
+
+
+def test_download_reads_only_the_images_it_writes(monkeypatch, tmp_path):
+    import base64
+    import os
+    from urbanworm import dataset
+    from urbanworm.utils import views
+    from urbanworm.utils.blob_store import BlobStore
+
+    panos = _Panos()
+    monkeypatch.setattr(views, 'get_pano_store', lambda: panos)
+    store = BlobStore()
+    jpeg = views.encode_bytes(np.zeros((8, 8, 3), np.uint8), 'jpeg', 90)
+    reads = []
+    read = store.read
+    monkeypatch.setattr(store, 'read', lambda ref, size=None: reads.append(size) or read(ref, size))
+
+    data = dataset.GeoTaggedData()
+    data.svis = {'loc_id': [1, 1, 2], 'id': ['a', 'b', 'c'], 'path': [],
+                 'data': [PerspectiveView('https://img/p1', 'p1', 2048, height=16, width=24, image_format='webp'),
+                          store.put(jpeg), base64.b64encode(jpeg).decode('utf-8')]}
+    monkeypatch.chdir(tmp_path)
+    data.download_to_dir('svi', 'out')
+    assert [os.path.basename(p) for p in data.svis['path']] == ['1_a.webp', '1_b.jpg', '2_c.jpg']
+    assert len(panos.calls) == 1 and None in reads
+
+    # the files exist: only the blob header is read, and nothing is rendered
+    reads.clear()
+    data.download_to_dir('svi', 'out')
+    assert len(panos.calls) == 1 and reads == [12]
+    assert data.svis['data'][0]._pixels is None
+    store.close()
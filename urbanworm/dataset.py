@@ -1,7 +1,14 @@
 from geopandas import GeoDataFrame
 from .utils.building import *
-from .utils.pano2pers import Equirectangular
-from .utils.utils import projection, retry_request, closest, calculate_bearing
+from .utils.pano2pers import Equirectangular, encode_bytes
+from .utils.utils import projection, retry_request, closest, calculate_bearing, image_suffix, select_thumb, thumb_label, SVI_FIELDS
+from .utils.pano_store import get_pano_store
+from .utils.blob_store import BlobRef, BlobStore, get_blob_store
+from .utils.views import PerspectiveView, prefetch_views, release_views
+from .utils.mapillary import CoverageIndex, ImageIndex, bulk_search, location_bboxes
+from .utils import geo
+from .utils.concurrency import imap_ordered
+from .utils import http_client
 import pandas as pd
 from tqdm.auto import tqdm
 import os
@@ -119,6 +126,12 @@ class GeoTaggedData:
         print(f"{len(buildings)} buildings found in the bounding box.")
         return None
 
+    def _unit_locations(self, id_column: str) -> list:
+        # (id, [x, y]) of every unit, from the centroid arrays instead of one row at a time
+        centroids = self.units.geometry.centroid
+        xy = np.column_stack([centroids.x.to_numpy(), centroids.y.to_numpy()]).tolist()
+        return list(zip(self.units[id_column].tolist(), xy))
+
     def get_svi_from_locations(self,
                                id_column:str=None,
                                distance:int = 50,
@@ -128,6 +141,13 @@ class GeoTaggedData:
                                fov: int = 80, heading: int = None, pitch: int = 5,
                                height: int = 500, width: int = 700,
                                year: list | tuple = None, season: str = None, time_of_day: str = 'day',
+                               image_format: str = 'png', quality: int = 90,
+                               resolution: str | int = 'auto',
+                               bulk: bool = False,
+                               coverage: bool | str | CoverageIndex = None,
+                               blob_store: bool | str | BlobStore = None,
+                               lazy: bool = False,
+                               workers: int = 1,
                                silent: bool = True):
         """
             get_svi_from_locations
@@ -151,6 +171,25 @@ class GeoTaggedData:
                 year (list[str], optional): Year of data (start year, end year).
                 season (str, optional): Season of data. One of ["spring","summer","fall","autumn","winter"]
                 time_of_day (str, optional): Time of data. One of ["day","night"] (Default is 'day')
+                image_format (str): Format of the reoriented images: "png", "jpeg" or "webp" (base64 strings),
+                    or "ndarray" to keep the BGR arrays and encode them only when needed. (Default is 'png')
+                quality (int): JPEG/WebP quality. (Default is 90)
+                resolution (str | int): Size of the downloaded image: 1024, 2048, 'original', or 'auto' for the
+                    smallest thumbnail with enough pixels for `fov` and `width`. (Default is 'auto')
+                bulk (bool): If True, fetch the images of the whole area once with a tiled search and assign
+                    them to the units locally, instead of one query per unit. Recommended for dense units. (Default is False)
+                coverage (bool | str | CoverageIndex, optional): Skip the units without any image nearby, using the
+                    Mapillary coverage vector tiles of the area instead of a search request per unit. A string is a
+                    directory where the tiles are kept across runs. Requires the `coverage` extra (`mapbox-vector-tile`). (Default is None)
+                blob_store (bool | str | BlobStore, optional): Write the reoriented images to a pack file and keep only
+                    handles (BlobRef) in `self.svis['data']`, so memory use does not grow with the number of images.
+                    True uses the store of `configure_blob_store` (a temporary file by default), a string is the path
+                    of a pack file reused across runs. Images with image_format='ndarray' are stored as PNG. (Default is None)
+                lazy (bool): With `reoriented=True`, keep only the view specs (PerspectiveView) in `self.svis['data']` and
+                    render them when the inference backends or `download_to_dir` need the pixels, so collection does not
+                    download any pano. Thumbnail URLs expire, so render the views in the same session. (Default is False)
+                workers (int): Number of locations processed at the same time on a thread pool.
+                    Results are merged in the order of the units. (Default is 1)
                 silent (bool): If True, do not show error traceback (Default is True).
             """
 
@@ -166,44 +205,76 @@ class GeoTaggedData:
             id_column = 'loc_id'
             if id_column not in self.units.columns:
                 self.units[id_column] = [i for i in range(len(self.units))]
-        res_df = None
-        skip_count = 0
-        for index, row in tqdm(self.units.iterrows(), total=len(self.units)):
-            loc_id = row[id_column]
+        if blob_store is True:
+            blob_store = get_blob_store()
+        elif isinstance(blob_store, str):
+            blob_store = BlobStore(blob_store)
+        elif blob_store is False:
+            blob_store = None
+        def fetch(loc):
+            loc_id, location, bbox, cands = loc
             try:
-                svis, output_df = getSV([row.geometry.centroid.x, row.geometry.centroid.y],
-                                        loc_id,
-                                        distance,
-                                        key,
-                                        pano,
-                                        reoriented,
-                                        multi_num,
-                                        interval,
-                                        fov, heading, pitch,
-                                        height,
-                                        width,
-                                        year,
-                                        season,
-                                        time_of_day,
-                                        silent = silent
-                                        )
-                if svis is None:
-                    skip_count += 1
-                    continue
-
-                self.svis['data'] += svis
-                self.svis['loc_id'] += output_df['loc_id'].tolist()
-                self.svis['id'] += output_df['id'].tolist()
-
-                if res_df is None:
-                    res_df = output_df
-                else:
-                    res_df = pd.concat([res_df, output_df])
+                return getSV(location,
+                             loc_id,
+                             distance,
+                             key,
+                             pano,
+                             reoriented,
+                             multi_num,
+                             interval,
+                             fov, heading, pitch,
+                             height,
+                             width,
+                             year,
+                             season,
+                             time_of_day,
+                             image_format=image_format,
+                             quality=quality,
+                             resolution=resolution,
+                             candidates=cands,
+                             bbox=bbox,
+                             blob_store=blob_store,
+                             lazy=lazy,
+                             output_columns=True,
+                             silent = silent
+                             )
             except Exception as e:
-                if not silent: print(f'skipping {[row.geometry.centroid.x, row.geometry.centroid.y]}: {e}')
+                if not silent: print(f'skipping {location}: {e}')
+                return None, None
+
+        locs = self._unit_locations(id_column)
+        # the search bboxes of all units in one vectorized call (used by the coverage check, the bulk search and getSV)
+        bboxes = location_bboxes([location for _, location in locs], distance)
+        no_coverage = 0
+        if coverage is not None and coverage is not False:
+            if not isinstance(coverage, CoverageIndex):
+                coverage = CoverageIndex(key, cache_dir=coverage if isinstance(coverage, str) else None,
+                                         pano=True if pano else None)
+            coverage.load(bboxes, workers=workers)
+            covered = [i for i, (_, location) in enumerate(locs) if coverage.has_coverage(location, distance)]
+            no_coverage = len(locs) - len(covered)
+            locs, bboxes = [locs[i] for i in covered], [bboxes[i] for i in covered]
+        if bulk:
+            # one query per window of the covered area, then a spatial index to find the images of each unit
+            index = ImageIndex(bulk_search(bboxes, key, pano, workers=workers))
+            cands = [index.query(b) for b in bboxes]
+        else:
+            cands = [None] * len(locs)
+        locs = [(loc_id, location, b, c) for (loc_id, location), b, c in zip(locs, bboxes, cands)]
+        # metadata as column lists, one dataframe at the end
+        metadata = _Columns()
+        skip_count = no_coverage
+        for svis, records in tqdm(imap_ordered(fetch, locs, max_workers=workers), total=len(locs)):
+            if svis is None:
                 skip_count += 1
                 continue
-        self.svi_metadata = res_df
+
+            self.svis['data'] += svis
+            self.svis['loc_id'] += records['loc_id']
+            self.svis['id'] += records['id']
+
+            metadata.extend(records)
+        self.svi_metadata = metadata.to_frame()
         if skip_count > 0:
             print(f'Collect data for {len(self.units) - skip_count} locations and skipped {skip_count} locations due to no data found.')
         return None
@@ -221,6 +292,7 @@ class GeoTaggedData:
                                 time_of_day: str = None,
                                 exclude_personal_photo: bool = True,
                                 exclude_from_location:int = None,
+                                workers: int = 1,
                                 silent = True,
                                 ):
         '''
@@ -241,6 +313,8 @@ class GeoTaggedData:
                 time_of_day (str): One of {"morning","afternoon","evening","night"} (post-filter by taken hour).
                 exclude_personal_photo (bool): If True, exclude personal photo from locations. (Default is True)
                 exclude_from_location (int, optional): Drop retrieved data with a distance from the given location.
+                workers (int): Number of locations processed at the same time on a thread pool.
+                    Results are merged in the order of the units. (Default is 1)
                 silent (bool): If True, do not show error traceback (Default is True).
         '''
 
@@ -259,12 +333,10 @@ class GeoTaggedData:
             id_column = 'loc_id'
             if id_column not in self.units.columns:
                 self.units[id_column] = [i for i in range(len(self.units))]
-        res_df = None
-        skip_count = 0
-        for index, row in tqdm(self.units.iterrows(), total=len(self.units)):
-            loc_id = row[id_column]
+        def fetch(loc):
+            loc_id, location = loc
             try:
-                output_df = getPhoto([row.geometry.centroid.x, row.geometry.centroid.y],
+                records = getPhoto(location,
                                      loc_id,
                                      distance,
                                      key,
@@ -276,32 +348,37 @@ class GeoTaggedData:
                                      season,
                                      time_of_day,
                                      exclude_from_location,
-                                     output_df=True)
+                                     output_df=True,
+                                     output_columns=True)
+                if records is None:
+                    return None
                 if exclude_personal_photo:
                     model_res = files("urbanworm.models") / "face_detection_yunet_2023mar.onnx"
-                    drop_list = []
-                    for ind, r in output_df.iterrows():
-                        with as_file(model_res) as model_path:
-                            is_selfie = is_selfie_photo(model_path, r['url'])
-                            if is_selfie:
-                                drop_list += [ind]
-                    if len(drop_list) > 0:
-                        output_df.drop(drop_list, axis=0, inplace=True)
-                        if len(output_df) == 0:
-                            continue
-
-                self.photos['loc_id'] += output_df['loc_id'].tolist()
-                self.photos['data'] += output_df['url'].tolist()
-                self.photos['id'] += output_df['id'].tolist()
-                if res_df is None:
-                    res_df = output_df
-                else:
-                    res_df = pd.concat([res_df, output_df])
+                    with as_file(model_res) as model_path:
+                        keep = [i for i, (url, photo_id) in enumerate(zip(records['url'], records['id']))
+                                if not is_selfie_photo(model_path, url, f"flickr_{photo_id}")]
+                    if len(keep) < len(records['id']):
+                        records = {k: [v[i] for i in keep] for k, v in records.items()}
+                return records
             except Exception as e:
                 if not silent: print(e)
+                return None
+
+        locs = self._unit_locations(id_column)
+        metadata = _Columns()
+        skip_count = 0
+        for records in tqdm(imap_ordered(fetch, locs, max_workers=workers), total=len(locs)):
+            if records is None:
                 skip_count += 1
                 continue
-        self.photo_metadata = res_df
+            if len(records['id']) == 0:
+                continue
+
+            self.photos['loc_id'] += records['loc_id']
+            self.photos['data'] += records['url']
+            self.photos['id'] += records['id']
+            metadata.extend(records)
+        self.photo_metadata = metadata.to_frame()
         if skip_count > 0:
             print(f'Collect data for {len(self.units) - skip_count} locations and skipped {skip_count} locations due to no data found.')
         return None
@@ -320,6 +397,7 @@ class GeoTaggedData:
                                 exclude_from_location: int = None,
                                 slice_duration: int = None,
                                 slice_max_num: int = None,
+                                workers: int = 1,
                                 silent: bool = True
                                 ):
 
@@ -342,6 +420,8 @@ class GeoTaggedData:
                 exclude_from_location (int, optional): Drop retrieved data with a distance from the given location.
                 slice_duration (int, optional): Split the original sound signal into clips with the given duration.
                 slice_max_num (int, optional): Maximum number of clips sliced from the original sound signal.
+                workers (int): Number of locations processed at the same time on a thread pool.
+                    Results are merged in the order of the units. (Default is 1)
                 silent (bool): If True, do not show error traceback (Default is True).
         '''
 
@@ -360,32 +440,42 @@ class GeoTaggedData:
             id_column = 'loc_id'
             if id_column not in self.units.columns:
                 self.units[id_column] = [i for i in range(len(self.units))]
-        res_df = None
-        skip_count = 0
-        for index, row in tqdm(self.units.iterrows(), total=len(self.units)):
-            loc_id = row[id_column]
+        def fetch(loc):
+            loc_id, location = loc
             try:
-                output_df = getSound([row.geometry.centroid.x, row.geometry.centroid.y],
-                                     loc_id,
-                                     distance,
-                                     key,
-                                     query,
-                                     tag,
-                                     max_return,
-                                     year,
-                                     season,
-                                     time_of_day,
-                                     duration,
-                                     exclude_from_location,
-                                     slice_duration,
-                                     slice_max_num,
-                                     output_df = True)
+                return getSound(location,
+                                loc_id,
+                                distance,
+                                key,
+                                query,
+                                tag,
+                                max_return,
+                                year,
+                                season,
+                                time_of_day,
+                                duration,
+                                exclude_from_location,
+                                slice_duration,
+                                slice_max_num,
+                                output_df = True,
+                                output_columns = True)
+            except Exception as e:
+                if not silent: print(e)
+                return None
 
+        locs = self._unit_locations(id_column)
+        metadata = _Columns()
+        skip_count = 0
+        for records in tqdm(imap_ordered(fetch, locs, max_workers=workers), total=len(locs)):
+            if records is None:
+                skip_count += 1
+                continue
+            try:
                 if slice_duration is not None:
-                    slice_list = output_df['slice'].tolist()
-                    loc_id_list = output_df['loc_id'].tolist()
-                    data_list = output_df['preview-hq-mp3'].tolist()
-                    id_list = output_df['id'].tolist()
+                    slice_list = records['slice']
+                    loc_id_list = records['loc_id']
+                    data_list = records['preview-hq-mp3']
+                    id_list = records['id']
 
                     slice_num = 1
                     if isinstance(slice_list[0][0], list):
@@ -411,19 +501,16 @@ class GeoTaggedData:
                         self.audios['id'] += id_list
                         self.audios['slice'] += flattened_slice_list
                 else:
-                    self.audios['loc_id'] += output_df['loc_id'].tolist()
-                    self.audios['data'] += output_df['preview-hq-mp3'].tolist()
-                    self.audios['id'] += output_df['id'].tolist()
+                    self.audios['loc_id'] += records['loc_id']
+                    self.audios['data'] += records['preview-hq-mp3']
+                    self.audios['id'] += records['id']
 
-                if res_df is None:
-                    res_df = output_df
-                else:
-                    res_df = pd.concat([res_df, output_df])
+                metadata.extend(records)
             except Exception as e:
                 if not silent: print(e)
                 skip_count += 1
                 continue
-        self.audio_metadata = res_df
+        self.audio_metadata = metadata.to_frame()
         if skip_count > 0:
             print(f'Collect data for {len(self.units) - skip_count} locations and skipped {skip_count} locations due to no data found.')
         return None
@@ -454,20 +541,45 @@ class GeoTaggedData:
             if len(self.svis['id']) == 0:
                 return None
             self.svis['path'] = []
-            for i in tqdm(range(len(self.svis['data'])), total=len(self.svis['data'])):
+            resolutions = [None] * len(self.svis['data'])
+            if self.svi_metadata is not None and 'resolution' in self.svi_metadata.columns:
+                resolutions = self.svi_metadata['resolution'].tolist()
+            # file names from the image headers only, so that existing files are neither read nor rendered
+            paths = []
+            for i, item in enumerate(self.svis['data']):
                 loc_id = self.svis['loc_id'][i]
                 img_id = self.svis['id'][i]
                 path = f'{to_dir}/{prefix}_{loc_id}' if prefix is not None else f'./{to_dir}/{loc_id}'
-                p = path + f'_{img_id}.png'
+                paths += [path + f'_{img_id}' + (_image_file_suffix(item) or '.png')]
+            # lazy views are rendered a few items ahead, on a thread pool
+            todo = prefetch_views(range(len(self.svis['data'])), self.svis['data'].__getitem__,
+                                  skip=lambda i: os.path.exists(paths[i]))
+            for i in tqdm(todo, total=len(self.svis['data'])):
+                img_id = self.svis['id'][i]
+                item = self.svis['data'][i]
+                p = paths[i]
                 if not os.path.exists(p):
                     try:
-                        if is_base64(self.svis['data'][i]):
-                            save_base64(self.svis['data'][i], p)
+                        if isinstance(item, np.ndarray):
+                            if not cv2.imwrite(p, item):
+                                raise IOError("cv2.imwrite failed")
                         else:
-                            download_image_requests(self.svis['data'][i], p)
+                            if isinstance(item, (BlobRef, PerspectiveView)):
+                                raw = item.read()
+                            elif _image_file_suffix(item) is not None:
+                                # base64: keep the encoding chosen by image_format, only the bytes are written
+                                raw = base64.b64decode(item)
+                            else:
+                                # not reoriented: the image may already be in the pano store
+                                raw = get_pano_store().get_bytes(item, img_id, resolutions[i])
+                            if raw is not None:
+                                with open(p, 'wb') as f:
+                                    f.write(raw)
                     except:
                         self.svis['path'] += [" "]
                         continue
+                    finally:
+                        release_views(item)
                 self.svis['path'] += [p]
         elif data == 'audio':
             if len(self.audios['id']) == 0:
@@ -512,7 +624,9 @@ class GeoTaggedData:
                 p = path + f'_{photo_id}.png'
                 if not os.path.exists(p):
                     try:
-                        download_image_requests(self.photos['data'][i], p)
+                        raw = get_pano_store().get_bytes(self.photos['data'][i], f"flickr_{photo_id}")
+                        with open(p, 'wb') as f:
+                            f.write(raw)
                     except:
                         self.photos['path'] += [" "]
                 self.photos['path'] += [p]
@@ -522,7 +636,8 @@ class GeoTaggedData:
         '''
             set_images
 
-            Set retrieved street view images or Flickr photos as images dataset
+            Set retrieved street view images or Flickr photos as images dataset.
+            Blob store handles are kept as they are and read by the inference backends when needed.
 
             Args:
                 img_type (str): 'photo' or 'svi'
@@ -583,6 +698,67 @@ class GeoTaggedData:
         return gdf if export_gdf else self.plot
 
 
+class _Columns:
+    '''
+    Metadata of a collection as column lists, extended location by location and turned
+    into one DataFrame at the end. Columns missing at some locations are filled with NaN, as pd.concat does.
+    '''
+
+    def __init__(self):
+        self.columns = {}
+        self.rows = 0
+
+    def extend(self, records: dict) -> None:
+        n = len(next(iter(records.values()), []))
+        for name, values in records.items():
+            if name not in self.columns:
+                self.columns[name] = [np.nan] * self.rows
+            self.columns[name].extend(values)
+        self.rows += n
+        for values in self.columns.values():
+            if len(values) < self.rows:
+                values.extend([np.nan] * (self.rows - len(values)))
+
+    def to_frame(self) -> pd.DataFrame | None:
+        return pd.DataFrame(self.columns) if self.rows > 0 else None
+
+
+def _nearest_columns(results: list[dict], max_return: int, expand: str = None) -> dict | None:
+    # the `max_return` closest records as column lists, in the order of
+    # df.sort_values('distance_m').head(max_return); the dicts in `expand` become columns
+    if len(results) == 0:
+        return None
+    results = sorted(results, key=lambda r: (r['distance_m'] is None, r['distance_m'] or 0.0))[:max_return]
+    names = [k for k in results[0] if k != expand]
+    columns = {k: [r.get(k) for r in results] for k in names}
+    if expand is not None:
+        extra = [r.get(expand) or {} for r in results]
+        for k in dict.fromkeys(k for e in extra for k in e):
+            columns[k] = [e.get(k) for e in extra]
+    return columns
+
+
+def _view_key(img_id, img_resolution, view: tuple, image_format: str, quality: int) -> str:
+    # key of a rendered view in the blob store
+    fov, relative_heading, pitch, height, width, _ = view
+    return f'{img_id}_{img_resolution}_{fov}_{relative_heading:.4f}_{pitch}_{height}x{width}_{quality}.{image_format}'
+
+
+
+def _image_file_suffix(item) -> str | None:
+    # file extension of a collected image, from its header only (None for arrays, URLs and paths)
+    if isinstance(item, PerspectiveView):
+        return item.suffix
+    if isinstance(item, BlobRef):
+        return image_suffix(item.read(12))
+    if isinstance(item, str):
+        try:
+            # the first 16 characters of a base64 string are the first 12 bytes
+            return image_suffix(base64.b64decode(item[:16], validate=True))
+        except ValueError:
+            return None
+    return None
+
 # Get street view images from Mapillary
 def getSV(location: list|tuple,
           loc_id: int | str = None,
@@ -597,7 +773,15 @@ def getSV(location: list|tuple,
           year: list | tuple = None,
           season: str = None,
           time_of_day: str = None,
+          image_format: str = 'png',
+          quality: int = 90,
+          resolution: str | int = 'auto',
+          candidates: list = None,
+          bbox: list | tuple = None,
+          blob_store: BlobStore = None,
+          lazy: bool = False,
           output_df: bool = True,
+          output_columns: bool = False,
           silent: bool = False) -> pd.DataFrame | list | None:
     """
         getSV
@@ -622,17 +806,31 @@ def getSV(location: list|tuple,
             year (list[str], optional): Year of data (start year, end year).
             season (str, optional): Season of data.
             time_of_day (str, optional): Time of data.
+            image_format (str, optional): Format of the reoriented images: "png", "jpeg", "webp" or "ndarray". (Default is 'png')
+            quality (int, optional): JPEG/WebP quality. (Default is 90)
+            resolution (str | int, optional): Size of the downloaded image: 1024, 2048, 'original', or 'auto' for the
+                smallest thumbnail with enough pixels for `fov` and `width`. (Default is 'auto')
+            candidates (list[dict], optional): Mapillary image records around the location, already fetched
+                (e.g. by a bulk search). The bbox query is then skipped.
+            bbox (list | tuple, optional): The search bbox (min lon, min lat, max lon, max lat) of the location,
+                already computed (e.g. by the collector for all units at once). (Default is the bbox of `distance`)
+            blob_store (BlobStore, optional): Write the reoriented images to this store and return handles (BlobRef)
+                instead of the images. Views already in the store are not rendered again.
+            lazy (bool, optional): Return the view specs (PerspectiveView) of the reoriented images without rendering
+                them (`blob_store` is then not used). (Default is False)
             output_df (bool, optional): Whether to return a dataframe containing only the closest. (Default is True)
+            output_columns (bool, optional): With output_df, return the metadata as a dict of column lists
+                instead of a dataframe (used by the collectors to build one dataframe). (Default is False)
             silent (bool, optional): Whether to silence output (Default is False).
 
         Returns:
-            list[str]: A list of images in base64 format
+            list[str]: A list of images in base64 format (or arrays with image_format='ndarray', BlobRef handles
+                with blob_store, or PerspectiveView with lazy)
             DataFrame: A dataframe containing metadata about the closest street view images.
     """
 
-    bbox = projection(location, r=distance)
-    url = f"https://graph.mapillary.com/images?access_token={key}&fields=id,computed_compass_angle,thumb_original_url,captured_at,computed_geometry,sequence&bbox={bbox}"
-    # 2048 -> original to get higher resolution
+    bbox = projection(location, r=distance) if bbox is None else ','.join(str(v) for v in bbox)
+    url = f"https://graph.mapillary.com/images?access_token={key}&fields={SVI_FIELDS}&bbox={bbox}"
     if pano:
         url += "&is_pano=true"
     if pano == False and reoriented == True:
@@ -647,19 +845,24 @@ def getSV(location: list|tuple,
         "image_lon": [],
         "image_lat": [],
         'url': [],
+        'resolution': [],
         'loc_id': []
     }
     if loc_id is None:
         del svi_df['loc_id']
 
     try:
-        response = retry_request(url)
-        if response is None:
-            if not silent: print(f'skip location: {location} due to no data found')
-            if output_df:
-                return None, None
-            return None
-        response = response.json()
+        if candidates is not None:
+            # bulk mode: the images around the location were already fetched
+            response = {'data': candidates}
+        else:
+            response = retry_request(url)
+            if response is None:
+                if not silent: print(f'skip location: {location} due to no data found')
+                if output_df:
+                    return None, None
+                return None
+            response = response.json()
         # find the closest image
         response = closest(location, response, multi_num, interval, year, season, time_of_day, key)
         if response is None:
@@ -668,10 +871,12 @@ def getSV(location: list|tuple,
                 return None, None
             return None
 
+        views = {}
         for index, row in response.iterrows():
             # Extract Image ID, Compass Angle, image url, and coordinates
             img_heading = float(row['computed_compass_angle'])
-            img_url = row['thumb_original_url']
+            img_url = select_thumb(row, fov, width, reoriented, resolution)
+            img_resolution = thumb_label(row, img_url)
 
             if 'computed_geometry.coordinates' in row.index:
                 image_lon, image_lat = row['computed_geometry.coordinates']
@@ -687,11 +892,14 @@ def getSV(location: list|tuple,
                 relative_heading = (bearing_to_house - img_heading) % 360
             else:
                 relative_heading = heading
-            # reframe image
-            if reoriented:
-                svi = Equirectangular(img_url=img_url)
-                sv = svi.GetPerspective(fov, relative_heading, pitch, height, width, 128)
-                svis.append(sv)
+            # reframe image (rendered below)
+            if reoriented and lazy:
+                svis.append(PerspectiveView(img_url, row['id'], img_resolution, fov, relative_heading, pitch,
+                                            height, width, image_format, quality))
+            elif reoriented:
+                views.setdefault((img_url, row['id'], img_resolution), []).append(
+                    (len(svis), (fov, relative_heading, pitch, height, width, 128)))
+                svis.append(None)
             else:
                 svis.append(img_url)
 
@@ -703,10 +911,38 @@ def getSV(location: list|tuple,
                 svi_df['image_lat'].append(image_lat)
                 svi_df['compass_angle'].append(img_heading)
                 svi_df['url'].append(img_url)
+                svi_df['resolution'].append(img_resolution)
                 if 'loc_id' in svi_df:
                     svi_df['loc_id'].append(loc_id)
+        # closest() returns distinct images, so each pano has one view here; panos shared by
+        # nearby locations are downloaded and decoded once through the pano store
+        stored_format = 'png' if image_format == 'ndarray' else image_format
+        for (img_url, img_id, img_resolution), pano_views in views.items():
+            if blob_store is not None:
+                todo = []
+                for i, v in pano_views:
+                    ref = blob_store.ref(_view_key(img_id, img_resolution, v, stored_format, quality))
+                    if ref is None:
+                        todo.append((i, v))
+                    else:
+                        svis[i] = ref
+                pano_views = todo
+                if len(pano_views) == 0:
+                    continue
+            # decoded at the lowest resolution that keeps the pixel density of the view
+            pano_img = get_pano_store().get_image(img_url, img_id, img_resolution, fov, width)
+            svi = Equirectangular(img=pano_img)
+            if blob_store is None:
+                renders = svi.GetPerspectives([v for _, v in pano_views], image_format=image_format, quality=quality)
+            else:
+                renders = [blob_store.put(encode_bytes(arr, stored_format, quality),
+                                          _view_key(img_id, img_resolution, v, stored_format, quality))
+                           for (_, v), arr in zip(pano_views, svi.GetPerspectives([v for _, v in pano_views],
+                                                                                 image_format='ndarray'))]
+            for (i, _), sv in zip(pano_views, renders):
+                svis[i] = sv
         if output_df:
-            return svis, pd.DataFrame(svi_df)
+            return svis, (svi_df if output_columns else pd.DataFrame(svi_df))
         else:
             return svis
     except Exception as e:
@@ -730,7 +966,8 @@ def getPhoto(
         season: str = None,
         time_of_day: str = None,
         exclude_from_location:int = None,
-        output_df: bool = True
+        output_df: bool = True,
+        output_columns: bool = False
 ):
     """
         getPhoto
@@ -752,17 +989,18 @@ def getPhoto(
             exclude_from_location (int, optional): drop retrieved photos within a distance (in meter) from the given location. (Default is None)
             output_df (bool): If True, return a pandas.DataFrame; otherwise return dict (if max_return==1)
                        or list[dict].
+            output_columns (bool): With output_df, return the rows of the dataframe as a dict of column lists
+                (None if nothing is found). Used by the collectors to build one dataframe. (Default is False)
 
         Returns:
             dict | list[dict] | pandas.DataFrame
     """
 
     import os
-    import requests
     from datetime import datetime, timedelta, timezone
 
     if exclude_from_location is not None:
-        drop_area = projection(location, r=distance)
+        drop_area = geo.bbox(location, exclude_from_location)
 
     # -------------------------
     # Validate inputs
@@ -863,8 +1101,6 @@ def getPhoto(
     # -------------------------
     # Fetch + post-filter
     # -------------------------
-    session = requests.Session()
-
     # Geo/bbox queries only return up to 250/page. :contentReference[oaicite:8]{index=8}
     per_page = min(250, max(50, max_return * 20))
     params["per_page"] = per_page
@@ -875,7 +1111,7 @@ def getPhoto(
     max_pages = 150
     for page in range(1, max_pages + 1):
         params["page"] = page
-        r = session.get(endpoint, params=params, timeout=30)
+        r = http_client.get(endpoint, params=params, timeout=(10, 30))
         r.raise_for_status()
         data = r.json()
 
@@ -887,10 +1123,15 @@ def getPhoto(
         if not photos:
             break
 
-        for p in photos:
-            if exclude_from_location is not None:
-                if is_coordinate_in_bbox(p["longitude"], p["latitude"], drop_area):
-                    continue
+        # coordinates of the whole page: exclusion window and distances in one pass
+        p_lat = geo.to_float_array([p.get("latitude") for p in photos])
+        p_lon = geo.to_float_array([p.get("longitude") for p in photos])
+        p_dist = geo.haversine(lat, lon, p_lat, p_lon)
+        p_excluded = geo.in_bbox(p_lon, p_lat, drop_area) if exclude_from_location is not None else np.zeros(len(photos), bool)
+
+        for p, s_lat, s_lon, dist, excluded in zip(photos, p_lat, p_lon, p_dist, p_excluded):
+            if excluded:
+                continue
             pid = p.get("id")
             if not pid or pid in seen:
                 continue
@@ -902,8 +1143,8 @@ def getPhoto(
             if hours and taken_dt and taken_dt.hour not in hours:
                 continue
 
-            s_lat = float(p["latitude"]) if "latitude" in p and p["latitude"] not in (None, "") else None
-            s_lon = float(p["longitude"]) if "longitude" in p and p["longitude"] not in (None, "") else None
+            s_lat = None if np.isnan(s_lat) else float(s_lat)
+            s_lon = None if np.isnan(s_lon) else float(s_lon)
 
             url = best_url(p)
             out = {
@@ -916,7 +1157,7 @@ def getPhoto(
                 "latitude": s_lat,
                 "longitude": s_lon,
                 # "accuracy": int(p["accuracy"]) if "accuracy" in p and str(p["accuracy"]).isdigit() else None,
-                "distance_m": haversine_m(lat, lon, s_lat, s_lon) if (s_lat is not None and s_lon is not None) else None,
+                "distance_m": None if np.isnan(dist) else float(dist),
                 "tags": p.get("tags"),
                 "description": p.get("description"),
                 "views": int(p["views"]) if "views" in p and str(p["views"]).isdigit() else None,
@@ -938,6 +1179,8 @@ def getPhoto(
         if len(results) >= max_return:
             break
 
+    if output_df and output_columns:
+        return _nearest_columns(results, max_return)
     if output_df:
         import pandas as pd
         df = pd.DataFrame(results)
@@ -965,6 +1208,7 @@ def getSound(
         slice_duration:int = None,
         slice_max_num:int = None,
         output_df: bool = True,
+        output_columns: bool = False,
 ) -> pd.DataFrame:
 
     """
@@ -992,16 +1236,17 @@ def getSound(
             slice_duration (int, optional): Split the original sound signal into clips with the given duration.
             slice_max_num (int, optional): Maximum number of clips sliced from the original sound signal.
             output_df (bool): if True, return a pandas.DataFrame.
+            output_columns (bool): With output_df, return the rows of the dataframe (with the previews expanded)
+                as a dict of column lists (None if nothing is found). Used by the collectors. (Default is False)
 
         Returns:
             dict | list[dict] | pandas.DataFrame
     """
     import os
-    import requests
     from datetime import datetime
 
     if exclude_from_location is not None:
-        drop_area = projection(location, r=distance)
+        drop_area = geo.bbox(location, exclude_from_location)
 
     # -------------------------
     # Helpers
@@ -1138,8 +1383,6 @@ def getSound(
         }
         return params
 
-    session = requests.Session()
-
     # -------------------------
     # Fetch + post-filter
     # -------------------------
@@ -1154,7 +1397,7 @@ def getSound(
         try:
             for page in range(1, max_pages + 1):
                 params["page"] = page
-                r = session.get(endpoint, params=params, headers=headers, timeout=999)
+                r = http_client.get(endpoint, params=params, headers=headers)
 
                 if r.status_code == 400 and attempt == 1 and year is not None:
                     # likely date format issue; retry without Z
@@ -1168,7 +1411,14 @@ def getSound(
                 if not page_results:
                     break
 
-                for s in page_results:
+                # geotags ("lat lon") of the whole page: exclusion window and distances in one pass
+                geotags = [str(s.get("geotag") or "").split() for s in page_results]
+                s_lats = geo.to_float_array([g[0] if len(g) == 2 else None for g in geotags])
+                s_lons = geo.to_float_array([g[1] if len(g) == 2 else None for g in geotags])
+                s_dists = geo.haversine(lat, lon, s_lats, s_lons)
+                s_excluded = geo.in_bbox(s_lons, s_lats, drop_area) if exclude_from_location is not None else np.zeros(len(page_results), bool)
+
+                for s, s_lat, s_lon, dist, excluded in zip(page_results, s_lats, s_lons, s_dists, s_excluded):
                     sid = s.get("id")
                     if sid is None or sid in seen:
                         continue
@@ -1180,19 +1430,10 @@ def getSound(
                     if hours and created_dt and created_dt.hour not in hours:
                         continue
 
-                    # Parse geotag "lat lon"
-                    s_lat = s_lon = None
-                    if s.get("geotag"):
-                        parts = str(s["geotag"]).split()
-                        if len(parts) == 2:
-                            try:
-                                s_lat = float(parts[0])
-                                s_lon = float(parts[1])
-                                if exclude_from_location is not None:
-                                    if is_coordinate_in_bbox(s_lon, s_lat, drop_area):
-                                        continue
-                            except Exception:
-                                pass
+                    if excluded:
+                        continue
+                    s_lat = None if np.isnan(s_lat) else float(s_lat)
+                    s_lon = None if np.isnan(s_lon) else float(s_lon)
 
                     out = {
                         "loc_id": '',
@@ -1206,7 +1447,7 @@ def getSound(
                         "geotag": s.get("geotag"),
                         "latitude": s_lat,
                         "longitude": s_lon,
-                        "distance_m": haversine_m(lat, lon, s_lat, s_lon) if (s_lat is not None and s_lon is not None) else None,
+                        "distance_m": None if np.isnan(dist) else float(dist),
                         "previews": s.get("previews"),
                         "url": s.get("url"),
                         "page_url": f"https://freesound.org/people/{s.get('username')}/sounds/{sid}/" if s.get("username") and sid else None,
@@ -1242,6 +1483,8 @@ def getSound(
     # -------------------------
     # Return shape
     # -------------------------
+    if output_df and output_columns:
+        return _nearest_columns(results, max_return, expand='previews')
     if output_df:
         import pandas as pd
         df = pd.DataFrame(results)
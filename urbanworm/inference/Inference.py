@@ -1,6 +1,8 @@
 from __future__ import annotations
 import logging
 from ..dataset import GeoTaggedData
+from .cache import ResponseCache
+from .format import schema_json
 
 def _pack(locations, dataset):
     packed_data = []
@@ -24,7 +26,8 @@ class Inference:
                  audio: str|list|tuple = None,
                  audios: list|tuple = None,
                  geo_tagged_data: GeoTaggedData = None,
-                 schema: dict = None):
+                 schema: dict = None,
+                 cache: str | ResponseCache = None):
         '''
             Args:
                 image (str | list | tuple): The image path.
@@ -33,6 +36,8 @@ class Inference:
                 audios (list | tuple): A list of audio paths.
                 geo_tagged_data (GeoTaggedData): Data constructor.
                 schema (dict): The response format.
+                cache (str | ResponseCache, optional): A path to an SQLite file (or a ResponseCache) used to
+                    cache validated responses across runs. (Default is None, no caching)
         '''
 
         self.batch_images = self.batch_audios = self.batch_audios_slice = None
@@ -50,8 +55,24 @@ class Inference:
         else:
             self.schema = schema
 
+        self.cache = ResponseCache(cache) if isinstance(cache, str) else cache
+        self.checkpoint = None
+        self._checkpoint_inputs = None
         self.logger = logging.getLogger("urbanworm")
 
+    def _cache_key(self, model, system, prompt, media, schema, **sampling) -> str | None:
+        if self.cache is None:
+            return None
+        return self.cache.make_key(model=model, system=system, prompt=prompt, media=media,
+                                   schema_json=schema_json(schema) if schema is not None else None,
+                                   **sampling)
+
+    def _load_results(self) -> dict | None:
+        # results of a checkpointed run are read back from disk only when they are needed
+        if self.checkpoint is not None:
+            return self.checkpoint.load(self._checkpoint_inputs)
+        return self.results
+
     def extract_from_geo_tagged_data(self):
         if self.geo_tagged_data is not None:
             if self.geo_tagged_data.images is not None:
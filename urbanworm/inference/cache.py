@@ -0,0 +1,172 @@
+from __future__ import annotations
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from ..utils.blob_store import BlobRef
+from ..utils.views import PerspectiveView
+
+
+class ResponseCache:
+    '''
+    Content-addressed on-disk cache of validated MLLM responses (SQLite).
+
+    Entries are keyed by a hash of everything that determines a response (model,
+    messages, image bytes, response schema and sampling parameters). When the
+    cache grows over its size bound, the least recently used entries are evicted.
+
+    Args:
+        path (str): The SQLite file. (Default is urbanworm_cache.sqlite)
+        max_size_mb (float): Maximum total size of the stored responses in megabytes. (Default is 512)
+        max_entries (int, optional): Maximum number of entries.
+
+    Examples:
+        model = InferenceOllama(llm='gemma3:12b', images=imgs, cache='responses.sqlite')
+        model.batch_inference(prompt=...)
+        model.cache.stats()
+    '''
+
+    def __init__(self,
+                 path: str = 'urbanworm_cache.sqlite',
+                 max_size_mb: float = 512,
+                 max_entries: int = None):
+        self.path = str(path)
+        self.max_size = int(max_size_mb * 1024 * 1024) if max_size_mb is not None else None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+
+    @staticmethod
+    def make_key(model: str = None,
+                 system: str = None,
+                 prompt: str = None,
+                 media: list | tuple = None,
+                 schema_json: str = None,
+                 **sampling) -> str:
+        '''
+        Hash the inputs of one generation into a cache key.
+
+        Args:
+            model (str): The model id (or paths of the model files).
+            system (str): The system message.
+            prompt (str): The prompt message.
+            media (list): Images/audios as paths, URLs, base64 strings or bytes.
+            schema_json (str): The response schema as JSON.
+            **sampling: Sampling parameters (e.g. temp, top_k, top_p, seed).
+
+        Returns:
+            str: The hex digest.
+        '''
+        h = hashlib.sha256()
+        head = {'model': model, 'system': system, 'prompt': prompt, 'schema': schema_json,
+                'sampling': sampling}
+        h.update(json.dumps(head, sort_keys=True, default=str).encode('utf-8'))
+        for m in (media or []):
+            h.update(b'\x00')
+            h.update(_media_digest(m))
+        return h.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._conn:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def __contains__(self, key: str) -> bool:
+        # a lookup that does not count as a hit or a miss, nor refresh the entry
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value.encode('utf-8')), time.time())
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        if self.max_size is not None:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_size:
+                rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+                drop = []
+                for key, size in rows:
+                    if total <= self.max_size:
+                        break
+                    drop.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", drop)
+
+    def stats(self) -> dict:
+        '''
+        Returns:
+            dict: hits, misses, number of entries and total size in bytes.
+        '''
+        with self._lock:
+            n, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': n, 'size': size}
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+        self.hits = self.misses = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        return self.stats()['entries']
+
+
+def _media_digest(m) -> bytes:
+    if isinstance(m, (bytes, bytearray)):
+        return hashlib.sha256(m).digest()
+    if isinstance(m, str):
+        if os.path.isfile(m):
+            h = hashlib.sha256()
+            with open(m, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(chunk)
+            return h.digest()
+        try:
+            return hashlib.sha256(base64.b64decode(m, validate=True)).digest()
+        except (binascii.Error, ValueError):
+            # URLs (and anything else) are keyed by the string itself
+            return hashlib.sha256(m.encode('utf-8')).digest()
+    if isinstance(m, PerspectiveView):
+        # keyed by the view spec, so that the view is not rendered only to compute the key
+        return hashlib.sha256(str(m).encode('utf-8')).digest()
+    if isinstance(m, BlobRef):
+        # same digest as the bytes (or base64 string) of the image
+        return hashlib.sha256(m.read()).digest()
+    if hasattr(m, 'tobytes'):
+        # image arrays
+        return hashlib.sha256(str(m.shape).encode('utf-8') + m.tobytes()).digest()
+    return hashlib.sha256(repr(m).encode('utf-8')).digest()
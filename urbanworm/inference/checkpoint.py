@@ -0,0 +1,129 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+from collections import Counter, deque
+from typing import Iterator
+
+
+class Checkpoint:
+    '''
+    Append-only JSON Lines file of batch inference results.
+
+    Each validated response is written as one line as soon as it is available,
+    so an interrupted run can be resumed by skipping the inputs already in the
+    file, and results do not have to be kept in memory.
+
+    Args:
+        path (str): The .jsonl file. It is created if it does not exist.
+    '''
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+
+    @staticmethod
+    def item_key(item) -> str:
+        '''
+        Key of one input (an image/audio path, URL, base64 string or image array, or a list of them).
+        '''
+        if hasattr(item, 'tobytes'):
+            # image arrays: str() would only give an abbreviated repr
+            return hashlib.sha1(str(item.shape).encode('utf-8') + item.tobytes()).hexdigest()
+        if isinstance(item, (list, tuple)):
+            raw = '\x00'.join(Checkpoint.item_key(i) if hasattr(i, 'tobytes') else str(i) for i in item)
+        else:
+            raw = str(item)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def records(self) -> Iterator[dict]:
+        '''
+        Iterate over the stored records without loading the whole file.
+        A truncated last line (e.g. from a crash while writing) is ignored.
+        '''
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def pending(self, items: list | tuple) -> list[int]:
+        '''
+        Indices of the inputs that are not in the checkpoint yet.
+        Repeated inputs are matched by count, so each occurrence is processed once.
+        '''
+        done = Counter(r['key'] for r in self.records())
+        todo = []
+        for i, item in enumerate(items):
+            key = self.item_key(item)
+            if done[key] > 0:
+                done[key] -= 1
+            else:
+                todo.append(i)
+        return todo
+
+    @staticmethod
+    def item_ref(item):
+        '''
+        What is stored for an input: paths, URLs and blob/view references as they are,
+        and the key of anything else (base64 strings, image arrays), so the file does not hold the media.
+        '''
+        if isinstance(item, (list, tuple)):
+            return [Checkpoint.item_ref(i) for i in item]
+        if isinstance(item, str):
+            return item if '://' in item or os.path.exists(item) else Checkpoint.item_key(item)
+        if hasattr(item, 'tobytes'):
+            return Checkpoint.item_key(item)
+        return str(item)
+
+    def append(self, index: int, item, responses) -> None:
+        '''
+        Append the result of one input and flush it to disk.
+
+        Args:
+            index (int): Position of the input in the batch.
+            item: The input (used to compute the key and the stored reference).
+            responses: The JSON-serializable responses.
+        '''
+        record = {'index': index,
+                  'key': self.item_key(item),
+                  'responses': responses,
+                  'data': self.item_ref(item)}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load(self, items: list | tuple) -> dict:
+        '''
+        Read the records of `items`, in input order.
+        Records of other inputs (e.g. left in the file by a run on other data) are skipped,
+        and repeated inputs are matched by count, as in `pending`.
+
+        Args:
+            items (list | tuple): The inputs of the batch.
+
+        Returns:
+            dict: {'responses': [...], 'data': [...]}, the layout of `.results`, with the inputs as data.
+        '''
+        stored = {}
+        for r in self.records():
+            stored.setdefault(r['key'], deque()).append(r['responses'])
+        responses, data = [], []
+        for item in items:
+            found = stored.get(self.item_key(item))
+            if found:
+                responses.append(found.popleft())
+                data.append(item)
+        return {'responses': responses, 'data': data}
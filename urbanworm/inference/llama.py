@@ -1,17 +1,75 @@
 from __future__ import annotations
 
+import threading
 from os import unlink
 
+import asyncio
+import httpx
 import ollama
-from ollama import Client
+from ollama import AsyncClient, Client
 from tqdm import tqdm
 from ..utils.utils import *
-from typing import Union
+from ..utils.concurrency import imap_ordered
+from ..utils.pano2pers import encode_image
+from ..utils.blob_store import BlobRef
+from ..utils.views import PerspectiveView, prefetch_views, release_views
+from typing import Iterator, Union
 from .Inference import Inference
-from .format import Response, schema_json
+from .checkpoint import Checkpoint
+from .format import Response, schema_json, schema_dict
+from .llama_server import LlamaServer
+from pydantic import BaseModel
 from .format import create_format
 
 
+# models known to be available on each Ollama host, remembered for the lifetime of the process
+_AVAILABLE_MODELS = {}
+_AVAILABLE_MODELS_LOCK = threading.Lock()
+
+
+def _full_model_name(name: str) -> str:
+    return name if ':' in name.split('/')[-1] else f'{name}:latest'
+
+
+# the types of one image input (a list of them is a multi-image input)
+_IMAGE_TYPES = (str, np.ndarray, BlobRef, PerspectiveView)
+
+
+def _ollama_image(img):
+    # Ollama takes paths, URLs and base64 strings
+    if isinstance(img, np.ndarray):
+        return encode_image(img, 'png')
+    if isinstance(img, (BlobRef, PerspectiveView)):
+        return img.to_base64()
+    return img
+
+
+def ensure_model(llm: str, client: Client = None, host: str = None) -> None:
+    '''
+    Make sure an Ollama model is available locally.
+
+    The local model list is checked once per process (and host), and the model is pulled only if it is missing.
+
+    Args:
+        llm (str): model checkpoint.
+        client (Client, optional): The Ollama client to use. (Default is the module-level client)
+        host (str, optional): The host of `client`, used to remember the result.
+    '''
+    api = client if client is not None else ollama
+    name = _full_model_name(llm)
+    if name in _AVAILABLE_MODELS.get(host, ()):
+        return None
+    with _AVAILABLE_MODELS_LOCK:
+        available = _AVAILABLE_MODELS.get(host)
+        if available is None:
+            available = {_full_model_name(m.model) for m in api.list().models if m.model}
+            _AVAILABLE_MODELS[host] = available
+        if name not in available:
+            api.pull(llm)
+            available.add(name)
+    return None
+
+
 class InferenceOllama(Inference):
     '''
     Constructor for vision inference using MLLMs with Ollama.
@@ -19,17 +77,76 @@ class InferenceOllama(Inference):
     Args:
         llm (str): model checkpoint.
         ollama_key (str): The Ollama API key.
+        keep_alive (str | float): How long Ollama keeps the model loaded after a request. (Default is '10m')
+        preload (bool): Whether to pull (if missing) and load the model when the object is created,
+            so the first request does not pay the cold-load cost. (Default is True)
+        host (str, optional): The Ollama host. (Default is OLLAMA_HOST or the local server,
+            https://ollama.com if `ollama_key` is given)
+        timeout (float, optional): Timeout in seconds for one request. (Default is None, no timeout)
+        pool_size (int): Maximum number of pooled keep-alive connections. (Default is 10)
         **kwargs: image (str|list[str]|tuple[str]), images (list|tuple), data constructor (GeoTaggedData), and schema (dict)
     '''
 
     def __init__(self,
                  llm: str = None,
                  ollama_key: str = None,
+                 keep_alive: str | float = '10m',
+                 preload: bool = True,
+                 host: str = None,
+                 timeout: float = None,
+                 pool_size: int = 10,
                  **kwargs) -> None:
         super().__init__(**kwargs)
         self.llm = llm
         self.skip_errors = True
         self.ollama_key = ollama_key
+        self.keep_alive = keep_alive
+        self.host = host if host is not None else ("https://ollama.com" if self._is_cloud() else None)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+        if preload and llm is not None and not self._is_cloud():
+            try:
+                self._ensure_model()
+                # a generate request without a prompt only loads the model into memory
+                self.client.generate(model=llm, keep_alive=keep_alive)
+            except Exception as e:
+                self.logger.warning("could not preload %s (%s).", llm, e)
+
+    def _is_cloud(self) -> bool:
+        return (self.ollama_key is not None) and (self.ollama_key != '')
+
+    def _client_kwargs(self) -> dict:
+        kwargs = {
+            'host': self.host,
+            'timeout': self.timeout,
+            'limits': httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        }
+        if self._is_cloud():
+            kwargs['headers'] = {'Authorization': 'Bearer ' + self.ollama_key}
+        return kwargs
+
+    @property
+    def client(self) -> Client:
+        '''The pooled Ollama client of this object.'''
+        if self._client is None:
+            self._client = Client(**self._client_kwargs())
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncClient:
+        '''The pooled asynchronous Ollama client of this object (bound to the running event loop).'''
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = AsyncClient(**self._client_kwargs())
+            self._async_loop = loop
+        return self._async_client
+
+    def _ensure_model(self) -> None:
+        if not self._is_cloud():
+            ensure_model(self.llm, self.client, self.host)
 
     def one_inference(self,
                       system: str = '',
@@ -60,7 +177,7 @@ class InferenceOllama(Inference):
             dict: A dictionary includes questions/messages, responses/answers
         '''
 
-        ollama.pull(self.llm, stream=True)
+        self._ensure_model()
         audio_input = False
         multiImg = False
         if image is None and audio is not None:
@@ -71,7 +188,7 @@ class InferenceOllama(Inference):
         else:
             img = self.img
         if isinstance(img, list) or isinstance(img, tuple):
-            if not isinstance(img[0], str):
+            if not isinstance(img[0], _IMAGE_TYPES):
                 self.logger.warning("a list of images can only be a flatten list")
             multiImg = True
         else:
@@ -97,6 +214,8 @@ class InferenceOllama(Inference):
                         temp: float = 0.0,
                         top_k: int = 20,
                         top_p: float = 0.8,
+                        max_concurrency: int = 1,
+                        checkpoint_path: str = None,
                         disableProgressBar: bool = False) -> dict:
         '''
         Chat with MLLM model for each image.
@@ -107,13 +226,17 @@ class InferenceOllama(Inference):
             temp (float): The temperature value.
             top_k (float): The top_k value.
             top_p (float): The top_p value.
+            max_concurrency (int): The number of requests kept in flight at the same time.
+                Set it to the number of parallel requests Ollama can serve (OLLAMA_NUM_PARALLEL). (Default is 1)
+            checkpoint_path (str, optional): A .jsonl file where each validated response is appended as soon as it
+                returns. Inputs already in the file are skipped, so an interrupted run can be resumed.
             disableProgressBar (bool): The progress bar for showing the progress of data analysis over the units.
 
         Returns:
             list A list of dictionaries. Each dict includes questions/messages, responses/answers, and image base64 (if required)
         '''
 
-        ollama.pull(self.llm, stream=True)
+        self._ensure_model()
         dic = {'responses': [], 'data': []}
 
         if self.batch_images is not None:
@@ -127,27 +250,174 @@ class InferenceOllama(Inference):
         if isinstance(imgs[0], list) or isinstance(imgs[0], tuple):
             multiImgInput = True
 
-        for i in tqdm(range(len(imgs)), desc="Processing...", ncols=75, disable=disableProgressBar):
-            img = imgs[i]
-            try:
-                r = self._mtmd(model=self.llm,
-                               system=system, prompt=prompt,
-                               img=img if multiImgInput else [img],
-                               temp=temp, top_k=top_k, top_p=top_p,
-                               schema=schema,
-                               one_shot_lr=[],
-                               multiImgInput=multiImgInput)
-                rr = r.responses
-            except Exception as e:
-                # Log and continue; capture an error stub so downstream stays consistent
-                self.logger.warning("batch_inference: image %d failed (%s). Continuing.", i, e)
-                rr = {'error': str(e), 'data': None}
-
+        def run(i):
+            return self._batch_item(i, imgs[i], system, prompt, temp, top_k, top_p, schema, multiImgInput)
+
+        def cached(i):
+            return self._is_cached(imgs[i], system, prompt, temp, top_k, top_p, schema, multiImgInput)
+
+        self.checkpoint = Checkpoint(checkpoint_path) if checkpoint_path is not None else None
+        self._checkpoint_inputs = imgs
+        todo = self.checkpoint.pending(imgs) if self.checkpoint is not None else range(len(imgs))
+
+        # lazy views of the next inputs are rendered while the current ones are processed
+        # (unless their responses are cached)
+        results = imap_ordered(run, prefetch_views(todo, imgs.__getitem__, skip=cached), max_workers=max_concurrency)
+        for i, rr in zip(todo, tqdm(results, total=len(todo), desc="Processing...", ncols=75, disable=disableProgressBar)):
+            if self.checkpoint is not None:
+                # error stubs are not checkpointed, so they are retried when the run is resumed
+                if not isinstance(rr, dict):
+                    self.checkpoint.append(i, imgs[i], [q.model_dump() for q in rr])
+                continue
             dic['responses'] += [rr]
             dic['data'] += [imgs[i]]
-        self.results = dic
+        self.results = dic if self.checkpoint is None else None
         return self.to_df(output=True)
 
+    def iter_inference(self,
+                       system: str = '',
+                       prompt: str = '',
+                       temp: float = 0.0,
+                       top_k: int = 20,
+                       top_p: float = 0.8,
+                       max_concurrency: int = 1) -> Iterator[dict]:
+        '''
+        Chat with MLLM model for each image and yield the results one by one.
+
+        Nothing is accumulated in `.results`, so memory stays constant for any number of images.
+
+        Args:
+            system (str, optinal): The system message.
+            prompt (str): The prompt message.
+            temp (float): The temperature value.
+            top_k (float): The top_k value.
+            top_p (float): The top_p value.
+            max_concurrency (int): The number of requests kept in flight at the same time. (Default is 1)
+
+        Yields:
+            dict: One flattened row per image, with the columns of `.to_df()`
+            (or `index`, `error` and `data` if the image failed), in input order.
+        '''
+
+        self._ensure_model()
+
+        if self.batch_images is not None:
+            imgs = self.batch_images
+        else:
+            imgs = self.imgs
+
+        schema = create_format(self.schema)
+
+        multiImgInput = False
+        if isinstance(imgs[0], list) or isinstance(imgs[0], tuple):
+            multiImgInput = True
+
+        def run(i):
+            return self._batch_item(i, imgs[i], system, prompt, temp, top_k, top_p, schema, multiImgInput)
+
+        def cached(i):
+            return self._is_cached(imgs[i], system, prompt, temp, top_k, top_p, schema, multiImgInput)
+
+        todo = range(len(imgs))
+        for i, rr in enumerate(imap_ordered(run, prefetch_views(todo, imgs.__getitem__, skip=cached),
+                                            max_workers=max_concurrency)):
+            if isinstance(rr, dict):
+                yield {'index': i, 'error': rr['error'], 'data': imgs[i]}
+            else:
+                yield response2df({'responses': [rr], 'data': [imgs[i]]}).iloc[0].to_dict()
+
+    async def abatch_inference(self,
+                               system: str = '',
+                               prompt: str = '',
+                               temp: float = 0.0,
+                               top_k: int = 20,
+                               top_p: float = 0.8,
+                               max_concurrency: int = 8,
+                               disableProgressBar: bool = False) -> pd.DataFrame:
+        '''
+        Chat with MLLM model for each image with the asynchronous client.
+
+        Args:
+            system (str, optinal): The system message.
+            prompt (str): The prompt message.
+            temp (float): The temperature value.
+            top_k (float): The top_k value.
+            top_p (float): The top_p value.
+            max_concurrency (int): The number of requests kept in flight at the same time. (Default is 8)
+            disableProgressBar (bool): The progress bar for showing the progress of data analysis over the units.
+
+        Examples:
+            model = InferenceOllama(llm='gemma3:12b', host='http://gpu-node:11434', pool_size=32, images=imgs)
+            df = await model.abatch_inference(prompt=..., max_concurrency=32)
+
+        Returns:
+            pd.DataFrame: A DataFrame containing responses and associated metadata.
+        '''
+
+        await asyncio.to_thread(self._ensure_model)
+
+        if self.batch_images is not None:
+            imgs = self.batch_images
+        else:
+            imgs = self.imgs
+
+        schema = create_format(self.schema)
+
+        multiImgInput = False
+        if isinstance(imgs[0], list) or isinstance(imgs[0], tuple):
+            multiImgInput = True
+
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        progress = tqdm(total=len(imgs), desc="Processing...", ncols=75, disable=disableProgressBar)
+
+        async def run(i):
+            async with semaphore:
+                try:
+                    r = await self._amtmd(model=self.llm,
+                                          system=system, prompt=prompt,
+                                          img=imgs[i] if multiImgInput else [imgs[i]],
+                                          temp=temp, top_k=top_k, top_p=top_p,
+                                          schema=schema,
+                                          multiImgInput=multiImgInput)
+                    rr = r.responses
+                except Exception as e:
+                    self.logger.warning("abatch_inference: image %d failed (%s). Continuing.", i, e)
+                    rr = {'error': str(e), 'data': None}
+            progress.update(1)
+            return rr
+
+        try:
+            responses = await asyncio.gather(*[run(i) for i in range(len(imgs))])
+        finally:
+            progress.close()
+        self.results = {'responses': list(responses), 'data': list(imgs)}
+        return self.to_df(output=True)
+
+    def _batch_item(self, i, img, system, prompt, temp, top_k, top_p, schema, multiImgInput):
+        try:
+            r = self._mtmd(model=self.llm,
+                           system=system, prompt=prompt,
+                           img=img if multiImgInput else [img],
+                           temp=temp, top_k=top_k, top_p=top_p,
+                           schema=schema,
+                           one_shot_lr=[],
+                           multiImgInput=multiImgInput)
+            return r.responses
+        except Exception as e:
+            # Log and continue; capture an error stub so downstream stays consistent
+            self.logger.warning("batch_inference: image %d failed (%s). Continuing.", i, e)
+            return {'error': str(e), 'data': None}
+        finally:
+            # prefetched views not consumed (e.g. the response was cached) must not outlive the item
+            release_views(img)
+
+    def _is_cached(self, img, system, prompt, temp, top_k, top_p, schema, multiImgInput) -> bool:
+        # whether _batch_item would get the response of an input from the cache (same key as _mtmd)
+        key = self._cache_key(self.llm, system, prompt, img if multiImgInput else [img], schema,
+                              temp=temp, top_k=top_k, top_p=top_p,
+                              one_shot_lr=[], multiImgInput=multiImgInput)
+        return key is not None and key in self.cache
+
     def to_df(self, output: bool = True) -> pd.DataFrame | str:
         """
         Convert the output from an MLLM reponse (from .batch_inference) into a DataFrame.
@@ -159,8 +429,12 @@ class InferenceOllama(Inference):
             str: An error message if `.batch_inference()` has not been run or if the format is unsupported.
         """
 
-        if self.results is not None:
-            self.df = response2df(self.results)
+        results = self._load_results()
+        if results is not None and self.checkpoint is not None:
+            item = create_format(self.schema)
+            results['responses'] = [item.model_validate({'responses': r}).responses for r in results['responses']]
+        if results is not None:
+            self.df = response2df(results)
             if output:
                 return self.df
         return None
@@ -170,6 +444,48 @@ class InferenceOllama(Inference):
               schema = None,
               one_shot_lr: list | tuple = [], multiImgInput: bool = False, audio_input: bool = False):
 
+        key = self._cache_key(model, system, prompt, img, schema,
+                              temp=temp, top_k=top_k, top_p=top_p,
+                              one_shot_lr=one_shot_lr, multiImgInput=multiImgInput)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return schema.model_validate_json(cached)
+        r = self._generate(model, system, prompt, img, temp, top_k, top_p, schema, one_shot_lr, multiImgInput)
+        if key is not None and isinstance(r, BaseModel):
+            self.cache.put(key, r.model_dump_json())
+        return r
+
+    async def _amtmd(self, model: str = None, system: str = None, prompt: str = None,
+                     img: list[str] = None, temp: float = None, top_k: float = None, top_p: float = None,
+                     schema = None,
+                     one_shot_lr: list | tuple = [], multiImgInput: bool = False):
+
+        if prompt is None or img is None:
+            raise Exception("Prompt or image(s) is missing.")
+
+        key = self._cache_key(model, system, prompt, img, schema,
+                              temp=temp, top_k=top_k, top_p=top_p,
+                              one_shot_lr=one_shot_lr, multiImgInput=multiImgInput)
+        if key is not None:
+            cached = await asyncio.to_thread(self.cache.get, key)
+            if cached is not None:
+                return schema.model_validate_json(cached)
+
+        if len(img) >= 2:
+            system = f'You are analyzing aerial or street view images. For street view, you should just focus on the building and yard in the middle. {system}'
+        messages = self._messages(system, prompt, img[0] if len(img) == 1 else img, list(one_shot_lr))
+        res = await self.async_client.chat(**self._chat_kwargs(model, messages, schema, temp, top_k, top_p))
+        r = self._validate(res, schema)
+        if key is not None:
+            await asyncio.to_thread(self.cache.put, key, r.model_dump_json())
+        return r
+
+    def _generate(self, model: str = None, system: str = None, prompt: str = None,
+                  img: list[str] = None, temp: float = None, top_k: float = None, top_p: float = None,
+                  schema = None,
+                  one_shot_lr: list | tuple = [], multiImgInput: bool = False):
+
         if prompt is not None and img is not None:
             if len(img) == 1:
                 return self._customized_chat(model, system, prompt, img[0], temp, top_k, top_p, schema, one_shot_lr)
@@ -195,12 +511,22 @@ class InferenceOllama(Inference):
                          one_shot_lr: list = [],
                          audio_input: bool = False) -> Response:
 
+        messages = self._messages(system, prompt, img, one_shot_lr)
+        res = self.client.chat(**self._chat_kwargs(model, messages, schema, temp, top_k, top_p))
+        return self._validate(res, schema)
+
+    def _messages(self, system, prompt, img, one_shot_lr) -> list:
         if isinstance(one_shot_lr, list):
             if len(one_shot_lr) > 0:
                 if not isinstance(one_shot_lr[0], dict):
                     raise Exception("Please provide a list of dictionaries.")
 
         if img is not None:
+            # image arrays (image_format='ndarray') are encoded, blob store handles read and lazy views rendered only here
+            if isinstance(img, (np.ndarray, BlobRef, PerspectiveView)):
+                img = _ollama_image(img)
+            elif isinstance(img, (list, tuple)):
+                img = [_ollama_image(i) for i in img]
             if isinstance(img, str):
                 messages = [
                                {
@@ -235,34 +561,20 @@ class InferenceOllama(Inference):
                                'content': prompt,
                            }
                        ]
-
-        if (self.ollama_key is not None) and (self.ollama_key != ''):
-            client = Client(
-                host="https://ollama.com",
-                headers={'Authorization': 'Bearer ' + self.ollama_key},
-            )
-            res = client.chat(
-                model=model,
-                format=schema.model_json_schema(),
-                messages=messages,
-                options={
-                    "temperature": temp,
-                    "top_k": top_k,
-                    "top_p": top_p
-                }
-            )
-        else:
-            res = ollama.chat(
-                model=model,
-                format=schema.model_json_schema(),
-                messages=messages,
-                options={
-                    "temperature": temp,
-                    "top_k": top_k,
-                    "top_p": top_p
-                }
-            )
-
+        return messages
+
+    def _chat_kwargs(self, model, messages, schema, temp, top_k, top_p) -> dict:
+        return dict(model=model,
+                    format=schema.model_json_schema(),
+                    messages=messages,
+                    keep_alive=self.keep_alive,
+                    options={
+                        "temperature": temp,
+                        "top_k": top_k,
+                        "top_p": top_p
+                    })
+
+    def _validate(self, res, schema) -> Response:
         raw_text = res.message.content
         try:
             return schema.model_validate_json(raw_text)
@@ -285,6 +597,7 @@ class InferenceOllama(Inference):
             raise
 
 
+import json
 import pandas as pd
 from ..utils.utils import extract_last_json, responses_to_wide_all_columns
 import subprocess
@@ -299,14 +612,51 @@ class InferenceLlamacpp(Inference):
         a local path to model file (.gguf)
         mp (str, optional): If `llm` is provided as a local path to model file (.gguf),
         `mp` has to be provided as a local path to multimodal projector file (*mproj*.gguf).
+        server (bool | str | LlamaServer, optional): Run inference through a persistent llama-server instead of
+        one llama-mtmd-cli process per input. True starts a server with `llm`/`mp` on the first call,
+        a URL connects to a llama-server that is already running. (Default is False)
         **kwargs: image (str|list[str]|tuple[str]), images (list|tuple), data constructor (GeoTaggedData), and schema (dict)
     '''
 
     def __init__(self, llm:str = None, mp:str = None,
+                 server: bool | str | LlamaServer = False,
                  **kwargs):
         super().__init__(**kwargs)
         self.llm = llm
         self.mp = mp
+        self.server = server
+        self._server_lock = threading.Lock()
+
+    def _get_server(self, ctx_size: int = 4096, n_parallel: int = None) -> LlamaServer | None:
+        '''
+        The llama-server of this object, started on the first call. A server started by this object
+        is restarted when `ctx_size` changes or when more than its number of slots (`n_parallel`) is requested.
+        '''
+        if self.server is None or self.server is False:
+            return None
+        with self._server_lock:
+            if self.server is True:
+                self.server = LlamaServer(llm=self.llm, mp=self.mp, ctx_size=ctx_size,
+                                          n_parallel=max(n_parallel or 1, 1))
+            elif isinstance(self.server, str):
+                self.server = LlamaServer(url=self.server)
+            elif self.server.process is not None and (
+                    ctx_size != self.server.ctx_size or (n_parallel or 1) > self.server.n_parallel):
+                self.logger.info("restarting llama-server with ctx_size=%s and %s slots.",
+                                 ctx_size, max(n_parallel or 1, self.server.n_parallel))
+                self.server.stop()
+                self.server.ctx_size = ctx_size
+                self.server.n_parallel = max(n_parallel or 1, self.server.n_parallel)
+            if self.server.url is None:
+                self.server.start()
+            return self.server
+
+    def close(self) -> None:
+        '''
+            Stop the llama-server started by this object (if any).
+        '''
+        if isinstance(self.server, LlamaServer):
+            self.server.stop()
 
     def one_inference(self,
                       system: str = '',
@@ -340,9 +690,9 @@ class InferenceLlamacpp(Inference):
 
         if not audio_input:
             if image is not None:
-                im = [image] if isinstance(image, str) else image
+                im = [image] if isinstance(image, _IMAGE_TYPES) else image
             else:
-                im = [self.img] if isinstance(self.img, str) else self.img
+                im = [self.img] if isinstance(self.img, _IMAGE_TYPES) else self.img
 
         else:
             if audio is not None:
@@ -351,7 +701,7 @@ class InferenceLlamacpp(Inference):
                 im = [self.audio] if isinstance(self.audio, str) else self.audio
 
         if isinstance(im, list) or isinstance(im, tuple):
-            if not isinstance(im[0], str):
+            if not isinstance(im[0], _IMAGE_TYPES):
                 self.logger.warning("a list of images can only be a flatten list")
                 return None
 
@@ -359,19 +709,14 @@ class InferenceLlamacpp(Inference):
         im_ = []
         if not audio_input:
             for i in im:
-                if is_base64(i):
-                    temp = base64img2temp(i)
-                    im_ += [temp]
-                elif is_url(i):
-                    temp = url2temp(i)
-                    im_ += [temp]
-                else:
-                    pass
+                tmp = image2temp(i)
+                if tmp is not None:
+                    im_ += [tmp]
         else:
             for i in range(len(im)):
                 if is_url(im[i]):
-                    temp = sound_url_to_temp(im[i])
-                    im_ += [temp]
+                    tmp = sound_url_to_temp(im[i])
+                    im_ += [tmp]
                 else:
                     pass
 
@@ -379,7 +724,7 @@ class InferenceLlamacpp(Inference):
             # ims_origin = im
             im = im_
 
-        if llm is None:
+        if llm is None and not self.server:
             self.logger.warning("model cannot be None")
             return None
 
@@ -418,6 +763,8 @@ class InferenceLlamacpp(Inference):
                         seed: int = 3407,
                         ctx_size: int = 4096,
                         audio_input = False,
+                        max_concurrency: int = 1,
+                        checkpoint_path: str = None,
                         disableProgressBar: bool = False):
         '''
             Chat with MLLM model for each image in a list.
@@ -431,13 +778,15 @@ class InferenceLlamacpp(Inference):
                 seed (int): The seed value (Default is 3407)
                 ctx_size (int): Size of context (Default is 4096)
                 audio_input (bool): Whether to run inference with audio input
+                max_concurrency (int): The number of inputs processed at the same time. With `server=True`,
+                    the llama-server is started with the same number of slots. (Default is 1)
+                checkpoint_path (str, optional): A .jsonl file where each validated response is appended as soon as
+                    it returns. Inputs already in the file are skipped, so an interrupted run can be resumed.
                 disableProgressBar (bool): Whether to disable progress bar.
             Returns: response from MLLM as a dataframe
         '''
 
         dic = {'responses': [], 'data': []}
-        llm = self.llm
-        mp = self.mp
         clips = None
         if not audio_input:
             if self.batch_images is not None:
@@ -452,77 +801,150 @@ class InferenceLlamacpp(Inference):
                 imgs = self.audios
 
         schema = create_format(self.schema)
+        # start (or connect to) the server once before fanning out
+        self._get_server(ctx_size, n_parallel=max_concurrency)
+
+        def run(i):
+            return self._batch_item(imgs[i], clips, system, prompt, temp, top_k, top_p, min_p, seed,
+                                    ctx_size, schema, audio_input)
+
+        self.checkpoint = Checkpoint(checkpoint_path) if checkpoint_path is not None else None
+        self._checkpoint_inputs = imgs
+        todo = self.checkpoint.pending(imgs) if self.checkpoint is not None else range(len(imgs))
+
+        results = imap_ordered(run, prefetch_views(todo, imgs.__getitem__), max_workers=max_concurrency)
+        for i, res in zip(todo, tqdm(results, total=len(todo), desc="Processing...", ncols=75, disable=disableProgressBar)):
+            if isinstance(res, dict):
+                continue
+            if self.checkpoint is not None:
+                # bad responses are not checkpointed, so they are retried when the run is resumed
+                if isinstance(res[0], dict):
+                    self.checkpoint.append(i, imgs[i], res[0])
+                continue
+            dic['responses'] += [res[0]]
+            dic['data'] += [res[1]]
+
+        self.results = dic if self.checkpoint is None else None
+        return self.to_df(output=True)
 
-        for i in tqdm(range(len(imgs)), desc="Processing...", ncols=75, disable=disableProgressBar):
-            ims = [imgs[i]] if isinstance(imgs[i], str) else imgs[i]
-
-            ims_origin = None
-            ims_ = []
-            if not audio_input:
-                for im in ims:
-                    if is_base64(im):
-                        temp = base64img2temp(im)
-                        ims_ += [temp]
-                    elif is_url(im):
-                        temp = url2temp(im)
-                        ims_ += [temp]
-                    else:
-                        pass
+    def iter_inference(self,
+                       system: str = '',
+                       prompt: str = '',
+                       temp: float = 0.2,
+                       top_k: int = 20,
+                       top_p: float = 0.8,
+                       min_p: float = 0.0,
+                       seed: int = 3407,
+                       ctx_size: int = 4096,
+                       audio_input = False,
+                       max_concurrency: int = 1) -> Iterator[dict]:
+        '''
+            Chat with MLLM model for each image in a list and yield the results one by one.
+            Nothing is accumulated in `.results`, so memory stays constant for any number of inputs.
+            Args:
+                system (str, optional): The system message.
+                prompt (str): The prompt message.
+                temp (float): The temperature value (default: 0.2)
+                top_k (float): The top_k value (default: 20)
+                top_p (float): The top_p value (default: 0.8)
+                min_p (float): min-p sampling (default: 0.0, 0.0 = disabled)
+                seed (int): The seed value (Default is 3407)
+                ctx_size (int): Size of context (Default is 4096)
+                audio_input (bool): Whether to run inference with audio input
+                max_concurrency (int): The number of inputs processed at the same time. (Default is 1)
+            Yields: one flattened row (dict) per input with the columns of `.to_df()`
+            (or `index`, `error` and `data` if the input failed), in input order.
+        '''
+
+        clips = None
+        if not audio_input:
+            if self.batch_images is not None:
+                imgs = self.batch_images
             else:
-                for j in range(len(ims)):
-                    im = ims[j]
-                    if is_url(im):
-                        if clips is not None:
-                            clip = clips[j]
-                            temp = sound_url_to_temp(im, clip)
-                            ims_ += [temp]
-                        else:
-                            temp = sound_url_to_temp(im)
-                            ims_ += [temp]
-                    else:
-                        pass
+                imgs = self.imgs
+        else:
+            if self.batch_audios is not None:
+                imgs = self.batch_audios
+                clips = self.batch_audios_slice
+            else:
+                imgs = self.audios
 
-            if len(ims_) == len(ims):
-                ims_origin = ims
-                ims = ims_
+        schema = create_format(self.schema)
+        self._get_server(ctx_size, n_parallel=max_concurrency)
+
+        def run(i):
+            return self._batch_item(imgs[i], clips, system, prompt, temp, top_k, top_p, min_p, seed,
+                                    ctx_size, schema, audio_input)
+
+        todo = range(len(imgs))
+        for i, res in enumerate(imap_ordered(run, prefetch_views(todo, imgs.__getitem__), max_workers=max_concurrency)):
+            if isinstance(res, dict):
+                yield {'index': i, 'error': res['error'], 'data': imgs[i]}
+            elif not isinstance(res[0], dict):
+                yield {'index': i, 'error': str(res[0]), 'data': imgs[i]}
+            else:
+                yield self._response_row(res[0], res[1]).iloc[0].to_dict()
 
-            try:
-                r = None
-                try_times = 0
-                while r is None and try_times <= 5:
-                    r = self._mtmd(llm,
-                                   mp,
-                                   system,
-                                   prompt,
-                                   ims,
-                                   temperature=temp,
-                                   top_k=top_k,
-                                   top_p=top_p,
-                                   min_p=min_p,
-                                   seed = seed,
-                                   ctx_size=ctx_size,
-                                   schema=schema,
-                                   audio_input = audio_input)
-                    r = extract_last_json(r)
-                    try_times += 1
-
-                if r is None:
-                    r = 'Bad response'
-                dic['responses'] += [r]
-                dic['data'] += [ims] if ims_origin is None else [ims_origin]
-
-                if len(ims_) >= 1:
-                    for each in ims_:
-                        try:
-                            os.remove(each)
-                        except:
-                            pass
-            except Exception as e:
-                print(e)
-                pass
+    def _batch_item(self, item, clips, system, prompt, temp, top_k, top_p, min_p, seed,
+                    ctx_size, schema, audio_input):
+        ims = [item] if isinstance(item, _IMAGE_TYPES) else item
 
-        self.results = dic
-        return self.to_df(output=True)
+        ims_origin = None
+        ims_ = []
+        if not audio_input:
+            for im in ims:
+                tmp = image2temp(im)
+                if tmp is not None:
+                    ims_ += [tmp]
+        else:
+            for j in range(len(ims)):
+                im = ims[j]
+                if is_url(im):
+                    if clips is not None:
+                        clip = clips[j]
+                        ims_ += [sound_url_to_temp(im, clip)]
+                    else:
+                        ims_ += [sound_url_to_temp(im)]
+                else:
+                    pass
+
+        if len(ims_) == len(ims):
+            ims_origin = ims
+            ims = ims_
+
+        try:
+            r = None
+            try_times = 0
+            while r is None and try_times <= 5:
+                r = self._mtmd(self.llm,
+                               self.mp,
+                               system,
+                               prompt,
+                               ims,
+                               temperature=temp,
+                               top_k=top_k,
+                               top_p=top_p,
+                               min_p=min_p,
+                               seed = seed,
+                               ctx_size=ctx_size,
+                               schema=schema,
+                               audio_input = audio_input)
+                r = extract_last_json(r)
+                try_times += 1
+
+            if r is None:
+                r = 'Bad response'
+            return r, ims if ims_origin is None else ims_origin
+        except Exception as e:
+            self.logger.warning("batch_inference: an input failed (%s). Continuing.", e)
+            return {'error': str(e), 'data': None}
+        finally:
+            release_views(item)
+            for each in ims_:
+                try:
+                    os.remove(each)
+                except:
+                    pass
 
     def to_df(self, output: bool = True) -> Any:
         """
@@ -534,21 +956,16 @@ class InferenceLlamacpp(Inference):
                 pd.DataFrame: A DataFrame containing responses and associated metadata.
         """
 
-        if self.results is not None:
+        results = self._load_results()
+        if results is not None:
             df_list = []
-            responses = self.results['responses']
-            imgs = self.results['data']
+            responses = results['responses']
+            imgs = results['data']
 
             for inx in range(len(responses)):
-                r = responses[inx]
-                i = imgs[inx]
-
-                r = pd.DataFrame(r['responses'])
-                r = responses_to_wide_all_columns(r)
-                for j in range(len(i)):
-                    r[f'data_{j + 1}'] = i[j]
-
-                df_list += [r]
+                # inputs read back from a checkpoint are not wrapped in a list yet
+                data = [imgs[inx]] if isinstance(imgs[inx], _IMAGE_TYPES) else imgs[inx]
+                df_list += [self._response_row(responses[inx], data)]
             self.df = pd.concat(df_list, ignore_index=True)
             if output:
                 return self.df
@@ -556,6 +973,14 @@ class InferenceLlamacpp(Inference):
         else:
             return None
 
+    @staticmethod
+    def _response_row(r: dict, i: list) -> pd.DataFrame:
+        r = pd.DataFrame(r['responses'])
+        r = responses_to_wide_all_columns(r)
+        for j in range(len(i)):
+            r[f'data_{j + 1}'] = i[j]
+        return r
+
     def _mtmd(self,
               llm: str = None,
               mp: str = None,
@@ -588,6 +1013,42 @@ class InferenceLlamacpp(Inference):
             seed (int): random seed
             ctx_size (int): size of the prompt context (default: 4096, 0 = loaded from model)
         '''
+        key = self._cache_key([llm, mp], system_message, prompt, imgs, schema,
+                              temperature=temperature, top_k=top_k, top_p=top_p, min_p=min_p,
+                              seed=seed, audio_input=audio_input)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        raw = self._generate(llm, mp, system_message, prompt, imgs, temperature, top_k, top_p, min_p,
+                             seed, ctx_size, schema, audio_input)
+        if key is not None:
+            # only responses that validate against the schema are cached
+            r = extract_last_json(raw)
+            try:
+                if r is not None and schema is not None:
+                    schema.model_validate(r)
+                if r is not None:
+                    self.cache.put(key, json.dumps(r, ensure_ascii=False))
+            except Exception:
+                pass
+        return raw
+
+    def _generate(self, llm, mp, system_message, prompt, imgs, temperature, top_k, top_p, min_p,
+                  seed, ctx_size, schema, audio_input):
+        server = self._get_server(ctx_size)
+        if server is not None:
+            return server.chat(system_message,
+                               prompt,
+                               imgs,
+                               temperature=temperature,
+                               top_k=top_k,
+                               top_p=top_p,
+                               min_p=min_p,
+                               seed=seed,
+                               json_schema=schema_dict(schema, inline_refs=True) if schema is not None else None,
+                               audio_input=audio_input)
+
         if imgs is not None:
             imgs = [Path(img) for img in imgs]
             imgs = [["--image" if not audio_input else "--audio", str(i)] for i in imgs]
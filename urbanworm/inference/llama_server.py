@@ -0,0 +1,219 @@
+from __future__ import annotations
+import atexit
+import base64
+import logging
+import mimetypes
+import os
+import socket
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+
+class LlamaServer:
+    '''
+    A long-lived llama.cpp `llama-server` used as a persistent backend.
+
+    The model weights and the multimodal projector are loaded once, and every
+    request is sent over the OpenAI-compatible HTTP API of the server.
+
+    Args:
+        llm (str, optional): model checkpoint to download (e.g. ggml-org/InternVL3-8B-Instruct-GGUF:Q8_0) or
+        a local path to model file (.gguf)
+        mp (str, optional): a local path to multimodal projector file (*mproj*.gguf) if `llm` is a local path.
+        url (str, optional): URL of a llama-server that is already running (e.g. http://127.0.0.1:8080).
+            If provided, no process will be started.
+        host (str): Host to bind when starting a server. (Default is 127.0.0.1)
+        port (int, optional): Port to bind when starting a server. A free port is picked if None.
+        ctx_size (int): Size of context (Default is 4096)
+        n_parallel (int): Number of server slots for concurrent requests. (Default is 1)
+        startup_timeout (float): Seconds to wait for the model to load. (Default is 600)
+        request_timeout (float): Seconds to wait for one generation. (Default is 600)
+        extra_args (list, optional): Extra command line arguments passed to llama-server.
+    '''
+
+    def __init__(self,
+                 llm: str = None,
+                 mp: str = None,
+                 url: str = None,
+                 host: str = '127.0.0.1',
+                 port: int = None,
+                 ctx_size: int = 4096,
+                 n_parallel: int = 1,
+                 startup_timeout: float = 600,
+                 request_timeout: float = 600,
+                 extra_args: list | tuple = None):
+        self.llm = llm
+        self.mp = mp
+        self.host = host
+        self.port = port
+        self.ctx_size = ctx_size
+        self.n_parallel = n_parallel
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self.extra_args = list(extra_args) if extra_args is not None else []
+        self.url = url.rstrip('/') if url is not None else None
+        self.process = None
+        self._log_path = None
+        self._session = requests.Session()
+        self.logger = logging.getLogger("urbanworm")
+
+    def start(self) -> "LlamaServer":
+        '''
+        Start llama-server (if it is not connected to a running one) and wait until the model is loaded.
+        '''
+        if self.url is not None:
+            if self.process is None:
+                self.wait_until_ready()
+            return self
+
+        if self.llm is None:
+            raise ValueError("model cannot be None")
+        if self.port is None:
+            self.port = _free_port(self.host)
+
+        cmd = ["llama-server"]
+        if self.mp is not None:
+            cmd += ["-m", str(Path(self.llm)), "--mmproj", str(Path(self.mp))]
+        else:
+            cmd += ["-hf", str(self.llm)]
+        cmd += ["--host", self.host,
+                "--port", f"{self.port}",
+                "-c", f"{self.ctx_size * self.n_parallel}",
+                "-np", f"{self.n_parallel}"]
+        cmd += self.extra_args
+
+        fd, self._log_path = tempfile.mkstemp(prefix="urban_worm_llama_server_", suffix=".log")
+        with os.fdopen(fd, "w") as log:
+            self.process = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        self.url = f"http://{self.host}:{self.port}"
+        atexit.register(self.stop)
+        self.wait_until_ready()
+        return self
+
+    def wait_until_ready(self) -> None:
+        '''
+        Poll the `/health` endpoint until the server reports that the model is loaded.
+        '''
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process is not None and self.process.poll() is not None:
+                raise RuntimeError(f"llama-server exited with code {self.process.returncode}:\n{self._read_log()}")
+            try:
+                r = self._session.get(f"{self.url}/health", timeout=5)
+                if r.status_code == 200:
+                    return None
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.5)
+        raise TimeoutError(f"llama-server at {self.url} was not ready after {self.startup_timeout} seconds.")
+
+    def stop(self) -> None:
+        '''
+        Terminate the server process started by this object.
+        '''
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process is not None:
+            self.url = None
+        self.process = None
+        if self._log_path is not None:
+            try:
+                os.remove(self._log_path)
+            except OSError:
+                pass
+            self._log_path = None
+
+    def chat(self,
+             system_message: str = '',
+             prompt: str = '',
+             media: list = None,
+             temperature: float = 0.2,
+             top_k: int = 40,
+             top_p: float = 0.9,
+             min_p: float = 0.0,
+             seed: int = 3407,
+             json_schema: dict = None,
+             audio_input: bool = False) -> str:
+        '''
+        Send one chat request to the server.
+
+        Args:
+            system_message (str, optional): The system message.
+            prompt (str): The prompt message.
+            media (list): list of image (or audio) paths.
+            temperature (float): temperature
+            top_k (int): top-k sampling
+            top_p (float): top-p sampling
+            min_p (float): min-p sampling
+            seed (int): random seed
+            json_schema (dict, optional): JSON schema to constrain the output.
+            audio_input (bool): Whether `media` are audio files.
+
+        Returns:
+            str: The generated text.
+        '''
+        if self.url is None:
+            self.start()
+
+        content = [_media_part(m, audio_input) for m in (media or [])]
+        content += [{"type": "text", "text": prompt}]
+        messages = []
+        if system_message:
+            messages += [{"role": "system", "content": system_message}]
+        messages += [{"role": "user", "content": content}]
+
+        payload = {
+            "messages": messages,
+            "temperature": temperature,
+            "top_k": top_k,
+            "top_p": top_p,
+            "min_p": min_p,
+            "seed": seed,
+        }
+        if json_schema is not None:
+            payload["response_format"] = {"type": "json_schema",
+                                          "json_schema": {"name": "response", "schema": json_schema}}
+
+        r = self._session.post(f"{self.url}/v1/chat/completions", json=payload, timeout=self.request_timeout)
+        if r.status_code != 200:
+            raise RuntimeError(f"llama-server HTTP {r.status_code}: {r.text[:300]}")
+        return r.json()["choices"][0]["message"]["content"]
+
+    def _read_log(self) -> str:
+        if self._log_path is None:
+            return ''
+        try:
+            with open(self._log_path) as f:
+                return f.read()[-3000:]
+        except OSError:
+            return ''
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def _media_part(path: str, audio_input: bool = False) -> dict:
+    with open(path, "rb") as f:
+        b64 = base64.b64encode(f.read()).decode("utf-8")
+    if audio_input:
+        fmt = Path(path).suffix.lstrip('.').lower() or "mp3"
+        return {"type": "input_audio", "input_audio": {"data": b64, "format": fmt}}
+    mime = mimetypes.guess_type(str(path))[0] or "image/png"
+    return {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{b64}"}}
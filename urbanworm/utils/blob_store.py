@@ -0,0 +1,184 @@
+from __future__ import annotations
+import base64
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import weakref
+
+
+class BlobRef:
+    '''
+    Handle of an encoded image in a BlobStore.
+
+    It only holds the position of the bytes in the pack file, so a collection
+    keeps a few dozen bytes per image in memory; the bytes are read on `read`.
+    '''
+    __slots__ = ('store', 'key', 'offset', 'length', 'digest')
+
+    def __init__(self, store: BlobStore, key: str, offset: int, length: int, digest: str):
+        self.store = store
+        self.key = key
+        self.offset = offset
+        self.length = length
+        self.digest = digest
+
+    def read(self, size: int = None) -> bytes:
+        '''The encoded image (or its first `size` bytes, e.g. the header).'''
+        return self.store.read(self, size)
+
+    def to_base64(self) -> str:
+        '''The encoded image as a base64 string.'''
+        return base64.b64encode(self.read()).decode('utf-8')
+
+    def __str__(self):
+        # stable across runs: used as the key of the input in checkpoints
+        return f'blob:{self.digest}'
+
+    def __repr__(self):
+        return f'BlobRef(key={self.key!r}, offset={self.offset}, length={self.length})'
+
+
+class BlobStore:
+    '''
+    Append-only pack file of encoded images, with an offset index.
+
+    Collectors write the images here and keep only BlobRef handles, so the
+    memory used by a collection does not grow with its size. The pack is
+    memory-mapped for reading and can be shared by threads.
+
+    Args:
+        path (str, optional): The pack file. Its index is kept next to it (`<path>.idx`),
+            so the images of a run can be reused by a later one. (Default is None, a temporary
+            file removed when the store is closed or garbage collected)
+
+    Examples:
+        data.get_svi_from_locations(key=..., reoriented=True, blob_store='svi.pack')
+        data.svis['data'][0].read()
+    '''
+
+    def __init__(self, path: str = None):
+        self.temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='urban_worm_', suffix='.pack')
+            os.close(fd)
+        self.path = str(path)
+        self.index = {}
+        self._lock = threading.Lock()
+        self._map = None
+        self._writer = open(self.path, 'ab')
+        self._reader = open(self.path, 'rb')
+        self._size = os.path.getsize(self.path)
+        self._index_file = None
+        if not self.temporary:
+            self._load_index()
+            self._index_file = open(self.path + '.idx', 'a', encoding='utf-8')
+        self._finalizer = weakref.finalize(self, _close, self._writer, self._reader, self._index_file,
+                                           self.path if self.temporary else None)
+
+    def put(self, data: bytes, key: str = None) -> BlobRef:
+        '''
+        Append an encoded image, unless an image with the same key is already stored.
+
+        Args:
+            data (bytes): The encoded image.
+            key (str, optional): Key of the image. (Default is None, the SHA-1 of the bytes)
+
+        Returns:
+            BlobRef: The handle of the image.
+        '''
+        digest = hashlib.sha1(data).hexdigest()
+        key = digest if key is None else key
+        with self._lock:
+            entry = self.index.get(key)
+            if entry is None:
+                entry = (self._size, len(data), digest)
+                self._writer.write(data)
+                self._writer.flush()
+                self._size += len(data)
+                self.index[key] = entry
+                if self._index_file is not None:
+                    # written after the bytes, so an entry never points past the end of the pack
+                    self._index_file.write(json.dumps([key, *entry]) + '\n')
+                    self._index_file.flush()
+        return BlobRef(self, key, *entry)
+
+    def ref(self, key: str) -> BlobRef | None:
+        '''The handle of a stored image, or None.'''
+        entry = self.index.get(key)
+        return BlobRef(self, key, *entry) if entry is not None else None
+
+    def read(self, ref: BlobRef, size: int = None) -> bytes:
+        '''The bytes of a handle (or the first `size` of them).'''
+        end = ref.offset + (ref.length if size is None else min(size, ref.length))
+        with self._lock:
+            if self._map is None or len(self._map) < end:
+                # the pack grew since it was mapped
+                if self._map is not None:
+                    self._map.close()
+                self._map = mmap.mmap(self._reader.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._map[ref.offset:end]
+
+    def close(self) -> None:
+        '''Close the pack (a temporary pack is removed).'''
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+        self._finalizer()
+
+    def _load_index(self) -> None:
+        path = self.path + '.idx'
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    key, offset, length, digest = json.loads(line)
+                except (ValueError, TypeError):
+                    # truncated last line
+                    continue
+                if offset + length <= self._size:
+                    self.index[key] = (offset, length, digest)
+
+    def __len__(self):
+        return len(self.index)
+
+
+def _close(writer, reader, index_file, remove_path) -> None:
+    for f in (writer, reader, index_file):
+        if f is not None:
+            f.close()
+    if remove_path is not None:
+        try:
+            os.remove(remove_path)
+        except OSError:
+            pass
+
+
+_store = None
+
+
+def configure_blob_store(path: str = None) -> BlobStore:
+    '''
+    Replace the blob store used by the collectors with `blob_store=True`.
+
+    Args:
+        path (str, optional): The pack file. (Default is None, a temporary file)
+
+    Returns:
+        BlobStore: The new store.
+    '''
+    global _store
+    _store = BlobStore(path)
+    return _store
+
+
+def get_blob_store() -> BlobStore:
+    '''The blob store in use (a temporary one is created on first use).'''
+    global _store
+    if _store is None:
+        _store = BlobStore()
+    return _store
@@ -1,8 +1,10 @@
 from __future__ import annotations
+import io
 import geopandas as gpd
 from pyproj import Geod
 from shapely.geometry import Polygon
 from .utils import *
+from . import http_client
 
 _GEOD = Geod(ellps="WGS84")
 
@@ -45,7 +47,7 @@ out geom;
         "Accept": "application/json",
     }
 
-    r = requests.post(url, data={"data": query}, headers=headers, timeout=timeout + 30)
+    r = http_client.post(url, data={"data": query}, headers=headers, timeout=(10, timeout + 30))
 
     # If Overpass errors, it often returns HTML/text/XML -> show a helpful message
     if r.status_code != 200:
@@ -146,9 +148,9 @@ def getGlobalMLBuilding(bbox: tuple | list, min_area: float | int = 0.0,
         quad_keys.add(mercantile.quadkey(tile))
     quad_keys = list(quad_keys)
     # Download the building footprints for each tile and crop with bbox
-    df = pd.read_csv(
-        "https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv", dtype=str
-    )
+    links = http_client.get("https://minedbuildings.z5.web.core.windows.net/global-buildings/dataset-links.csv",
+                            raise_for_status=True)
+    df = pd.read_csv(io.BytesIO(links.content), dtype=str)
 
     idx = 0
     combined_gdf = gpd.GeoDataFrame()
@@ -160,7 +162,8 @@ def getGlobalMLBuilding(bbox: tuple | list, min_area: float | int = 0.0,
             if rows.shape[0] == 1:
                 url = rows.iloc[0]["Url"]
 
-                df2 = pd.read_json(url, lines=True)
+                df2 = pd.read_json(io.BytesIO(http_client.get(url, timeout=(10, 300), raise_for_status=True).content),
+                                   lines=True, compression='gzip' if url.endswith('.gz') else None)
                 df2["geometry"] = df2["geometry"].apply(geometry.shape)
 
                 gdf = gpd.GeoDataFrame(df2, crs=4326)
@@ -172,7 +175,8 @@ def getGlobalMLBuilding(bbox: tuple | list, min_area: float | int = 0.0,
                 print(f"Warning: Multiple rows found for QuadKey: {quad_key}. Processing all entries.")
                 for _, row in rows.iterrows():
                     url = row["Url"]
-                    df2 = pd.read_json(url, lines=True)
+                    df2 = pd.read_json(io.BytesIO(http_client.get(url, timeout=(10, 300), raise_for_status=True).content),
+                                   lines=True, compression='gzip' if url.endswith('.gz') else None)
                     df2["geometry"] = df2["geometry"].apply(geometry.shape)
                     gdf = gpd.GeoDataFrame(df2, crs=4326)
                     fn = os.path.join(tmpdir, f"{quad_key}_{_}.geojson")
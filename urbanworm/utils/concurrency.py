@@ -0,0 +1,49 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator
+
+
+def imap_ordered(fn: Callable[[Any], Any],
+                 items: Iterable,
+                 max_workers: int = 1,
+                 max_pending: int = None) -> Iterator[Any]:
+    """
+    Apply `fn` to each item on a thread pool and yield the results in input order.
+
+    At most `max_workers` calls run at the same time, and at most `max_pending`
+    items are submitted ahead of the one being yielded, so a slow consumer
+    (or a slow item at the head of the queue) applies backpressure instead of
+    letting the queue grow with the input.
+
+    Args:
+        fn: The function to apply. Exceptions raised by `fn` are re-raised when its result is yielded.
+        items: The inputs.
+        max_workers (int): Number of threads. With 1 (or None), items are processed serially in the caller's thread.
+        max_pending (int, optional): Maximum number of submitted but not yet yielded items. (Default is 2 * max_workers)
+
+    Yields:
+        The result of `fn(item)` for each item, in input order.
+    """
+    if max_workers is None or max_workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * max_workers
+    max_pending = max(max_pending, max_workers)
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(fn, item))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # the consumer stopped early (or an item failed): drop queued work
+            for future in pending:
+                future.cancel()
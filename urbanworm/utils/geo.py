@@ -0,0 +1,109 @@
+from __future__ import annotations
+from functools import lru_cache
+
+import numpy as np
+from pyproj import Transformer
+
+
+@lru_cache(maxsize=128)
+def get_transformer(crs_from: str, crs_to: str) -> Transformer:
+    '''
+    A cached (lon/lat ordered) Transformer between two CRS. Building one is expensive,
+    and pyproj Transformers are safe to share between threads.
+    '''
+    return Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def utm_epsg(lons, lats) -> np.ndarray:
+    '''
+    The UTM EPSG codes (WGS84) of arrays of longitudes and latitudes.
+    '''
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    zones = np.clip(((lons + 180) // 6).astype(int) + 1, 1, 60)
+    return np.where(lats >= 0, 32600, 32700) + zones
+
+
+def bboxes(lons, lats, r) -> np.ndarray:
+    '''
+    Square bboxes of half-side `r` meters around points, in degrees.
+
+    Points are grouped by UTM zone, so there is one vectorized transform per zone
+    and direction, with Transformers reused across calls.
+
+    Args:
+        lons (array-like): Longitudes.
+        lats (array-like): Latitudes.
+        r (float | array-like): Half-side of the squares in meters.
+
+    Returns:
+        np.ndarray: (n, 4) array of (minx, miny, maxx, maxy).
+    '''
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    r = np.broadcast_to(np.asarray(r, dtype=float), lons.shape)
+    out = np.empty((len(lons), 4), dtype=float)
+    epsg = utm_epsg(lons, lats)
+    for code in np.unique(epsg):
+        idx = np.nonzero(epsg == code)[0]
+        x, y = get_transformer("EPSG:4326", f"EPSG:{code}").transform(lons[idx], lats[idx])
+        back = get_transformer(f"EPSG:{code}", "EPSG:4326")
+        out[idx, 0], out[idx, 1] = back.transform(x - r[idx], y - r[idx])
+        out[idx, 2], out[idx, 3] = back.transform(x + r[idx], y + r[idx])
+    return out
+
+
+def bbox(location: list | tuple, r: float) -> tuple:
+    '''
+    The (minx, miny, maxx, maxy) bbox of a square of half-side `r` meters around one location.
+    '''
+    return tuple(float(v) for v in bboxes([location[0]], [location[1]], r)[0])
+
+
+# ------------- vectorized geodesic helpers -------------
+EARTH_RADIUS_M = 6371000.0
+
+
+def to_float_array(values) -> np.ndarray:
+    '''
+    Floats from a list of numbers or numeric strings; missing or invalid values become NaN.
+    '''
+    out = np.full(len(values), np.nan)
+    for i, v in enumerate(values):
+        try:
+            out[i] = float(v)
+        except (TypeError, ValueError):
+            pass
+    return out
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    '''
+    Great-circle distances in meters between points (arrays or scalars, broadcast together).
+    '''
+    p1, p2 = np.radians(lat1), np.radians(lat2)
+    dphi = p2 - p1
+    dlmb = np.radians(np.asarray(lon2, dtype=float) - np.asarray(lon1, dtype=float))
+    a = np.sin(dphi / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2) -> np.ndarray:
+    '''
+    Initial bearings in degrees [0, 360) from points 1 to points 2 (arrays or scalars).
+    '''
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    delta_lon = lon2 - lon1
+    x = np.sin(delta_lon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(delta_lon)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def in_bbox(x, y, bounds) -> np.ndarray:
+    '''
+    Whether points (x, y) are inside a (xmin, ymin, xmax, ymax) bbox, boundaries included. NaN is outside.
+    '''
+    xmin, ymin, xmax, ymax = bounds
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    return (xmin <= x) & (x <= xmax) & (ymin <= y) & (y <= ymax)
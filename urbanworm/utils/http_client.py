@@ -0,0 +1,166 @@
+from __future__ import annotations
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import rate_limit
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+# status codes worth retrying: rate limits and transient server errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+USER_AGENT = "urban-worm/1.0"
+
+_settings = {
+    'pool_maxsize': 32,
+    'retries': 3,
+    'backoff': 0.5,
+    'max_backoff': 60.0,
+    'timeout': DEFAULT_TIMEOUT,
+}
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def configure(pool_maxsize: int = None,
+              retries: int = None,
+              backoff: float = None,
+              max_backoff: float = None,
+              timeout: float | tuple = None) -> None:
+    '''
+    Change the defaults of the shared HTTP client.
+
+    Args:
+        pool_maxsize (int, optional): Maximum number of keep-alive connections per host. (Default is 32)
+        retries (int, optional): Number of retries after the first attempt. (Default is 3)
+        backoff (float, optional): Base delay in seconds of the exponential backoff. (Default is 0.5)
+        max_backoff (float, optional): Maximum delay in seconds between two attempts. (Default is 60)
+        timeout (float | tuple, optional): Timeout in seconds, or (connect, read) timeouts. (Default is (10, 60))
+    '''
+    updates = {'pool_maxsize': pool_maxsize, 'retries': retries, 'backoff': backoff,
+               'max_backoff': max_backoff, 'timeout': timeout}
+    _settings.update({k: v for k, v in updates.items() if v is not None})
+    if pool_maxsize is not None:
+        with _sessions_lock:
+            for session in _sessions.values():
+                session.close()
+            _sessions.clear()
+
+
+def get_session(url: str) -> requests.Session:
+    '''
+    The pooled keep-alive session for the scheme and host of `url`.
+    '''
+    parsed = urlparse(url)
+    origin = f'{parsed.scheme}://{parsed.netloc}'
+    session = _sessions.get(origin)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_settings['pool_maxsize'])
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = USER_AGENT
+                _sessions[origin] = session
+    return session
+
+
+def request(method: str,
+            url: str,
+            retries: int = None,
+            backoff: float = None,
+            timeout: float | tuple = None,
+            raise_for_status: bool = False,
+            limiter: str = None,
+            **kwargs) -> requests.Response:
+    '''
+    Send an HTTP request through the pooled session of its host.
+
+    Connection errors, timeouts and the status codes in `RETRY_STATUS` are retried
+    with exponential backoff and full jitter. A `Retry-After` header sent with a
+    429/503 response is honored instead of the computed delay. Every attempt waits
+    for the rate limit of the API it calls (see `urbanworm.utils.rate_limit`).
+
+    Args:
+        method (str): HTTP method.
+        url (str): The URL.
+        retries (int, optional): Number of retries after the first attempt.
+        backoff (float, optional): Base delay in seconds of the exponential backoff.
+        timeout (float | tuple, optional): Timeout in seconds, or (connect, read) timeouts.
+        raise_for_status (bool): Whether to raise for an unsuccessful final response. (Default is False)
+        limiter (str, optional): Name of the rate limiter to use. (Default is the one registered for the host)
+        **kwargs: Passed to `requests.Session.request` (params, headers, data, json, stream, ...).
+
+    Returns:
+        requests.Response: The last response.
+
+    Raises:
+        requests.exceptions.RequestException: If the last attempt failed without a response.
+    '''
+    retries = _settings['retries'] if retries is None else retries
+    backoff = _settings['backoff'] if backoff is None else backoff
+    timeout = _settings['timeout'] if timeout is None else timeout
+    session = get_session(url)
+    limiter = rate_limit.limiter_name(url) if limiter is None else limiter
+
+    for attempt in range(retries + 1):
+        last = attempt >= retries
+        rate_limit.acquire(limiter)
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if last:
+                raise
+            time.sleep(backoff_delay(attempt, backoff))
+            continue
+        if response.status_code in RETRY_STATUS and not last:
+            delay = retry_after(response)
+            response.close()
+            time.sleep(delay if delay is not None else backoff_delay(attempt, backoff))
+            continue
+        if raise_for_status:
+            response.raise_for_status()
+        return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    '''GET `url` with `request`.'''
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    '''POST to `url` with `request`.'''
+    return request('POST', url, **kwargs)
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = None) -> float:
+    '''
+    Exponential backoff with full jitter: a random delay in [0, min(cap, base * 2 ** attempt)].
+    '''
+    cap = _settings['max_backoff'] if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after(response: requests.Response) -> float | None:
+    '''
+    Seconds to wait according to the `Retry-After` header (delta-seconds or HTTP-date), capped at `max_backoff`.
+    '''
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        delay = when.timestamp() - time.time()
+    return min(max(delay, 0.0), _settings['max_backoff'])
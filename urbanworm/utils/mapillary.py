@@ -0,0 +1,303 @@
+from __future__ import annotations
+import math
+import os
+
+import numpy as np
+from shapely import STRtree, box, points
+
+from . import geo, http_client
+from .concurrency import imap_ordered
+from .utils import SVI_FIELDS, retry_request
+
+API_URL = "https://graph.mapillary.com/images"
+# side in degrees of the query windows (the API rejects large bboxes)
+MAX_WINDOW = 0.01
+# maximum number of images returned by one query; a full page means the window has to be split
+MAX_RESULTS = 2000
+
+
+def location_bbox(location: list | tuple, distance: float) -> tuple:
+    '''
+    The (minx, miny, maxx, maxy) bbox in degrees of a square of `distance` meters around a location.
+    '''
+    return geo.bbox(location, distance)
+
+
+def location_bboxes(locations: list, distance: float) -> list[tuple]:
+    '''
+    `location_bbox` of many locations, computed in one vectorized call.
+    '''
+    if len(locations) == 0:
+        return []
+    xy = np.asarray(locations, dtype=float).reshape(-1, 2)
+    return [tuple(b) for b in geo.bboxes(xy[:, 0], xy[:, 1], distance).tolist()]
+
+
+def query_windows(bboxes: list, size: float = MAX_WINDOW) -> list[tuple]:
+    '''
+    The grid-aligned windows of `size` degrees that intersect at least one bbox.
+
+    Adjacent units share windows, so the number of windows grows with the
+    covered area instead of the number of units.
+    '''
+    cells = set()
+    for minx, miny, maxx, maxy in bboxes:
+        for i in range(math.floor(minx / size), math.floor(maxx / size) + 1):
+            for j in range(math.floor(miny / size), math.floor(maxy / size) + 1):
+                cells.add((i, j))
+    return [(i * size, j * size, (i + 1) * size, (j + 1) * size) for i, j in sorted(cells)]
+
+
+def _fetch_window(window: tuple, key: str, pano: bool, limit: int) -> list | None:
+    bbox = ','.join(f'{v:.7f}' for v in window)
+    url = f"{API_URL}?access_token={key}&fields={SVI_FIELDS}&bbox={bbox}&limit={limit}"
+    if pano:
+        url += "&is_pano=true"
+    response = retry_request(url)
+    if response is None or response.status_code != 200:
+        return None
+    return response.json().get('data', [])
+
+
+def _search_window(window: tuple, key: str, pano: bool, limit: int, depth: int) -> list:
+    data = _fetch_window(window, key, pano, limit)
+    if data is None:
+        return []
+    if len(data) >= limit and depth > 0:
+        # saturated: the API truncated the results, query the four quadrants instead
+        minx, miny, maxx, maxy = window
+        cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+        data = []
+        for q in ((minx, miny, cx, cy), (cx, miny, maxx, cy), (minx, cy, cx, maxy), (cx, cy, maxx, maxy)):
+            data += _search_window(q, key, pano, limit, depth - 1)
+    return data
+
+
+def bulk_search(bboxes: list,
+                key: str,
+                pano: bool = True,
+                window: float = MAX_WINDOW,
+                limit: int = MAX_RESULTS,
+                max_depth: int = 4,
+                workers: int = 1) -> list[dict]:
+    '''
+    Fetch all Mapillary images in the area covered by a list of bboxes, querying each window once.
+
+    Args:
+        bboxes (list): (minx, miny, maxx, maxy) bboxes in degrees, e.g. one per unit.
+        key (str): Mapillary API access token.
+        pano (bool): Whether to search for pano street view images only. (Default is True)
+        window (float): Side in degrees of the query windows. (Default is 0.01)
+        limit (int): Maximum number of images per query. (Default is 2000)
+        max_depth (int): How many times a saturated window can be split into quadrants. (Default is 4)
+        workers (int): Number of windows queried at the same time. (Default is 1)
+
+    Returns:
+        list[dict]: The image records (the items of the "data" field of the API response), without duplicates.
+    '''
+    windows = query_windows(bboxes, window)
+    images = {}
+    for data in imap_ordered(lambda w: _search_window(w, key, pano, limit, max_depth), windows, max_workers=workers):
+        for img in data:
+            images.setdefault(img['id'], img)
+    return list(images.values())
+
+
+class ImageIndex:
+    '''
+    STRtree over the locations of Mapillary image records.
+
+    Args:
+        images (list[dict]): Image records with `computed_geometry`.
+    '''
+
+    def __init__(self, images: list[dict]):
+        self.images = [img for img in images if img.get('computed_geometry')]
+        coords = np.array([img['computed_geometry']['coordinates'] for img in self.images], dtype=float).reshape(-1, 2)
+        self.tree = STRtree(points(coords))
+
+    def query(self, bbox: tuple) -> list[dict]:
+        '''
+        The image records inside a (minx, miny, maxx, maxy) bbox.
+        '''
+        idx = self.tree.query(box(*bbox), predicate='intersects')
+        return [self.images[i] for i in sorted(idx)]
+
+
+# ------------- coverage tiles -------------
+TILE_URL = "https://tiles.mapillary.com/maps/vtp/mly1_public/2/{z}/{x}/{y}?access_token={key}"
+# the zoom level of the "image" (point) layer of the coverage tiles
+COVERAGE_ZOOM = 14
+
+
+def lonlat_to_tile(lon: float, lat: float, zoom: int = COVERAGE_ZOOM) -> tuple[int, int]:
+    '''
+    The (x, y) web mercator tile that contains a point.
+    '''
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_to_lonlat(x: float, y: float, zoom: int = COVERAGE_ZOOM) -> tuple[float, float]:
+    '''
+    The coordinates of a (fractional) tile position; integers give the north-west corner of a tile.
+    '''
+    n = 2 ** zoom
+    lon = x / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lon, lat
+
+
+def decode_tile(data: bytes, x: int, y: int, zoom: int = COVERAGE_ZOOM, pano: bool = None) -> list[tuple]:
+    '''
+    The image points of a Mapillary coverage vector tile.
+
+    Requires the optional package `mapbox-vector-tile` (`pip install "urban-worm[coverage]"`).
+
+    Args:
+        data (bytes): The tile (Mapbox Vector Tile).
+        x, y, zoom (int): The tile position.
+        pano (bool, optional): If True (False), keep only pano (non-pano) images.
+
+    Returns:
+        list[tuple]: (lon, lat) of each image.
+    '''
+    try:
+        import mapbox_vector_tile
+    except ImportError as e:
+        raise ImportError('The coverage check needs mapbox-vector-tile: pip install "urban-worm[coverage]"') from e
+    try:
+        layers = mapbox_vector_tile.decode(data, default_options={'y_coord_down': True})
+    except TypeError:
+        # mapbox-vector-tile < 2
+        layers = mapbox_vector_tile.decode(data, y_coord_down=True)
+    layer = layers.get('image')
+    if layer is None:
+        return []
+    extent = layer.get('extent', 4096)
+    out = []
+    for feature in layer['features']:
+        geometry = feature['geometry']
+        if geometry['type'] != 'Point':
+            continue
+        if pano is not None and bool(feature.get('properties', {}).get('is_pano')) != pano:
+            continue
+        fx, fy = geometry['coordinates']
+        out.append(tile_to_lonlat(x + fx / extent, y + fy / extent, zoom))
+    return out
+
+
+class CoverageIndex:
+    '''
+    Local index of Mapillary coverage, built from the vector tiles of a study area.
+
+    The tiles are downloaded once (and kept in `cache_dir`), so locations without
+    any image nearby can be skipped without a search request.
+
+    Args:
+        key (str): Mapillary API access token.
+        cache_dir (str, optional): Directory where the tiles are kept across runs.
+        pano (bool, optional): If True, only pano images count as coverage. (Default is None, all images)
+        zoom (int): Zoom level of the tiles. (Default is 14)
+
+    Examples:
+        coverage = CoverageIndex(key, cache_dir='mapillary_tiles', pano=True)
+        coverage.load(bboxes)
+        coverage.has_coverage([-83.74, 42.28], 50)
+    '''
+
+    def __init__(self, key: str = None, cache_dir: str = None, pano: bool = None, zoom: int = COVERAGE_ZOOM):
+        self.key = key
+        self.cache_dir = str(cache_dir) if cache_dir is not None else None
+        self.pano = pano
+        self.zoom = zoom
+        self.tiles = set()
+        # tiles that could not be fetched: their area counts as covered
+        self.failed = set()
+        self._points = []
+        self.tree = None
+
+    def tiles_for(self, bboxes: list) -> list[tuple[int, int]]:
+        '''
+        The tiles that intersect a list of (minx, miny, maxx, maxy) bboxes.
+        '''
+        tiles = set()
+        for minx, miny, maxx, maxy in bboxes:
+            x0, y0 = lonlat_to_tile(minx, maxy, self.zoom)
+            x1, y1 = lonlat_to_tile(maxx, miny, self.zoom)
+            tiles.update((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+        return sorted(tiles)
+
+    def load(self, bboxes: list, workers: int = 1) -> CoverageIndex:
+        '''
+        Fetch (or read from the cache) the tiles covering the bboxes and index their image points.
+        '''
+        todo = [t for t in self.tiles_for(bboxes) if t not in self.tiles]
+        for t, pts in zip(todo, imap_ordered(self._tile_points, todo, max_workers=workers)):
+            if pts is None:
+                self.failed.add(t)
+                continue
+            self.failed.discard(t)
+            self.tiles.add(t)
+            self._points += pts
+        coords = np.array(self._points, dtype=float).reshape(-1, 2)
+        self.tree = STRtree(points(coords))
+        return self
+
+    def has_coverage(self, location: list | tuple, distance: float) -> bool:
+        '''
+        Whether there is at least one image in the search bbox of a location.
+        Locations in tiles that could not be fetched are reported as covered.
+        '''
+        bbox = location_bbox(location, distance)
+        if self.failed and any(t in self.failed for t in self.tiles_for([bbox])):
+            return True
+        return self.count(bbox) > 0
+
+    def count(self, bbox: tuple) -> int:
+        '''
+        Number of images inside a (minx, miny, maxx, maxy) bbox.
+        '''
+        if self.tree is None:
+            return 0
+        return len(self.tree.query(box(*bbox), predicate='intersects'))
+
+    def _tile_points(self, tile: tuple[int, int]) -> list[tuple] | None:
+        try:
+            data = self._read_tile(*tile)
+        except Exception:
+            return None
+        if data is None:
+            return None
+        if not data:
+            return []
+        return decode_tile(data, tile[0], tile[1], self.zoom, self.pano)
+
+    def _tile_path(self, x: int, y: int) -> str | None:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, str(self.zoom), str(x), f'{y}.mvt')
+
+    def _read_tile(self, x: int, y: int) -> bytes | None:
+        path = self._tile_path(x, y)
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        response = http_client.get(TILE_URL.format(z=self.zoom, x=x, y=y, key=self.key))
+        if response.status_code == 404:
+            # no imagery in this tile
+            data = b''
+        elif response.status_code != 200:
+            return None
+        else:
+            data = response.content
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return data
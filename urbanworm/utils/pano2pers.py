@@ -2,26 +2,217 @@
 The source code is adapted from https://github.com/fuenwang/Equirec2Perspec.git. Credit to the author @fuenwang.
 '''
 
+from __future__ import annotations
 import cv2
 import numpy as np
-from urllib.request import urlopen
 import base64
+import io
+from functools import lru_cache
+from PIL import Image
+from . import http_client
+from .concurrency import imap_ordered
+
+# output formats of the perspective views
+IMAGE_FORMATS = ('png', 'jpeg', 'webp', 'ndarray')
+
+
+def encode_bytes(img: np.ndarray, image_format: str = 'png', quality: int = 90) -> bytes:
+    '''
+    Encode a BGR image as PNG, JPEG or WebP bytes.
+
+    Args:
+        img (np.ndarray): The image.
+        image_format (str): One of "png", "jpeg" or "webp". (Default is "png")
+        quality (int): JPEG/WebP quality in [1, 100]. (Default is 90)
+
+    Returns:
+        bytes: The encoded image.
+    '''
+    image_format = image_format.lower()
+    if image_format in ('jpeg', 'jpg'):
+        ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    elif image_format == 'webp':
+        ok, buffer = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, int(quality)])
+    elif image_format == 'png':
+        ok, buffer = cv2.imencode('.png', img)
+    else:
+        raise ValueError(f"image_format has to be one of {IMAGE_FORMATS}.")
+    if not ok:
+        raise ValueError(f"OpenCV could not encode the image as {image_format}")
+    return buffer.tobytes()
+
+
+def encode_image(img: np.ndarray, image_format: str = 'png', quality: int = 90) -> str | np.ndarray:
+    '''
+    Encode a BGR image for the consumers of the perspective views.
+
+    Args:
+        img (np.ndarray): The image.
+        image_format (str): One of "png", "jpeg", "webp" (base64 strings) or "ndarray" (the array itself). (Default is "png")
+        quality (int): JPEG/WebP quality in [1, 100]. (Default is 90)
+
+    Returns:
+        str | np.ndarray: A base64-encoded string, or the array for "ndarray".
+    '''
+    if image_format.lower() == 'ndarray':
+        return img
+    return base64.b64encode(encode_bytes(img, image_format, quality)).decode('utf-8')
+
+
+# decode flags of each downscaling factor (JPEGs are decoded directly at the reduced size by libjpeg)
+_REDUCED_FLAGS = {1: cv2.IMREAD_COLOR,
+                  2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4,
+                  8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def decode_scale(pano_width:int, fov:float = None, width:int = None) -> int:
+    '''
+    The largest downscaling factor (1, 2, 4 or 8) at which a pano still has
+    at least the pixel density of a perspective view of `width` pixels over `fov` degrees.
+
+    Args:
+        pano_width (int): Width of the full-resolution pano.
+        fov (float, optional): Horizontal field of view of the view in degrees.
+        width (int, optional): Width of the view in pixels.
+
+    Returns:
+        int: The factor (1 when fov or width is None).
+    '''
+    if fov is None or width is None or not pano_width:
+        return 1
+    required = 360.0 * width / fov
+    for scale in (8, 4, 2):
+        if pano_width / scale >= required:
+            return scale
+    return 1
+
+
+def _header_width(src) -> int | None:
+    # read the image size from the header only (PIL does not decode pixels on open)
+    try:
+        with Image.open(io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src) as im:
+            return im.size[0]
+    except Exception:
+        return None
+
+
+def decode_image(data:bytes, fov:float = None, width:int = None) -> np.ndarray:
+    '''
+    Decode an encoded pano, at reduced resolution when the perspective views do not need all its pixels.
+
+    Args:
+        data (bytes): The encoded image.
+        fov (float, optional): Field of view of the views in degrees.
+        width (int, optional): Width of the views in pixels.
+
+    Returns:
+        np.ndarray: The BGR image.
+    '''
+    scale = decode_scale(_header_width(data), fov, width) if fov is not None and width is not None else 1
+    return cv2.imdecode(np.frombuffer(data, dtype="uint8"), _REDUCED_FLAGS[scale])
+
 
 # Equirectangular to Perspective
-def read_url2img(url:str) -> np.ndarray:
+def read_url2img(url:str, fov:float = None, width:int = None) -> np.ndarray:
     '''
     Read image from a URL
 
     Args:
         url (str): Image URL
+        fov (float, optional): Field of view of the views rendered from the image. See `decode_image`.
+        width (int, optional): Width of the views rendered from the image. See `decode_image`.
 
     Returns:
         np.ndarray: The image as a NumPy array.
     '''
-    resp = urlopen(url, timeout=9999)
-    image = np.asarray(bytearray(resp.read()), dtype="uint8")
-    image = cv2.imdecode(image, cv2.IMREAD_COLOR)
-    return image
+    resp = http_client.get(url, raise_for_status=True)
+    return decode_image(resp.content, fov, width)
+
+
+@lru_cache(maxsize=32)
+def _ray_grid(FOV:float, height:int, width:int, RADIUS:int = 128) -> np.ndarray:
+    '''
+    The rays of a perspective view looking along +x, as a (3, height * width) array on the sphere of radius RADIUS.
+
+    The grid does not depend on the view angles, so all headings of the same view size share it.
+    '''
+    wFOV = FOV
+    hFOV = float(height) / width * wFOV
+
+    c_x = (width - 1) / 2.0
+    c_y = (height - 1) / 2.0
+
+    wangle = (180 - wFOV) / 2.0
+    w_len = 2 * RADIUS * np.sin(np.radians(wFOV / 2.0)) / np.sin(np.radians(wangle))
+    w_interval = w_len / (width - 1)
+
+    hangle = (180 - hFOV) / 2.0
+    h_len = 2 * RADIUS * np.sin(np.radians(hFOV / 2.0)) / np.sin(np.radians(hangle))
+    h_interval = h_len / (height - 1)
+    x_map = np.zeros([height, width], np.float32) + RADIUS
+    y_map = np.tile((np.arange(0, width) - c_x) * w_interval, [height, 1])
+    z_map = -np.tile((np.arange(0, height) - c_y) * h_interval, [width, 1]).T
+    D = np.sqrt(x_map**2 + y_map**2 + z_map**2)
+    xyz = np.zeros([height, width, 3], np.float32)
+    xyz[:, :, 0] = (RADIUS / D * x_map)[:, :]
+    xyz[:, :, 1] = (RADIUS / D * y_map)[:, :]
+    xyz[:, :, 2] = (RADIUS / D * z_map)[:, :]
+    xyz = xyz.reshape([height * width, 3]).T
+    xyz.flags.writeable = False
+    return xyz
+
+
+# resolution (in degrees) of the view angles used as keys of the `_perspective_maps` cache
+ANGLE_STEP = 0.1
+
+
+@lru_cache(maxsize=32)
+def _perspective_maps(equ_h:int, equ_w:int, FOV:float, THETA:float, PHI:float, height:int, width:int, RADIUS:int = 128) -> tuple:
+    '''
+    The `cv2.remap` maps from a perspective view to a pano of size (equ_h, equ_w).
+
+    The maps only depend on the arguments, so they are cached (LRU) and stored
+    as fixed-point CV_16SC2 maps, which `cv2.remap` applies faster than float maps.
+
+    Returns:
+        tuple: (map1, map2) from `cv2.convertMaps`.
+    '''
+    # THETA is left/right angle, PHI is up/down angle, both in degree
+    equ_cx = (equ_w - 1) / 2.0
+    equ_cy = (equ_h - 1) / 2.0
+
+    y_axis = np.array([0.0, 1.0, 0.0], np.float32)
+    z_axis = np.array([0.0, 0.0, 1.0], np.float32)
+    [R1, _] = cv2.Rodrigues(z_axis * np.radians(THETA))
+    [R2, _] = cv2.Rodrigues(np.dot(R1, y_axis) * np.radians(-PHI))
+
+    xyz = _ray_grid(FOV, height, width, RADIUS)
+    xyz = np.dot(R1, xyz)
+    xyz = np.dot(R2, xyz).T
+    lat = np.arcsin(xyz[:, 2] / RADIUS)
+    lon = np.zeros([height * width], np.float32)
+    theta = np.arctan(xyz[:, 1] / xyz[:, 0])
+    idx1 = xyz[:, 0] > 0
+    idx2 = xyz[:, 1] > 0
+
+    idx3 = ((1 - idx1) * idx2).astype(np.bool_)
+    idx4 = ((1 - idx1) * (1 - idx2)).astype(np.bool_)
+    
+    lon[idx1] = theta[idx1]
+    lon[idx3] = theta[idx3] + np.pi
+    lon[idx4] = theta[idx4] - np.pi
+
+    lon = lon.reshape([height, width]) / np.pi * 180
+    lat = -lat.reshape([height, width]) / np.pi * 180
+    lon = lon / 180 * equ_cx + equ_cx
+    lat = lat / 90 * equ_cy + equ_cy
+
+    map1, map2 = cv2.convertMaps(lon.astype(np.float32), lat.astype(np.float32), cv2.CV_16SC2)
+    # the cached arrays are shared by every caller
+    map1.flags.writeable = False
+    map2.flags.writeable = False
+    return map1, map2
 
 
 class Equirectangular:
@@ -29,27 +220,36 @@ class Equirectangular:
     Covert paronoma to perspective
     '''
 
-    def __init__(self, img_path:str=None, img_url:str=None):
+    def __init__(self, img_path:str=None, img_url:str=None, fov:float=None, width:int=None, img:np.ndarray=None):
         '''
         Add image
 
         Args:
             img_path (str): Image path
             img_url (str): Image URL
+            fov (float, optional): Smallest field of view of the views that will be rendered.
+            width (int, optional): Largest width of the views that will be rendered.
+                With fov and width, the pano is decoded at the lowest resolution (1/2, 1/4 or 1/8)
+                that keeps the pixel density of the views.
+            img (np.ndarray, optional): An already decoded BGR pano (e.g. from the pano store).
         '''
-        if img_path != None:
-            self._img = cv2.imread(img_path, cv2.IMREAD_COLOR)
+        if img is not None:
+            self._img = img
+        elif img_path != None:
+            scale = decode_scale(_header_width(img_path), fov, width) if fov is not None and width is not None else 1
+            self._img = cv2.imread(img_path, _REDUCED_FLAGS[scale])
         elif img_url != None:
-            self._img = read_url2img(img_url)
+            self._img = read_url2img(img_url, fov, width)
         [self._height, self._width, _] = self._img.shape
 
-    def GetPerspective(self, FOV:float, THETA:float, PHI:float, height:int, width:int, RADIUS:int = 128) -> str:
+    def GetPerspective(self, FOV:float, THETA:float, PHI:float, height:int, width:int, RADIUS:int = 128,
+                       image_format:str = 'png', quality:int = 90) -> str | np.ndarray:
         """
         Convert an equirectangular panorama image to a perspective view.
 
         This function computes the perspective projection of a 360° panorama image 
         based on field of view and view angles, returning the perspective as a 
-        base64-encoded PNG image (useful for web/LLM APIs).
+        base64-encoded image (useful for web/LLM APIs) or as a NumPy array.
 
         Args:
             FOV (float): Field of view in degrees.
@@ -58,70 +258,41 @@ class Equirectangular:
             height (int): Height of the output image.
             width (int): Width of the output image.
             RADIUS (int, optional): Projection sphere radius. Defaults to 128.
+            image_format (str, optional): "png", "jpeg", "webp" or "ndarray" (BGR array, no encoding). Defaults to "png".
+            quality (int, optional): JPEG/WebP quality. Defaults to 90.
 
         Returns:
-            str: A base64-encoded PNG string representing the perspective view.
+            str | np.ndarray: A base64-encoded string (or an array) representing the perspective view.
         """
 
-        # THETA is left/right angle, PHI is up/down angle, both in degree
-        equ_h = self._height
-        equ_w = self._width
-        equ_cx = (equ_w - 1) / 2.0
-        equ_cy = (equ_h - 1) / 2.0
-
-        wFOV = FOV
-        hFOV = float(height) / width * wFOV
-
-        c_x = (width - 1) / 2.0
-        c_y = (height - 1) / 2.0
-
-        wangle = (180 - wFOV) / 2.0
-        w_len = 2 * RADIUS * np.sin(np.radians(wFOV / 2.0)) / np.sin(np.radians(wangle))
-        w_interval = w_len / (width - 1)
-
-        hangle = (180 - hFOV) / 2.0
-        h_len = 2 * RADIUS * np.sin(np.radians(hFOV / 2.0)) / np.sin(np.radians(hangle))
-        h_interval = h_len / (height - 1)
-        x_map = np.zeros([height, width], np.float32) + RADIUS
-        y_map = np.tile((np.arange(0, width) - c_x) * w_interval, [height, 1])
-        z_map = -np.tile((np.arange(0, height) - c_y) * h_interval, [width, 1]).T
-        D = np.sqrt(x_map**2 + y_map**2 + z_map**2)
-        # xyz = np.zeros([height, width, 3], np.float)
-        xyz = np.zeros([height, width, 3], np.float32)
-        xyz[:, :, 0] = (RADIUS / D * x_map)[:, :]
-        xyz[:, :, 1] = (RADIUS / D * y_map)[:, :]
-        xyz[:, :, 2] = (RADIUS / D * z_map)[:, :]
-        
-        y_axis = np.array([0.0, 1.0, 0.0], np.float32)
-        z_axis = np.array([0.0, 0.0, 1.0], np.float32)
-        [R1, _] = cv2.Rodrigues(z_axis * np.radians(THETA))
-        [R2, _] = cv2.Rodrigues(np.dot(R1, y_axis) * np.radians(-PHI))
-
-        xyz = xyz.reshape([height * width, 3]).T
-        xyz = np.dot(R1, xyz)
-        xyz = np.dot(R2, xyz).T
-        lat = np.arcsin(xyz[:, 2] / RADIUS)
-        # lon = np.zeros([height * width], np.float)
-        lon = np.zeros([height * width], np.float32)
-        theta = np.arctan(xyz[:, 1] / xyz[:, 0])
-        idx1 = xyz[:, 0] > 0
-        idx2 = xyz[:, 1] > 0
-
-        idx3 = ((1 - idx1) * idx2).astype(np.bool_)
-        idx4 = ((1 - idx1) * (1 - idx2)).astype(np.bool_)
-        
-        lon[idx1] = theta[idx1]
-        lon[idx3] = theta[idx3] + np.pi
-        lon[idx4] = theta[idx4] - np.pi
-
-        lon = lon.reshape([height, width]) / np.pi * 180
-        lat = -lat.reshape([height, width]) / np.pi * 180
-        lon = lon / 180 * equ_cx + equ_cx
-        lat = lat / 90 * equ_cy + equ_cy
-    
-        persp = cv2.remap(self._img, lon.astype(np.float32), lat.astype(np.float32), cv2.INTER_CUBIC, borderMode=cv2.BORDER_WRAP)
-        # Convert for Ollama
-        _, buffer = cv2.imencode('.png', persp)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        return img_base64
-        
\ No newline at end of file
+        persp = self._render(FOV, THETA, PHI, height, width, RADIUS)
+        return encode_image(persp, image_format, quality)
+
+    def GetPerspectives(self, views:list, threads:int = 1, image_format:str = 'png', quality:int = 90) -> list:
+        """
+        Render several perspective views of the panorama at once.
+
+        The panorama is decoded only once, and views of the same size share
+        the same base ray grid, so only the rotation differs between headings.
+
+        Args:
+            views (list): A list of (FOV, THETA, PHI, height, width) or (FOV, THETA, PHI, height, width, RADIUS) tuples.
+            threads (int, optional): Number of views rendered in parallel (OpenCV releases the GIL). Defaults to 1.
+            image_format (str, optional): "png", "jpeg", "webp" or "ndarray". Defaults to "png".
+            quality (int, optional): JPEG/WebP quality. Defaults to 90.
+
+        Returns:
+            list: Base64-encoded strings (or arrays) in the order of `views`.
+        """
+        def render(view):
+            return encode_image(self._render(*view), image_format, quality)
+
+        return list(imap_ordered(render, [tuple(v) for v in views], max_workers=threads))
+
+    def _render(self, FOV:float, THETA:float, PHI:float, height:int, width:int, RADIUS:int = 128) -> np.ndarray:
+        # angles are rounded to ANGLE_STEP degrees, so that views at (almost) the same heading
+        # (e.g. reoriented views of panos along a street) share the cached maps
+        THETA = round(round(THETA / ANGLE_STEP) * ANGLE_STEP % 360, 6)
+        PHI = round(round(PHI / ANGLE_STEP) * ANGLE_STEP, 6)
+        map1, map2 = _perspective_maps(self._height, self._width, FOV, THETA, PHI, height, width, RADIUS)
+        return cv2.remap(self._img, map1, map2, cv2.INTER_CUBIC, borderMode=cv2.BORDER_WRAP)
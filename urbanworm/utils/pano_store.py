@@ -0,0 +1,188 @@
+from __future__ import annotations
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import http_client
+from .pano2pers import decode_image
+
+
+class PanoStore:
+    '''
+    Two-level store of downloaded images (street view panos, Flickr photos).
+
+    Decoded arrays are kept in an in-memory LRU bounded by size. Encoded bytes
+    are optionally kept in a directory with a size quota, so that images are
+    shared across runs and processes. Entries are keyed by image id and
+    resolution (Mapillary thumbnail URLs are signed and change between requests).
+
+    Args:
+        path (str, optional): Directory of the on-disk layer. (Default is None, memory only)
+        max_memory_mb (float): Maximum size of the decoded arrays kept in memory. (Default is 512)
+        max_disk_mb (float): Maximum size of the on-disk layer. (Default is 2048)
+
+    Examples:
+        configure_pano_store(path='pano_cache', max_disk_mb=10_000)
+        data.get_svi_from_locations(key=..., workers=8)
+    '''
+
+    def __init__(self, path: str = None, max_memory_mb: float = 512, max_disk_mb: float = 2048):
+        self.path = str(path) if path is not None else None
+        self.max_memory = int(max_memory_mb * 1024 * 1024)
+        self.max_disk = int(max_disk_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._disk_size = 0
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+            self._disk_size = sum(os.path.getsize(p) for p in self._files())
+
+    @staticmethod
+    def make_key(url: str, image_id=None, resolution=None) -> str:
+        '''
+        Key of an image: its id and resolution, or the URL when there is no id.
+        '''
+        if image_id is None:
+            return hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return '_'.join(str(p) for p in (image_id, resolution) if p is not None)
+
+    def get_bytes(self, url: str, image_id=None, resolution=None) -> bytes:
+        '''
+        The encoded image, read from the on-disk layer or downloaded (and stored).
+        '''
+        key = self.make_key(url, image_id, resolution)
+        data = self._read(key)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = http_client.get(url, raise_for_status=True).content
+        self._write(key, data)
+        return data
+
+    def get_image(self, url: str, image_id=None, resolution=None, fov: float = None, width: int = None) -> np.ndarray:
+        '''
+        The decoded BGR image. With fov and width, it is decoded at reduced resolution (see `decode_image`).
+        The returned array is shared with other callers and must not be modified.
+        '''
+        key = (self.make_key(url, image_id, resolution), fov, width)
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return img
+        img = decode_image(self.get_bytes(url, image_id, resolution), fov, width)
+        if img is None:
+            raise ValueError(f"could not decode the image from {url}")
+        img.flags.writeable = False
+        with self._lock:
+            if key not in self._memory and img.nbytes <= self.max_memory:
+                self._memory[key] = img
+                self._memory_size += img.nbytes
+                while self._memory_size > self.max_memory:
+                    _, old = self._memory.popitem(last=False)
+                    self._memory_size -= old.nbytes
+        return img
+
+    def clear(self) -> None:
+        '''
+        Remove all entries from memory and disk.
+        '''
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            for p in self._files():
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            self._disk_size = 0
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.img')
+
+    def _files(self) -> list[str]:
+        if self.path is None:
+            return []
+        return [os.path.join(self.path, f) for f in os.listdir(self.path) if f.endswith('.img')]
+
+    def _read(self, key: str) -> bytes | None:
+        if self.path is None:
+            return None
+        p = self._file(key)
+        try:
+            with open(p, 'rb') as f:
+                data = f.read()
+            # the modification time is the last access, used for eviction
+            os.utime(p)
+            return data
+        except OSError:
+            return None
+
+    def _write(self, key: str, data: bytes) -> None:
+        if self.path is None or len(data) > self.max_disk:
+            return None
+        # write then rename, so other processes never read a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._file(key))
+        with self._lock:
+            self._disk_size += len(data)
+            if self._disk_size > self.max_disk:
+                self._evict()
+
+    def _evict(self) -> None:
+        # drop the least recently used files until the store is 10% under its quota
+        entries = []
+        for p in self._files():
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        size = sum(e[1] for e in entries)
+        target = int(self.max_disk * 0.9)
+        for _, s, p in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(p)
+                size -= s
+            except OSError:
+                pass
+        self._disk_size = size
+
+
+_store = PanoStore()
+
+
+def configure_pano_store(path: str = None, max_memory_mb: float = 512, max_disk_mb: float = 2048) -> PanoStore:
+    '''
+    Replace the pano store used by getSV, download_to_dir and the selfie filter.
+
+    Args:
+        path (str, optional): Directory of the on-disk layer, shared across runs. (Default is None, memory only)
+        max_memory_mb (float): Maximum size of the decoded images kept in memory. (Default is 512)
+        max_disk_mb (float): Maximum size of the on-disk layer. (Default is 2048)
+
+    Returns:
+        PanoStore: The new store.
+    '''
+    global _store
+    _store = PanoStore(path, max_memory_mb, max_disk_mb)
+    return _store
+
+
+def get_pano_store() -> PanoStore:
+    '''The pano store in use.'''
+    return _store
@@ -0,0 +1,179 @@
+from __future__ import annotations
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+# requests per second and burst size of each API, kept below the published quotas
+DEFAULT_LIMITS = {
+    'mapillary': (150.0, 50),  # search API: 10,000 requests per minute
+    'flickr': (1.0, 5),        # 3,600 queries per hour per key
+    'freesound': (1.0, 5),     # 60 requests per minute
+    'overpass': (0.5, 2),      # a couple of slots per client on public instances
+}
+
+# API endpoints (exact host and path prefix) and the limiter that applies to them;
+# media hosts of the same services (e.g. cdn.freesound.org, live.staticflickr.com) are not limited
+APIS = {
+    ('graph.mapillary.com', '/'): 'mapillary',
+    ('tiles.mapillary.com', '/'): 'mapillary',
+    ('api.flickr.com', '/services/'): 'flickr',
+    ('freesound.org', '/apiv2/'): 'freesound',
+    ('overpass-api.de', '/api/'): 'overpass',
+}
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket shared by all threads of one process.
+
+    Args:
+        rate (float): Tokens (requests) added per second.
+        burst (int): Capacity of the bucket. (Default is max(1, rate))
+    '''
+
+    def __init__(self, rate: float, burst: int = None):
+        if rate <= 0:
+            raise ValueError("rate must be > 0.")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, tokens: float) -> float:
+        # consume `tokens` if possible; otherwise return how long to wait for them
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> None:
+        '''
+        Block until `tokens` are available and consume them.
+        '''
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return None
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    '''
+    Token bucket stored in an SQLite file, so that several worker processes share one budget.
+
+    Args:
+        name (str): Name of the bucket in the file.
+        rate (float): Tokens (requests) added per second.
+        burst (int): Capacity of the bucket. (Default is max(1, rate))
+        path (str): The SQLite file.
+    '''
+
+    def __init__(self, name: str, rate: float, burst: int = None, path: str = 'urbanworm_rate_limit.sqlite'):
+        super().__init__(rate, burst)
+        self.name = name
+        self.path = str(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets "
+                         "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _take(self, tokens: float) -> float:
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock, so the read-refill-write below is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            level = self.burst if row is None else min(self.burst, row[0] + max(now - row[1], 0.0) * self.rate)
+            wait = 0.0
+            if level >= tokens:
+                level -= tokens
+            else:
+                wait = (tokens - level) / self.rate
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                         (self.name, level, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_rate_limit(name: str, rate: float = None, burst: int = None, shared_path: str = None) -> TokenBucket:
+    '''
+    Set the rate limit of an API.
+
+    Args:
+        name (str): The API, one of "mapillary", "flickr", "freesound", "overpass" (or a new name).
+        rate (float, optional): Requests per second. (Default is the value in DEFAULT_LIMITS)
+        burst (int, optional): Number of requests that can be sent at once. (Default is the value in DEFAULT_LIMITS)
+        shared_path (str, optional): An SQLite file used to share the budget with other processes.
+
+    Returns:
+        TokenBucket: The limiter.
+
+    Examples:
+        # 4 worker processes sharing one Mapillary budget
+        configure_rate_limit('mapillary', rate=100, burst=20, shared_path='/tmp/urbanworm_limits.sqlite')
+    '''
+    default_rate, default_burst = DEFAULT_LIMITS.get(name, (1.0, 1))
+    rate = default_rate if rate is None else rate
+    burst = default_burst if burst is None else burst
+    if shared_path is not None:
+        limiter = SharedTokenBucket(name, rate, burst, shared_path)
+    else:
+        limiter = TokenBucket(rate, burst)
+    with _limiters_lock:
+        _limiters[name] = limiter
+    return limiter
+
+
+def get_limiter(name: str) -> TokenBucket | None:
+    '''
+    The limiter of an API (created from DEFAULT_LIMITS on first use), or None for an unknown name.
+    '''
+    limiter = _limiters.get(name)
+    if limiter is None and name in DEFAULT_LIMITS:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                rate, burst = DEFAULT_LIMITS[name]
+                limiter = _limiters[name] = TokenBucket(rate, burst)
+    return limiter
+
+
+def limiter_name(url: str) -> str | None:
+    '''
+    The name of the limiter that applies to `url`, or None.
+    '''
+    parsed = urlparse(url)
+    host, path = parsed.hostname or '', parsed.path or '/'
+    for (h, prefix), name in APIS.items():
+        if host == h and path.startswith(prefix):
+            return name
+    return None
+
+
+def acquire(name: str, tokens: float = 1) -> None:
+    '''
+    Wait for the rate limit of an API (no-op for an unknown name).
+    '''
+    limiter = get_limiter(name) if name is not None else None
+    if limiter is not None:
+        limiter.acquire(tokens)
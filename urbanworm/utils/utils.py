@@ -4,15 +4,19 @@ import urllib
 from urllib.parse import urlparse
 import pandas as pd
 import numpy as np
-from pyproj import Transformer
 import math
 import requests
 import os
 import base64
+from . import geo, http_client
+from .blob_store import BlobRef
+from .views import PerspectiveView
 import cv2
 from datetime import datetime
 import tempfile
 import json
+import threading
+from collections import OrderedDict
 
 def is_url(url:str) -> bool:
     try:
@@ -69,36 +73,20 @@ def meters_to_degrees(meters, latitude):
 
 # # Generate bbox based on a centroid and a radius
 def projection(centroid, r):
-    x, y, utm_epsg = degree2dis(centroid)
-    # set search distance to 50 meters
-    # set bbox
-    x_min = x - r
-    y_min = y - r
-    x_max = x + r
-    y_max = y + r
-    # Convert to EPSG:4326 (Lat/Lon)
-    x_min, y_min = dis2degree(x_min, y_min, utm_epsg)
-    x_max, y_max = dis2degree(x_max, y_max, utm_epsg)
+    # for many locations at once, use geo.bboxes
+    x_min, y_min, x_max, y_max = geo.bbox(centroid, r)
     return f'{x_min},{y_min},{x_max},{y_max}'
 
 def retry_request(url, retries=3):
-    response = None
-    for _ in range(retries):
-        # Check for rate limit or server error
-        try:
-            response = requests.get(url)
-            # If the response status code is in the list, wait and retry
-            if response.status_code != 200:
-                continue
-            else:
-                return response
-        except:
-            pass
-    return response
+    # rate limits and server errors are retried with backoff by the shared http client
+    try:
+        return http_client.get(url, retries=max(retries - 1, 0))
+    except requests.exceptions.RequestException:
+        return None
 
 # --- UTM -> degrees (WGS84) ---
 def dis2degree(ptx, pty, utm_epsg):
-    transformer = Transformer.from_crs(f"EPSG:{utm_epsg}", "EPSG:4326", always_xy=True)
+    transformer = geo.get_transformer(f"EPSG:{utm_epsg}", "EPSG:4326")
     lon, lat = transformer.transform(ptx, pty)
     return lon, lat
 
@@ -106,7 +94,7 @@ def dis2degree(ptx, pty, utm_epsg):
 def degree2dis(pt):
     ptx, pty = pt
     utm_epsg = lonlat_to_utm_epsg(ptx, pty)
-    transformer = Transformer.from_crs("EPSG:4326", f"EPSG:{utm_epsg}", always_xy=True)
+    transformer = geo.get_transformer("EPSG:4326", f"EPSG:{utm_epsg}")
     x, y = transformer.transform(ptx, pty)
     return x, y, utm_epsg
 
@@ -135,6 +123,8 @@ def closest(location=None,
         return None
     # extract info
     res_df = _extract_info(res_df)
+    # all candidates, before the time filter: used to find the neighbours along a sequence
+    candidates = res_df
     # filter by time: year/season/time of day
     year_start, year_end, season_, day_start, day_end = get_capture_time_range(year, season, time_of_day)
 
@@ -175,7 +165,7 @@ def closest(location=None,
         if multi_num is not None:
             yearList = sorted(list(set(res_df.sort_values(by='year')['year'].to_list())), reverse=True)
             count = 1
-            while len(res_df_) < 3:
+            while len(res_df_) < 3 and count < len(yearList):
                 res_df_ = res_df[res_df['year'] >= yearList[count]]
                 count += 1
         res_df = res_df_
@@ -184,79 +174,111 @@ def closest(location=None,
     id_array = np.array(res_df['id'])
     lon_array = np.array(res_df['lon'])
     lat_array = np.array(res_df['lat'])
-    dis_array = (lon_array - location[0]) * (lon_array - location[0]) + (lat_array - location[1]) * (lat_array - location[1])
+    # distances in meters to all candidates at once
+    dis_array = geo.haversine(location[1], location[0], lat_array.astype(float), lon_array.astype(float))
     # find the closest one
-    ind = np.where(dis_array == np.min(dis_array))[0]
-    id_ = id_array[ind][0]
+    id_ = id_array[np.argmin(dis_array)]
     closest_df = res_df.loc[res_df['id'] == id_]
-    # get the id and sequence id of the closest image
-    sq = get_sequence(closest_df['sequence'].iloc[0], key)
 
-    if multi_num is not None and len(sq) >= multi_num > 1:
-        id1, id2 = None, None
+    if multi_num is not None and multi_num > 1:
         multi_num = min(int(multi_num), 3)
+        # neighbours along the sequence, first among the images of the bbox search (ordered by capture time)
+        sequence = closest_df['sequence'].iloc[0]
+        same_sequence = candidates[candidates['sequence'] == sequence].drop_duplicates(subset='id')
+        same_sequence = same_sequence.sort_values(by='captured_at')
+        sq = same_sequence['id'].tolist()
+        id1, id2 = _sequence_neighbours(sq, id_, multi_num, interval)
+        if (id1 is None or (multi_num > 2 and id2 is None)
+                or not _contiguous(sq, same_sequence['captured_at'].tolist(), [id_, id1, id2])):
+            # not enough of the sequence in the bbox: fall back to the whole sequence
+            sq = get_sequence(sequence, key)
+            id1, id2 = (None, None) if len(sq) < multi_num else _sequence_neighbours(sq, id_, multi_num, interval)
+
+        if id1 is not None:
+            ids = [i for i in (id_, id1, id2) if i is not None]
+            found = candidates[candidates['id'].isin(ids)]
+            missing = [i for i in ids if i not in set(found['id'])]
+            if len(missing) > 0:
+                # one request for all the neighbours that were not in the bbox search
+                fetched = get_svis_from_ids(missing, key)
+                if len(fetched) > 0:
+                    fetched = _extract_info(fetched, with_geometry=False)
+                    fetched = fetched.rename(columns={'computed_geometry.coordinates': 'coordinates'})
+                    found = pd.concat([found, fetched])
+            # ids that could not be fetched are left out (fewer views)
+            found = found.drop_duplicates(subset='id').set_index('id', drop=False)
+            return found.reindex(ids).dropna(subset=['id']).reset_index(drop=True)
+
+    if multi_num is not None and len(dis_array) > multi_num:
+        if multi_num > 3: multi_num = 3
+        smallest_indices = np.argsort(dis_array)[:multi_num]
+        return res_df.loc[res_df['id'].isin(id_array[smallest_indices])]
+    return closest_df
+
+
+def _contiguous(sq, times, ids):
+    """
+    Whether `ids` lie on a stretch of `sq` (ids of one sequence ordered by capture times `times`) without gaps.
 
-        index_of_closest = sq.index(id_)
-        n = len(sq)
+    A capture gap much longer than the usual one means that images of the sequence between them
+    are not in `sq` (e.g. the sequence leaves the bbox and comes back, or the search was truncated).
+    """
+    gaps = np.diff(np.asarray(times, dtype=float))
+    if len(gaps) == 0:
+        return True
+    pos = [sq.index(i) for i in ids if i is not None]
+    return bool((gaps[min(pos):max(pos)] <= 2 * np.median(gaps)).all())
 
-        # within valid range: we can take both sides (or at least left side)
-        if (index_of_closest - interval) >= 0 and (index_of_closest + interval) < n:
-            id1 = sq[index_of_closest - interval]
-            if multi_num > 2:
-                id2 = sq[index_of_closest + interval]
-
-        # too close to the end: take from the left
-        elif (index_of_closest + interval) >= n:
-            # shrink interval until indices are valid (but never below 1)
-            if multi_num > 2:
-                while interval > 1 and (index_of_closest - 2 * interval) < 0:
-                    interval -= 1
-            else:
-                while interval > 1 and (index_of_closest - interval) < 0:
-                    interval -= 1
-
-            # now assign (guard again just in case)
-            if (index_of_closest - interval) >= 0:
-                id1 = sq[index_of_closest - interval]
-            if multi_num > 2 and (index_of_closest - 2 * interval) >= 0:
-                id2 = sq[index_of_closest - 2 * interval]
-
-        # at (or near) the beginning: take from the right
-        elif index_of_closest <= 0:
-            if multi_num > 2:
-                while interval > 1 and (index_of_closest + 2 * interval) >= n:
-                    interval -= 1
-            else:
-                while interval > 1 and (index_of_closest + interval) >= n:
-                    interval -= 1
-
-            if (index_of_closest + interval) < n:
-                id1 = sq[index_of_closest + interval]
-            if multi_num > 2 and (index_of_closest + 2 * interval) < n:
-                id2 = sq[index_of_closest + 2 * interval]
-
-        closest_0 = get_svi_from_id(id_, key)
-        closest_0 = _extract_info(closest_0, with_geometry=False)
-        closest_1 = get_svi_from_id(id1, key)
-        closest_1 = _extract_info(closest_1, with_geometry=False)
-
-        if id2 is not None:
-            closest_2 = get_svi_from_id(id2, key)
-            closest_2 = _extract_info(closest_2, with_geometry=False)
-            temp = pd.concat([closest_1, closest_2])
-            out = pd.concat([closest_0, temp])
-            out = out.rename(columns={'geometry.coordinates': 'coordinates'})
-            return out
+
+def _sequence_neighbours(sq, id_, multi_num, interval):
+    """
+    Ids of one or two other images of the sequence `sq` (ordered ids), `interval` images away from `id_`.
+
+    Returns:
+        tuple: (id1, id2); id2 is None when multi_num < 3, both are None when `sq` is too short.
+    """
+    if id_ not in sq or len(sq) < 2:
+        return None, None
+    id1, id2 = None, None
+    index_of_closest = sq.index(id_)
+    n = len(sq)
+
+    # within valid range: we can take both sides (or at least left side)
+    if (index_of_closest - interval) >= 0 and (index_of_closest + interval) < n:
+        id1 = sq[index_of_closest - interval]
+        if multi_num > 2:
+            id2 = sq[index_of_closest + interval]
+
+    # too close to the end: take from the left
+    elif (index_of_closest + interval) >= n:
+        # shrink interval until indices are valid (but never below 1)
+        if multi_num > 2:
+            while interval > 1 and (index_of_closest - 2 * interval) < 0:
+                interval -= 1
         else:
-            out = pd.concat([closest_0, closest_1])
-            return out
+            while interval > 1 and (index_of_closest - interval) < 0:
+                interval -= 1
 
+        # now assign (guard again just in case)
+        if (index_of_closest - interval) >= 0:
+            id1 = sq[index_of_closest - interval]
+        if multi_num > 2 and (index_of_closest - 2 * interval) >= 0:
+            id2 = sq[index_of_closest - 2 * interval]
+
+    # too close to the beginning: take from the right
     else:
-        if multi_num is not None and len(dis_array) > multi_num:
-            if multi_num > 3: multi_num = 3
-            smallest_indices = np.argsort(dis_array)[:multi_num]
-            return res_df.loc[res_df['id'].isin(id_array[smallest_indices])]
-        return closest_df
+        if multi_num > 2:
+            while interval > 1 and (index_of_closest + 2 * interval) >= n:
+                interval -= 1
+        else:
+            while interval > 1 and (index_of_closest + interval) >= n:
+                interval -= 1
+
+        if (index_of_closest + interval) < n:
+            id1 = sq[index_of_closest + interval]
+        if multi_num > 2 and (index_of_closest + 2 * interval) < n:
+            id2 = sq[index_of_closest + 2 * interval]
+    return id1, id2
 
 
 # filter images by time and seasons
@@ -304,11 +326,98 @@ def get_sequence(sequence_id, key=None):
     response = response.json()
     return pd.DataFrame.from_dict(response['data'])['id'].tolist()
 
+# image fields requested from Mapillary: all thumbnail sizes, so that the smallest sufficient one can be used
+SVI_FIELDS = "id,computed_compass_angle,thumb_1024_url,thumb_2048_url,thumb_original_url,captured_at,computed_geometry,sequence"
+# thumbnail widths and their fields, from the smallest
+THUMB_SIZES = ((1024, 'thumb_1024_url'), (2048, 'thumb_2048_url'))
+
+def select_thumb(row, fov=None, width=None, reoriented=True, resolution='auto'):
+    """
+    Pick the smallest Mapillary thumbnail that still has the resolution the output needs.
+
+    A reoriented view of `width` pixels over `fov` degrees needs a pano of 360 * width / fov pixels;
+    an image used as is needs `width` pixels.
+
+    Args:
+        row: A Mapillary image record (dict or pandas Series) with the thumb_*_url fields.
+        fov (int, optional): Field of view of the view in degrees.
+        width (int, optional): Width of the output in pixels.
+        reoriented (bool): Whether the image is cropped to a perspective view. (Default is True)
+        resolution (str | int): 'auto', 1024, 2048 or 'original' to force a size. (Default is 'auto')
+
+    Returns:
+        str: The image URL.
+    """
+    urls = {size: row.get(field) for size, field in THUMB_SIZES}
+    urls['original'] = row.get('thumb_original_url')
+    urls = {k: v for k, v in urls.items() if isinstance(v, str) and v}
+    if resolution != 'auto':
+        key = resolution if resolution == 'original' else int(resolution)
+        if key in urls:
+            return urls[key]
+    elif width is not None:
+        required = 360.0 * width / fov if reoriented and fov else width
+        for size, _ in THUMB_SIZES:
+            if size >= required and size in urls:
+                return urls[size]
+    # the largest available
+    for key in ('original', 2048, 1024):
+        if key in urls:
+            return urls[key]
+    return None
+
+def thumb_label(row, url):
+    """The size (1024, 2048 or 'original') of the thumbnail `url` of a Mapillary image record."""
+    for size, field in THUMB_SIZES:
+        if row.get(field) == url:
+            return size
+    return 'original'
+
 def get_svi_from_id(id, key):
-    url = f"https://graph.mapillary.com/{id}?access_token={key}&fields=id,computed_compass_angle,thumb_original_url,captured_at,computed_geometry,sequence"
-    response = retry_request(url)
-    response = response.json()
-    return pd.json_normalize(response)
+    return get_svis_from_ids([id], key)
+
+# number of ids sent in one images?image_ids= request
+MAX_IDS_PER_REQUEST = 50
+# metadata of recently fetched images, shared by all locations (id -> record)
+_SVI_RECORDS = OrderedDict()
+_SVI_RECORDS_MAX = 4096
+_SVI_RECORDS_LOCK = threading.Lock()
+
+def get_svis_from_ids(ids, key):
+    """
+    Metadata of several Mapillary images, fetched with the multi-id form of the images endpoint.
+
+    Ids are sent in chunks of MAX_IDS_PER_REQUEST, and recently fetched records are kept
+    in a small LRU, so ids shared by nearby locations are fetched only once.
+
+    Args:
+        ids (list): Image ids.
+        key (str): Mapillary API access token.
+
+    Returns:
+        DataFrame: One normalized row per id found, in the order of `ids`.
+    """
+    ids = [str(i) for i in ids]
+    with _SVI_RECORDS_LOCK:
+        records = {i: _SVI_RECORDS[i] for i in ids if i in _SVI_RECORDS}
+        for i in records:
+            _SVI_RECORDS.move_to_end(i)
+    missing = list(dict.fromkeys(i for i in ids if i not in records))
+    for start in range(0, len(missing), MAX_IDS_PER_REQUEST):
+        chunk = missing[start:start + MAX_IDS_PER_REQUEST]
+        url = f"https://graph.mapillary.com/images?access_token={key}&image_ids={','.join(chunk)}&fields={SVI_FIELDS}"
+        response = retry_request(url)
+        if response is None:
+            continue
+        for record in response.json().get('data', []):
+            records[str(record['id'])] = record
+        with _SVI_RECORDS_LOCK:
+            for i in chunk:
+                if i in records:
+                    _SVI_RECORDS[i] = records[i]
+            while len(_SVI_RECORDS) > _SVI_RECORDS_MAX:
+                _SVI_RECORDS.popitem(last=False)
+    return pd.json_normalize([records[i] for i in ids if i in records])
 
 def _extract_info(raw, with_geometry=True):
     if with_geometry:
@@ -343,7 +452,7 @@ def download_image_requests(image_url, save_path):
     """
     try:
         # Send a GET request to the URL
-        response = requests.get(image_url)
+        response = http_client.get(image_url)
         # Check if the request was successful (status code 200)
         if response.status_code == 200:
             # Open the file in write-binary mode ('wb') and write the content
@@ -404,6 +513,11 @@ def base64_to_image(img_base64: str):
 
 # ---------------- llamacpp utils-------------------
 def extract_last_json(text: str):
+    # the whole text is a JSON document (e.g. a llama-server response)
+    try:
+        return json.loads(text)
+    except (TypeError, json.JSONDecodeError):
+        pass
     split = ["\n{\n", "\n{", "{"]
     retry = 0
     while text.rfind(split[retry]) == -1:
@@ -474,21 +588,21 @@ def pick_best_mmproj(files: Sequence[str], prefer: Sequence[str]) -> str:
 #         print("No mmproj found")
 #         sys.exit(0)
 
-def base64img2temp(s: str) -> str:
-    try:
-        raw = base64.b64decode(s, validate=True)
-    except Exception as e:
-        raise ValueError("Invalid base64 image string") from e
-    buf = np.frombuffer(raw, dtype=np.uint8)
-    img = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
-    if img is None:
-        raise ValueError("OpenCV could not decode the provided base64 into an image")
-    fd, tmp_path = tempfile.mkstemp(prefix="urban_worm_", suffix=".png")
+def image_suffix(raw: bytes) -> str | None:
+    """The file extension of encoded image bytes (PNG, JPEG or WebP), or None."""
+    if raw.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if raw.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if raw[:4] == b'RIFF' and raw[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+def _write_temp(suffix: str, write) -> str:
+    fd, tmp_path = tempfile.mkstemp(prefix="urban_worm_", suffix=suffix)
     os.close(fd)
     try:
-        ok = cv2.imwrite(tmp_path, img)  # PNG supports alpha if present
-        if not ok:
-            raise IOError("cv2.imwrite failed")
+        write(tmp_path)
     except Exception:
         try:
             os.remove(tmp_path)
@@ -497,6 +611,53 @@ def base64img2temp(s: str) -> str:
         raise
     return tmp_path
 
+def _write_bytes(raw: bytes):
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(raw)
+    return write
+
+def _write_image(img: np.ndarray):
+    def write(path):
+        # fast PNG compression: the file is only read back by the model
+        if not cv2.imwrite(path, img, [cv2.IMWRITE_PNG_COMPRESSION, 1]):
+            raise IOError("cv2.imwrite failed")
+    return write
+
+def base64img2temp(s: str) -> str:
+    try:
+        raw = base64.b64decode(s, validate=True)
+    except Exception as e:
+        raise ValueError("Invalid base64 image string") from e
+    suffix = image_suffix(raw)
+    if suffix is not None:
+        # already encoded: write the bytes as they are
+        return _write_temp(suffix, _write_bytes(raw))
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    img = cv2.imdecode(buf, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("OpenCV could not decode the provided base64 into an image")
+    return _write_temp(".png", _write_image(img))  # PNG supports alpha if present
+
+def ndarray2temp(img: np.ndarray) -> str:
+    """Write a BGR image array (e.g. a perspective view with image_format='ndarray') to a temporary PNG."""
+    return _write_temp(".png", _write_image(img))
+
+def image2temp(item) -> str | None:
+    """Write an image array, lazy view, blob store handle, base64 string or URL to a temporary file; None for anything else (e.g. a path)."""
+    if isinstance(item, np.ndarray):
+        return ndarray2temp(item)
+    if isinstance(item, PerspectiveView):
+        return ndarray2temp(item.render())
+    if isinstance(item, BlobRef):
+        raw = item.read()
+        return _write_temp(image_suffix(raw) or ".png", _write_bytes(raw))
+    if is_base64(item):
+        return base64img2temp(item)
+    if is_url(item):
+        return url2temp(item)
+    return None
+
 from .pano2pers import read_url2img
 def url2temp(url: str) -> str:
     img = read_url2img(url)
@@ -521,7 +682,6 @@ from io import BytesIO
 from pathlib import Path
 from typing import Any, Optional, Union
 from urllib.parse import urlparse
-from urllib.request import Request, urlopen
 from PIL import Image
 
 
@@ -598,9 +758,8 @@ def load_image_auto(
         # 4b) URL
         parsed = urlparse(s)
         if parsed.scheme in ("http", "https") and parsed.netloc:
-            req = Request(s, headers={"User-Agent": user_agent})
-            with urlopen(req, timeout=timeout) as resp:
-                data = resp.read()
+            data = http_client.get(s, headers={"User-Agent": user_agent}, timeout=timeout,
+                                   raise_for_status=True).content
             img = Image.open(BytesIO(data))
             img = img.convert(convert) if convert else img
             img.format = "png"
@@ -659,9 +818,11 @@ def best_url(p):
     return None
 
 # detect face
-def is_selfie_photo(model_path, img_url: str):
+def is_selfie_photo(model_path, img_url: str, image_id=None):
+    from .pano_store import get_pano_store
     model = YuNet(modelPath=model_path)
-    img = read_url2img(img_url)
+    # the photo stays in the store for download_to_dir
+    img = get_pano_store().get_image(img_url, image_id)
     H, W = img.shape[:2]
     model.setInputSize([W, H])
     results = model.infer(img)
@@ -793,8 +954,7 @@ def download_freesound_preview(preview_url: str, out_path: str | Path):
     out_path = Path(out_path)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with requests.get(preview_url, stream=True, timeout=999) as r:
-        r.raise_for_status()
+    with http_client.get(preview_url, stream=True, raise_for_status=True) as r:
         with out_path.open("wb") as f:
             for chunk in r.iter_content(chunk_size=1024 * 1024):
                 if chunk:
@@ -819,8 +979,8 @@ def sliced_duration(duration, clip_duration, number=None):
 from pydub import AudioSegment
 def clip(url=None, start_ms=None, end_ms=None, output_file_path=None):
     try:
-        # Download the audio data using requests
-        res = requests.get(url)
+        # Download the audio data using the shared http client
+        res = http_client.get(url, raise_for_status=True)
         # Use BytesIO to treat the downloaded content as a file in memory
         audio_data = BytesIO(res.content)
         # Load the audio file
@@ -837,7 +997,7 @@ def sound_url_to_temp(url, slice: list|tuple = None):
     fd, tmp_path = tempfile.mkstemp(prefix="urban_worm_", suffix=".mp3")
     os.close(fd)
     try:
-        res = requests.get(url)
+        res = http_client.get(url, raise_for_status=True)
         audio_data = BytesIO(res.content)
         audio = AudioSegment.from_file(audio_data, format="mp3")
         if slice is not None:
@@ -0,0 +1,135 @@
+from __future__ import annotations
+import base64
+from typing import Any, Callable, Iterator, Sequence
+
+import numpy as np
+
+from .concurrency import imap_ordered
+from .pano2pers import Equirectangular, encode_bytes
+from .pano_store import get_pano_store
+
+
+class PerspectiveView:
+    '''
+    A perspective view of a street view pano that is rendered only when its pixels are needed.
+
+    Collecting with `lazy=True` keeps one of these per view instead of the image,
+    so collection is a metadata-only pass. The pano is read through the pano store,
+    so views of the same pano share one download and decode.
+
+    Args:
+        url (str): URL of the pano.
+        image_id (str, optional): Mapillary image id (the pano store key, with `resolution`).
+        resolution (str | int, optional): Thumbnail size of `url`.
+        fov (float): Field of view in degrees.
+        heading (float): Horizontal viewing angle relative to the pano, in degrees.
+        pitch (float): Vertical viewing angle in degrees.
+        height (int): Height of the view.
+        width (int): Width of the view.
+        image_format (str): Encoding of `read`: "png", "jpeg", "webp" ("ndarray" is encoded as PNG). (Default is "png")
+        quality (int): JPEG/WebP quality. (Default is 90)
+    '''
+    __slots__ = ('url', 'image_id', 'resolution', 'fov', 'heading', 'pitch', 'height', 'width',
+                 'image_format', 'quality', '_pixels')
+
+    def __init__(self, url: str, image_id=None, resolution=None, fov: float = 80, heading: float = 0,
+                 pitch: float = 5, height: int = 500, width: int = 700, image_format: str = 'png', quality: int = 90):
+        self.url = url
+        self.image_id = image_id
+        self.resolution = resolution
+        self.fov = fov
+        self.heading = heading
+        self.pitch = pitch
+        self.height = height
+        self.width = width
+        self.image_format = 'png' if image_format == 'ndarray' else image_format
+        self.quality = quality
+        self._pixels = None
+
+    @property
+    def suffix(self) -> str:
+        '''File extension of the encoded view.'''
+        return '.jpg' if self.image_format in ('jpeg', 'jpg') else f'.{self.image_format}'
+
+    def render(self) -> np.ndarray:
+        '''The BGR view (taken from `prefetch` if it was rendered ahead).'''
+        img, self._pixels = self._pixels, None
+        if img is None:
+            pano = get_pano_store().get_image(self.url, self.image_id, self.resolution, self.fov, self.width)
+            img = Equirectangular(img=pano).GetPerspective(self.fov, self.heading, self.pitch,
+                                                           self.height, self.width, image_format='ndarray')
+        return img
+
+    def prefetch(self) -> None:
+        '''Render the view now and keep it until the next `render`.'''
+        if self._pixels is None:
+            self._pixels = self.render()
+
+    def read(self) -> bytes:
+        '''The encoded view.'''
+        return encode_bytes(self.render(), self.image_format, self.quality)
+
+    def to_base64(self) -> str:
+        '''The encoded view as a base64 string.'''
+        return base64.b64encode(self.read()).decode('utf-8')
+
+    def __str__(self):
+        # stable across runs: used as the key of the input in checkpoints and response caches
+        return (f'view:{self.image_id}_{self.resolution}_{self.fov}_{self.heading:.4f}_{self.pitch}_'
+                f'{self.height}x{self.width}_{self.quality}.{self.image_format}')
+
+    def __repr__(self):
+        return f'PerspectiveView({self.url!r}, image_id={self.image_id!r}, heading={self.heading:.1f})'
+
+
+def _views(item) -> list[PerspectiveView]:
+    return [v for v in (item if isinstance(item, (list, tuple)) else [item]) if isinstance(v, PerspectiveView)]
+
+
+def release_views(item) -> None:
+    '''
+    Drop the pixels prefetched for the views of an input (a view or a list of views),
+    e.g. once it is processed, or when its response came from a cache without rendering.
+    '''
+    for v in _views(item):
+        v._pixels = None
+
+
+def prefetch_views(items: Sequence,
+                   get: Callable[[Any], Any] = None,
+                   workers: int = 2,
+                   max_pending: int = 8,
+                   skip: Callable[[Any], bool] = None) -> Iterator:
+    '''
+    Yield `items` while the views of the next ones are rendered on a thread pool.
+
+    At most `max_pending` items are rendered ahead of the one being consumed,
+    so the rendered views in memory do not grow with the number of items.
+    Items without PerspectiveView are yielded as they are, without a thread pool.
+    The consumer should call `release_views` once it is done with an item.
+
+    Args:
+        items (Sequence): The items (e.g. indices of the inputs of a batch).
+        get (Callable, optional): The input of an item: a view, or a list of views. (Default is the item itself)
+        workers (int): Number of rendering threads. (Default is 2)
+        max_pending (int): Maximum number of items rendered ahead. (Default is 8)
+        skip (Callable, optional): Items for which it returns True are not rendered ahead
+            (e.g. inputs whose response is already cached).
+
+    Yields:
+        The items, in order.
+    '''
+    get = get if get is not None else (lambda item: item)
+    if len(items) == 0:
+        return iter(items)
+    if len(_views(get(items[0]))) == 0:
+        return iter(items)
+
+    def warm(item):
+        if skip is None or not skip(item):
+            for v in _views(get(item)):
+                v.prefetch()
+        return item
+
+    # at least two threads, so that rendering runs next to the consumer
+    return imap_ordered(warm, items, max_workers=max(workers, 2), max_pending=max_pending)